@@ -0,0 +1,43 @@
+"""Compares building the generic theory serially and over bands of rows
+
+Usage: python -m benchmarks.build [WORKERS [SIZE ...]]
+
+For each square board size, the theory's clauses are built once serially and
+once with parallel_build.build_cnf. The parallel build needs spare cores to be
+faster; with WORKERS at 1 it builds the bands one after another, which shows
+its overhead. WORKERS defaults to the number of CPUs.
+"""
+import os
+import sys
+import time
+
+from src.parallel_build import build_cnf
+
+DEFAULT_SIZES = (6, 10, 14, 18)
+
+
+def time_build(size: int, workers: int, bands=None) -> tuple[float, int]:
+    """Returns the build time and the number of clauses"""
+    start = time.perf_counter()
+    cnf = build_cnf((size, size), 2, workers=workers, bands=bands)
+    return time.perf_counter() - start, len(cnf.clauses)
+
+
+def main(workers: int, sizes) -> None:
+    print(f"{workers} workers")
+    print(
+        f"{'size':>6}{'serial (s)':>12}{'clauses':>10}"
+        f"{'bands (s)':>11}{'clauses':>10}{'speedup':>9}"
+    )
+    for size in sizes:
+        serial, serial_clauses = time_build(size, 1)
+        parallel, parallel_clauses = time_build(size, workers, max(workers, 2))
+        print(
+            f"{size:>6}{serial:>12.2f}{serial_clauses:>10}"
+            f"{parallel:>11.2f}{parallel_clauses:>10}{serial / parallel:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    args = list(map(int, sys.argv[1:]))
+    main(args[0] if args else os.cpu_count() or 1, args[1:] or DEFAULT_SIZES)
@@ -0,0 +1,66 @@
+"""Compares the onehot and log color encodings on boards with many colors
+
+Usage: python -m benchmarks.colors [MIN_COLORS [MAX_COLORS]]
+
+Each board is a corridor where the train picks up an alien of every color in
+turn and drops it off at the house of its color just after, so the board needs
+as many colors as it has aliens. The defaults run 5 to 10 colors, the most the
+GUI supports.
+"""
+import sys
+import time
+
+from src.file_reader import read_data
+
+
+def corridor(colors: int) -> dict:
+    """Returns a 3 row board in the format returned by import_xml. The middle
+    row is free for rails, with aliens above it and houses below it."""
+    cols = 3 * colors + 2
+    aliens = [(c, (3 * c + 1, 2)) for c in range(colors)]
+    houses = [(c, (3 * c + 2, 0)) for c in range(colors)]
+    used = {coord for _, coord in aliens + houses}
+    return {
+        "rows": 3,
+        "cols": cols,
+        "colors": colors,
+        "entrances": [(0, 1)],
+        "exits": [(cols - 1, 1)],
+        "aliens": aliens,
+        "houses": houses,
+        "obstacles": [
+            (x, y) for x in range(cols) for y in (0, 2) if (x, y) not in used
+        ],
+        "rails": [],
+    }
+
+
+def measure(data: dict, color_encoding: str) -> tuple[int, int, float, float, bool]:
+    """Returns the variables, clauses, build time, solve time and satisfiability"""
+    start = time.perf_counter()
+    encoding = read_data(data, True, color_encoding)
+    cnf = encoding.cnf()
+    built = time.perf_counter()
+    with cnf.solver() as solver:
+        satisfiable = solver.solve()
+    solved = time.perf_counter()
+    return cnf.num_vars, len(cnf.clauses), built - start, solved - built, satisfiable
+
+
+def main(low: int = 5, high: int = 10) -> None:
+    print(
+        f"{'colors':>6}  {'encoding':<8}{'vars':>8}{'clauses':>10}"
+        f"{'build (s)':>11}{'solve (s)':>11}  solvable"
+    )
+    for colors in range(low, high + 1):
+        data = corridor(colors)
+        for color_encoding in ("onehot", "log"):
+            num_vars, clauses, build, solve, satisfiable = measure(data, color_encoding)
+            print(
+                f"{colors:>6}  {color_encoding:<8}{num_vars:>8}{clauses:>10}"
+                f"{build:>11.3f}{solve:>11.3f}  {satisfiable}"
+            )
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:3]))
@@ -0,0 +1,57 @@
+"""Compares the SAT and path search engines on boards from data/xml
+
+Usage: python -m benchmarks.engines [FILE ...]
+
+Each board is solved with new rails allowed, as run.py does. The SAT time
+includes building the theory, since that is what the search engine avoids.
+giant.xml is left out by default because building its theory takes minutes.
+"""
+import glob
+import os
+import sys
+import time
+
+from src.file_reader import read_data
+from src.search import PathSearch
+from src.xml_parser import import_xml
+
+DEFAULT_BOARDS = sorted(
+    f for f in glob.glob("data/xml/*.xml") if not f.endswith("giant.xml")
+)
+
+
+def time_call(f, *args):
+    start = time.perf_counter()
+    result = f(*args)
+    return result, time.perf_counter() - start
+
+
+def solve_sat(data):
+    return read_data(data, True).solve()
+
+
+def main(files):
+    print(f"{'board':<28}{'sat (s)':>10}{'search (s)':>12}{'nodes':>8}  solvable")
+    for file in files:
+        name = os.path.basename(file)
+        with open(file, encoding="utf8") as f:
+            try:
+                data = import_xml(f.read())
+            except Exception as e:
+                print(f"{name:<28}skipped: {e!r}")
+                continue
+        try:
+            model, sat_time = time_call(solve_sat, data)
+            engine = PathSearch(data, True)
+            path, search_time = time_call(engine.solve)
+        except (KeyError, ValueError) as e:
+            print(f"{name:<28}skipped: {e!r}")
+            continue
+        solvable = f"{bool(model)}/{path is not None}"
+        print(
+            f"{name:<28}{sat_time:>10.3f}{search_time:>12.4f}{engine.nodes:>8}  {solvable}"
+        )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or DEFAULT_BOARDS)
@@ -0,0 +1,66 @@
+"""Compares looking up neighbours with helpers.neighbour_table and with the
+get_directions generator, as theory construction used to
+
+Usage: python -m benchmarks.neighbours [SIZE ...]
+
+For each square board size, every tile's in-bounds neighbours are looked up as
+often as CosmicExpressTheory did while building a 12x12 board with 2 colors
+(about 800 times per tile, mostly in rail_comes_before), both ways. The time
+to build the theory itself is printed for scale.
+"""
+import sys
+import time
+
+from src import helpers
+from src.theory import CosmicExpressTheory
+
+DEFAULT_SIZES = (6, 10, 14)
+LOOKUPS_PER_TILE = 800
+
+
+def with_generator(size: tuple[int, int]) -> int:
+    rows, cols = size
+    found = 0
+    for coord in helpers.all_coords(size):
+        for _ in range(LOOKUPS_PER_TILE):
+            for direction, opposite, offset_coord in helpers.get_directions(coord):
+                if 0 <= offset_coord[0] < cols and 0 <= offset_coord[1] < rows:
+                    found += 1
+    return found
+
+
+def with_table(size: tuple[int, int]) -> int:
+    steps = helpers.neighbour_table(size).steps
+    found = 0
+    for coord in helpers.all_coords(size):
+        for _ in range(LOOKUPS_PER_TILE):
+            for direction, opposite, offset_coord in steps[coord]:
+                found += 1
+    return found
+
+
+def time_call(f, *args) -> float:
+    start = time.perf_counter()
+    f(*args)
+    return time.perf_counter() - start
+
+
+def main(sizes) -> None:
+    print(
+        f"{'size':>6}{'generator (s)':>15}{'table (s)':>11}{'speedup':>9}"
+        f"{'build (s)':>11}"
+    )
+    for n in sizes:
+        size = (n, n)
+        assert with_generator(size) == with_table(size)
+        generator = time_call(with_generator, size)
+        table = time_call(with_table, size)
+        build = time_call(CosmicExpressTheory, size, 2)
+        print(
+            f"{n:>6}{generator:>15.3f}{table:>11.3f}{generator / table:>9.2f}"
+            f"{build:>11.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main(list(map(int, sys.argv[1:])) or DEFAULT_SIZES)
@@ -0,0 +1,177 @@
+"""Compares checking candidate track layouts with src.simulate against
+following each one in Python and solving each one with PySAT
+
+Usage: python -m benchmarks.simulate [CANDIDATES [SIZE ...]]
+
+For each square board size, a puzzle with 2 colors is made with src.generate
+and its interior is opened up like in benchmarks.warm_start. Up to 50 of its
+solutions are found, and CANDIDATES layouts are drawn from them, half of them
+with the rail on one random interior tile replaced, removed or added. Then every
+candidate is checked at once by simulate, one at a time by walking its path with
+search.PathSearch's rules, and, for a sample, by fixing its rails on a
+session.Session and solving. The walk must agree with simulate on every layout.
+"""
+import random
+import sys
+import time
+
+from src.generate import _rails, generate
+from src.helpers import direction_between, opposite_direction, step
+from src.search import PathSearch, State
+from src.session import Session
+from src.simulate import simulate, stack_layouts
+
+DEFAULT_CANDIDATES = 10000
+DEFAULT_SIZES = (8, 10)
+SAT_SAMPLE = 200
+SOLUTIONS = 50
+
+
+def walk(search: PathSearch, layout) -> bool:
+    """Returns whether a layout solves the board of a search with new rails
+    allowed, by following it one rail at a time"""
+    state = State(
+        search.entrance,
+        None,
+        0,
+        (1 << len(search.aliens)) - 1,
+        (1 << len(search.houses)) - 1,
+    )
+    direction = next(
+        (
+            d
+            for d in "NESW"
+            if layout.get(step(search.entrance, d), "-")[0] == opposite_direction(d)
+        ),
+        None,
+    )
+    length = 0
+    while direction is not None:
+        coord = step(state.head, direction)
+        if coord == search.exit:
+            return (
+                state.head != search.entrance
+                and not state.aliens
+                and not state.houses
+                and length == len(layout)
+                and all(layout.get(c) == d for c, d in search.rails.items())
+            )
+        if (
+            coord not in layout
+            or layout[coord][0] != opposite_direction(direction)
+            or state.visited & search.bits[coord]
+            or coord in search.tiles and coord not in search.rails
+        ):
+            return False
+        state = search._enter(state, coord)
+        if state is None:
+            return False
+        length += 1
+        direction = layout[coord][1]
+    return False
+
+
+def open_board(size: int, seed: int):
+    """Returns a generated board with its interior opened up, and the layout of
+    the path search.PathSearch finds on it, or None if it finds none"""
+    data = generate((size, size), num_colors=2, pairs=2, seed=seed)
+    if data is None:
+        return None, None
+    interior = [(x, y) for x in range(1, size - 1) for y in range(1, size - 1)]
+    data["obstacles"] = [c for c in data["obstacles"] if c not in interior]
+    data["rails"] = []
+    path = PathSearch(data, allow_new_rails=True).find_path()
+    if path is None:
+        return data, None
+    coords = data["entrances"] + [coord for coord, _, _ in path] + data["exits"]
+    layout = {
+        coord: (
+            direction_between(coord, coords[i - 1]),
+            direction_between(coord, coords[i + 1]),
+        )
+        for i, coord in enumerate(coords[1:-1], start=1)
+    }
+    return data, layout
+
+
+def candidates(size: int, count: int, seed: int = 0):
+    """Returns an open board and count candidate layouts for it"""
+    rng = random.Random(seed)
+    data, layout = open_board(size, seed)
+    while layout is None:
+        seed += 1
+        data, layout = open_board(size, seed)
+    tiles = [coord for _, coord in data["aliens"] + data["houses"]]
+    free = [
+        (x, y)
+        for x in range(1, size - 1)
+        for y in range(1, size - 1)
+        if (x, y) not in tiles
+    ]
+
+    # The theory's solutions can include rail loops that the path search and
+    # simulate reject, which makes them good candidates too
+    with Session((size, size), 2) as session:
+        session.load(data)
+        solutions = [layout] + [
+            _rails(session, literals)
+            for literals in session.layouts(SOLUTIONS, allow_new_rails=True)
+        ]
+
+    layouts = []
+    for _ in range(count):
+        layout = dict(rng.choice(solutions))
+        if rng.random() < 0.5:
+            coord = rng.choice(free)
+            if coord in layout and rng.random() < 0.3:
+                del layout[coord]
+            else:
+                layout[coord] = tuple(rng.sample("NESW", 2))
+        layouts.append(layout)
+    return data, layouts
+
+
+def sat_check(session: Session, data, layout) -> bool:
+    rails = [(directions, coord) for coord, directions in layout.items()]
+    session.load(dict(data, rails=rails))
+    return bool(session.layouts(1))
+
+
+def main(count: int, sizes) -> None:
+    print(f"{count} candidates, {SAT_SAMPLE} solved with PySAT")
+    print(
+        f"{'size':>6}{'valid':>7}{'simulate/s':>12}{'walk/s':>10}"
+        f"{'sat/s':>8}{'speedup':>9}"
+    )
+    for size in sizes:
+        data, layouts = candidates(size, count)
+
+        rail_in, rail_out = stack_layouts(layouts, (size, size))
+        start = time.perf_counter()
+        result = simulate(data, rail_in, rail_out, True)
+        simulated = time.perf_counter() - start
+
+        search = PathSearch(data, allow_new_rails=True)
+        start = time.perf_counter()
+        walked = [walk(search, layout) for layout in layouts]
+        walking = time.perf_counter() - start
+        if walked != result.valid.tolist():
+            wrong = sum(a != b for a, b in zip(walked, result.valid.tolist()))
+            raise AssertionError(f"simulate disagrees with the walk on {wrong} layouts")
+
+        with Session((size, size), 2) as session:
+            start = time.perf_counter()
+            for layout in layouts[:SAT_SAMPLE]:
+                sat_check(session, data, layout)
+            solving = (time.perf_counter() - start) / SAT_SAMPLE * count
+
+        print(
+            f"{size:>6}{int(result.valid.sum()):>7}{count / simulated:>12.0f}"
+            f"{count / walking:>10.0f}{count / solving:>8.0f}"
+            f"{walking / simulated:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    args = list(map(int, sys.argv[1:]))
+    main(args[0] if args else DEFAULT_CANDIDATES, args[1:] or DEFAULT_SIZES)
@@ -0,0 +1,95 @@
+"""Compares re-solving a board after each edit of a sequence cold and with the
+solution from before the edit as a phase hint
+
+Usage: python -m benchmarks.warm_start [EDITS [SIZE ...]]
+
+For each square board size, a puzzle with 2 colors is made with src.generate
+and its interior is opened up by removing the obstacles that made it unique.
+Then EDITS times, an obstacle is added to or removed from a random interior
+tile, as long as the board stays solvable, and the board is solved with new
+rails allowed on a fresh solver, once cold and once seeded with the previous
+solution's phases. Fresh solvers keep clauses learnt on earlier edits out of
+the comparison.
+"""
+import random
+import sys
+
+from src.generate import generate
+from src.lib204 import SAT, solve_with_stats, total_stats
+from src.session import EMPTY_TILE, Session
+
+DEFAULT_EDITS = 20
+DEFAULT_SIZES = (8, 10, 12)
+# Seeds tried before a size is given up on
+SEEDS = 20
+
+
+def solve_fresh(session: Session, hint=None):
+    """Returns the model and SolveStats of solving the session's board on a
+    new solver"""
+    with session.cnf.solver() as solver:
+        if hint is not None:
+            solver.set_phases(session.cnf.phases(hint))
+        status, stats = solve_with_stats(
+            solver, session.cnf, session.assumptions(allow_new_rails=True)
+        )
+        model = session.cnf.decode(solver.get_model()) if status == SAT else None
+    return model, stats
+
+
+def edit_sequence(size: int, edits: int, seed: int = 0):
+    """Returns the SolveStats of the cold and warm solves after each edit"""
+    rng = random.Random(seed)
+    # generate gives up when the aliens and houses can't be placed, so move on
+    # to the next seed
+    for attempt in range(SEEDS):
+        data = generate((size, size), num_colors=2, pairs=2, seed=seed + attempt)
+        if data is not None:
+            break
+    else:
+        raise ValueError(f"no puzzle generated for size {size} in {SEEDS} seeds")
+    interior = [(x, y) for x in range(1, size - 1) for y in range(1, size - 1)]
+    data["obstacles"] = [c for c in data["obstacles"] if c not in interior]
+    data["rails"] = []
+
+    cold, warm = [], []
+    with Session((size, size), 2) as session:
+        session.load(data)
+        solution = session.solve(allow_new_rails=True)
+        while len(cold) < edits:
+            coord = rng.choice(interior)
+            tile = session.tiles[coord]
+            if tile == EMPTY_TILE:
+                session.set_tile(coord, "obstacle")
+            elif tile[0] == "obstacle":
+                session.set_tile(coord, *EMPTY_TILE)
+            else:
+                continue
+            model, cold_stats = solve_fresh(session)
+            if model is None:
+                session.set_tile(coord, *tile)
+                continue
+            model, warm_stats = solve_fresh(session, solution)
+            cold.append(cold_stats)
+            warm.append(warm_stats)
+            solution = model
+    return cold, warm
+
+
+def main(edits: int, sizes) -> None:
+    print(f"{edits} edits")
+    print(
+        f"{'size':>6}{'cold (s)':>10}{'conflicts':>11}"
+        f"{'warm (s)':>10}{'conflicts':>11}{'speedup':>9}"
+    )
+    for size in sizes:
+        cold, warm = (total_stats(stats) for stats in edit_sequence(size, edits))
+        print(
+            f"{size:>6}{cold.time:>10.3f}{cold.conflicts:>11}"
+            f"{warm.time:>10.3f}{warm.conflicts:>11}{cold.time / warm.time:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    args = list(map(int, sys.argv[1:]))
+    main(args[0] if args else DEFAULT_EDITS, args[1:] or DEFAULT_SIZES)
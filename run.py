@@ -1,12 +1,14 @@
-import sys
-from pprint import pprint
-from src.file_reader import read_file
+import argparse
 
-sys.setrecursionlimit(10 ** 6)
+# The solver modules import nnf, PySAT and friends, which dominates the start up
+# time of short runs. They are imported in main() once the arguments are known
+# to be valid, so that --help and usage errors stay fast.
 
 
 def summarize(solution):
     """Summarizes the solution by printing out certain propositions"""
+    from pprint import pprint
+
     # Do some filtering
     solution = {k: v for k, v in solution.items() if isinstance(k, str)}
 
@@ -48,21 +50,378 @@ def summarize(solution):
     )
 
 
-if __name__ == "__main__":
+def example_theory():
+    """Returns the encoding of a small example board, as used by test.py"""
+    from src.file_reader import read_file
+
+    with open("data/xml/example_simple_bend.xml", encoding="utf8") as f:
+        return read_file(f)
+
+
+def rail_objective(encoding):
+    """Soft constraints preferring as few rails as possible"""
+    from nnf import Var
+
+    return [
+        (1, Var(name).negate())
+        for name in sorted(encoding.vars())
+        if isinstance(name, str) and name.startswith("rail:")
+    ]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Solves a Cosmic Express board")
+    parser.add_argument("file", help="board xml file")
+    parser.add_argument(
+        "--solver",
+        metavar="EXECUTABLE",
+        help="solve with an external DIMACS SAT solver instead of PySAT",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        help="seconds to give each solver call before reporting an unknown result",
+    )
+    parser.add_argument(
+        "--conflicts",
+        type=int,
+        metavar="N",
+        help="conflicts to allow each PySAT call before giving up",
+    )
+    parser.add_argument(
+        "--memory",
+        type=int,
+        metavar="MB",
+        help="memory limit for model counting with dsharp",
+    )
+    parser.add_argument(
+        "--ddnnf",
+        metavar="FILE",
+        help="keep the compiled d-DNNF used for counting in FILE, and reuse it "
+        "from there while the board's constraints stay the same",
+    )
+    parser.add_argument(
+        "--approx",
+        action="store_true",
+        help="estimate the number of solutions with random XOR hashes instead of "
+        "counting them exactly, and fall back to the estimate when an exact "
+        "count runs out of its budget",
+    )
+    parser.add_argument(
+        "--epsilon",
+        type=float,
+        default=0.8,
+        help="relative error allowed for --approx (default 0.8)",
+    )
+    parser.add_argument(
+        "--delta",
+        type=float,
+        default=0.2,
+        help="chance that --approx may exceed its error (default 0.2)",
+    )
+    parser.add_argument(
+        "--density",
+        type=float,
+        default=0.5,
+        metavar="P",
+        help="chance that each of --approx's XORs includes a variable (default "
+        "0.5, the only one with the epsilon and delta guarantee)",
+    )
+    parser.add_argument(
+        "--sparse",
+        action="store_true",
+        help="make --approx's XORs take only a few variables each, which is much "
+        "faster but a heuristic, without the epsilon and delta guarantee",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        metavar="N",
+        help="processes for --approx to use, by default one per CPU",
+    )
+    parser.add_argument(
+        "--dimacs", metavar="OUT", help="write the board's CNF to OUT and exit"
+    )
+    parser.add_argument(
+        "--wcnf",
+        metavar="OUT",
+        help="write a MaxSAT instance minimising the number of rails to OUT and exit",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="print the size of each family of constraints and the largest tiles, "
+        "and exit",
+    )
+    parser.add_argument(
+        "--solver-stats",
+        action="store_true",
+        help="decide satisfiability with PySAT and print the conflicts, decisions, "
+        "propagations, restarts and time it took, and the size of the CNF",
+    )
+    parser.add_argument(
+        "--explain",
+        action="store_true",
+        help="if the board is unsolvable, list a minimal set of tiles causing it",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=("sat", "search"),
+        default="sat",
+        help="solve by encoding the board to SAT, or by searching for the "
+        "train's path directly (finds one solution, without counting)",
+    )
+    parser.add_argument(
+        "--cegar",
+        action="store_true",
+        help="find one solution, adding path ordering constraints only as needed",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="add each constraint's clauses straight to the solver instead of "
+        "keeping the constraints, which uses less memory on large boards (finds "
+        "one solution, without counting)",
+    )
+    parser.add_argument(
+        "--color-encoding",
+        choices=("onehot", "log"),
+        default="onehot",
+        help="represent colors with a prop per color, or as binary numbers, "
+        "which needs fewer props on boards with many colors",
+    )
+    parser.add_argument(
+        "--cache",
+        metavar="DB",
+        help="reuse results of this board, or of any rotation, reflection or "
+        "recolouring of it, from the cache file DB, and store new ones there",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    from src.cegar import solve_cegar
+    from src.explain import describe, explain
+    from src.external import run_solver
+    from src.file_reader import read_data
+    from src.search import search
+    from src.xml_parser import import_xml
+
     # Read model from file
-    with open(sys.argv[1], encoding="utf8") as f:
-        encoding = read_file(f, True)
+    with open(args.file, encoding="utf8") as f:
+        data = import_xml(f.read())
+
+    if args.cegar or args.engine == "search":
+        s = solve_cegar(data, True) if args.cegar else search(data, True)
+        print(f"Satisfiable: {s is not None}\n")
+        if s is not None:
+            print("One solution is:")
+            summarize(s)
+        return
+
+    if args.cache:
+        solve_from_cache(data, args)
+        return
+
+    if args.stream:
+        encoding = read_data(data, True, args.color_encoding, streaming=True)
+        result = encoding.solve_limited()
+        encoding.close()
+        s = result.model
+        print(f"Satisfiable: {s is not None}\n")
+        if s is not None:
+            print("One solution is:")
+            summarize(decoded(s, data, args))
+        if args.solver_stats:
+            print_solver_stats(result.stats)
+        return
+
+    encoding = read_data(data, True, args.color_encoding)
+
+    if args.stats:
+        print_stats(encoding)
+        return
 
-    satisfiable = encoding.is_satisfiable()
+    if args.dimacs:
+        with open(args.dimacs, "w", encoding="utf8") as f:
+            encoding.to_dimacs(f)
+        return
+
+    if args.wcnf:
+        with open(args.wcnf, "w", encoding="utf8") as f:
+            encoding.to_wcnf(f, rail_objective(encoding))
+        return
+
+    if args.solver:
+        result = run_solver(
+            encoding, args.solver, timeout=args.timeout, on_line=print
+        )
+        print(f"Status: {result.status}\n")
+        # A solver may say SAT without printing a model
+        if result.model is not None:
+            summarize(decoded(result.model, data, args))
+        return
+
+    if (args.timeout, args.conflicts, args.memory) != (None, None, None):
+        solve_with_limits(encoding, data, args)
+        return
+
+    # With --solver-stats, the stats are those of the call deciding
+    # satisfiability, whose model is then the solution printed
+    result = None
+    if args.solver_stats:
+        result = encoding.solve_limited()
+        satisfiable = result.model is not None
+    else:
+        satisfiable = encoding.is_satisfiable()
     print(f"Satisfiable: {satisfiable}\n")
 
+    if not satisfiable and args.explain:
+        print("The board is unsolvable because of these tiles:")
+        print(describe(explain(data, True)))
+
     if satisfiable:
-        num_solutions = encoding.count_solutions()
-        if num_solutions == 1:
+        if args.approx:
+            print_estimate(encoding, args)
+        else:
+            if args.ddnnf:
+                encoding.compiled(args.ddnnf)
+            num_solutions = encoding.count_solutions()
+            if num_solutions == 1:
+                print("There is 1 solution.\n")
+            else:
+                print(f"There are {num_solutions} solutions.\n")
+        print("One solution is:")
+        s = encoding.solve() if result is None else result.model
+
+        summarize(decoded(s, data, args))
+
+    if result is not None:
+        print_solver_stats(result.stats)
+
+
+def print_stats(encoding, tiles=5):
+    """Prints the size of the encoding by constraint family, and its largest tiles"""
+    header = f"{'constraints':>12}{'vars':>8}{'clauses':>9}{'nodes':>8}"
+
+    def row(name, stats):
+        print(
+            f"{name:<16}{stats.constraints:>12}{stats.vars:>8}"
+            f"{stats.clauses:>9}{stats.nodes:>8}"
+        )
+
+    print(f"{'family':<16}{header}")
+    for family, stats in encoding.stats("family").items():
+        row(str(family), stats)
+    print(f"\n{'tile':<16}{header}")
+    largest = sorted(
+        encoding.stats("tile").items(), key=lambda item: item[1].clauses, reverse=True
+    )
+    for coord, stats in largest[:tiles]:
+        row(str(coord), stats)
+
+
+def print_solver_stats(stats):
+    """Prints the SolveStats of a solver call"""
+    print(
+        f"\nSolver: {stats.conflicts} conflicts, {stats.decisions} decisions, "
+        f"{stats.propagations} propagations, {stats.restarts} restarts "
+        f"in {stats.time:.3f}s, on {stats.vars} vars and {stats.clauses} clauses"
+    )
+
+
+def print_estimate(encoding, args):
+    """Prints an approximate count of the encoding's solutions"""
+    estimate = encoding.approx_count(
+        args.epsilon,
+        args.delta,
+        workers=args.workers,
+        density=args.density,
+        sparse=args.sparse,
+    )
+    if estimate.exact:
+        if estimate.count == 1:
             print("There is 1 solution.\n")
         else:
-            print(f"There are {num_solutions} solutions.\n")
+            print(f"There are {estimate.count} solutions.\n")
+    elif args.density == 0.5 and not args.sparse:
+        print(
+            f"There are about {estimate.count} solutions "
+            f"(epsilon {args.epsilon}, delta {args.delta}).\n"
+        )
+    else:
+        # Only dense XORs carry the guarantee, see src.approxmc
+        print(
+            f"There are about {estimate.count} solutions "
+            "(heuristic estimate from sparser hashes, without an error "
+            "guarantee).\n"
+        )
+
+
+def solve_from_cache(data, args):
+    """Like the default output of main, but answered from a ResultCache if possible"""
+    from src.explain import describe, explain
+    from src.result_cache import ResultCache, solve_cached
+
+    with ResultCache(args.cache) as cache:
+        result = solve_cached(data, cache, True)
+    print(f"Satisfiable: {result.satisfiable}\n")
+
+    if not result.satisfiable and args.explain:
+        print("The board is unsolvable because of these tiles:")
+        print(describe(explain(data, True)))
+
+    if result.satisfiable:
+        if result.count == 1:
+            print("There is 1 solution.\n")
+        else:
+            print(f"There are {result.count} solutions.\n")
         print("One solution is:")
-        s = encoding.solve()
+        summarize(result.model)
+
 
-        summarize(s)
+def solve_with_limits(encoding, data, args):
+    """Like the default output of main, but each solver call is given a budget"""
+    from src.explain import describe, explain
+    from src.lib204 import SAT, UNSAT
+
+    result = encoding.solve_limited(args.timeout, args.conflicts)
+    print(f"Status: {result.status}\n")
+    if result.status == UNSAT and args.explain:
+        print("The board is unsolvable because of these tiles:")
+        print(describe(explain(data, True)))
+    if result.status != SAT:
+        return
+
+    count = encoding.count_limited(
+        time_limit=args.timeout,
+        conflict_limit=args.conflicts,
+        memory_limit=args.memory,
+    )
+    if not count.exact and args.approx:
+        print_estimate(encoding, args)
+    elif not count.exact:
+        print(f"There are at least {count.count} solutions.\n")
+    elif count.count == 1:
+        print("There is 1 solution.\n")
+    else:
+        print(f"There are {count.count} solutions.\n")
+    print("One solution is:")
+    summarize(decoded(result.model, data, args))
+    if args.solver_stats:
+        print_solver_stats(result.stats)
+
+
+def decoded(solution, data, args):
+    """Returns the solution with colors named the same way for either encoding"""
+    from src.theory import decode_colors
+
+    if args.color_encoding == "log":
+        return decode_colors(solution, data["colors"])
+    return solution
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""Approximate model counting with random XOR hashes, in the style of ApproxMC
+
+Random XOR constraints over the counted variables split the models into cells
+of roughly equal size. Adding XORs until a cell holds fewer than a threshold of
+models, and scaling the cell's count back up by 2 for each XOR, estimates the
+count. The median over enough independent hashes is within a factor of
+1 + epsilon of the true count with probability at least 1 - delta (Chakraborty,
+Meel and Vardi, "Algorithmic improvements in approximate counting for
+probabilistic inference", IJCAI 2016).
+
+Each estimate only needs a PySAT solver that enumerates at most threshold
+models per cell, so this works on boards that DSHARP can't compile. The
+estimates are independent and run in worker processes.
+
+A hash whose cell is empty gives no estimate. Such rounds count as failures
+and are repeated with a new hash, so the median is always taken over the number
+of estimates the delta bound needs.
+
+The guarantee is for XORs that take each variable with probability 0.5, the
+default. Those make cells that are hard to solve, so with sparse=True each XOR
+only takes a variable with probability about 2 log2(n) / n, like sparse hashing
+(Meel and Akshay, "Sparse hashing for scalable approximate model counting",
+LICS 2020). That is much faster, but only a heuristic here: the estimate no
+longer carries the epsilon and delta guarantee.
+"""
+import math
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple, Optional, Sequence
+
+from nnf import config
+
+from .cnf import CNF, Clause
+
+
+class Estimate(NamedTuple):
+    """An approximate count. If exact is true the count was enumerated in full."""
+
+    count: int
+    exact: bool
+
+
+def threshold(epsilon: float) -> int:
+    """The most models a cell may hold for the epsilon guarantee"""
+    return int(1 + 9.84 * (1 + epsilon / (1 + epsilon)) * (1 + 1 / epsilon) ** 2)
+
+
+def iterations(delta: float) -> int:
+    """The number of estimates whose median meets the delta guarantee"""
+    return math.ceil(17 * math.log2(3 / delta))
+
+
+def approx_count(
+    cnf: CNF,
+    projection: Sequence[int],
+    epsilon: float = 0.8,
+    delta: float = 0.2,
+    workers: Optional[int] = None,
+    seed: Optional[int] = None,
+    solver_name: Optional[str] = None,
+    density: float = 0.5,
+    sparse: bool = False,
+) -> Estimate:
+    """Estimates the number of assignments to the projection variables, given as
+    variable ids, that extend to a model of the cnf.
+
+    workers is the number of processes to use, by default one per CPU. With a
+    seed, the estimate is the same on every run. density is the probability
+    that a XOR includes each variable, and sparse picks a small one instead,
+    see above. The guarantee only holds for the default density of 0.5.
+
+    Raises RuntimeError if more hashes leave an empty cell than the delta bound
+    needs estimates.
+    """
+    if not 0 < epsilon:
+        raise ValueError("epsilon must be positive")
+    if not 0 < delta < 1:
+        raise ValueError("delta must be between 0 and 1")
+    if not 0 < density <= 0.5:
+        raise ValueError("density must be between 0 and 0.5")
+    if solver_name is None:
+        solver_name = config.pysat_solver
+    limit = threshold(epsilon)
+
+    counter = _Counter(cnf.clauses, cnf.num_vars, projection, limit, solver_name)
+    try:
+        # Small counts are found exactly, without hashing
+        count = counter.count_cell(0, None)
+        if count < limit:
+            return Estimate(count, True)
+        if sparse:
+            n = len(counter.projection)
+            density = min(0.5, 2 * math.log2(n) / n)
+    finally:
+        counter.close()
+
+    rng = random.Random(seed)
+    rounds = iterations(delta)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    args = (cnf.clauses, cnf.num_vars, projection, limit, solver_name, density)
+    executor = None
+    if workers > 1:
+        executor = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=args)
+    estimates = []
+    failures = 0
+    try:
+        # Rounds with an empty cell are failures, and are run again with new
+        # hashes until there are enough estimates
+        while len(estimates) < rounds:
+            seeds = [rng.getrandbits(64) for _ in range(rounds - len(estimates))]
+            if executor is None:
+                results = [_estimate(*args, s) for s in seeds]
+            else:
+                results = list(executor.map(_worker_estimate, seeds))
+            found = [e for e in results if e is not None]
+            failures += len(results) - len(found)
+            if failures > rounds:
+                raise RuntimeError(f"{failures} hashes left an empty cell")
+            estimates.extend(found)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    estimates.sort()
+    return Estimate(estimates[len(estimates) // 2], False)
+
+
+class _Counter:
+    """A solver for one hash, which counts the models in a cell up to a limit"""
+
+    def __init__(
+        self,
+        clauses: list[Clause],
+        num_vars: int,
+        projection: Sequence[int],
+        limit: int,
+        solver_name: str,
+        density: float = 0.5,
+        rng: Optional[random.Random] = None,
+    ) -> None:
+        from pysat.solvers import Solver
+
+        self.solver = Solver(name=solver_name, bootstrap_with=clauses)
+        self.top = num_vars
+        self.limit = limit
+        self.density = density
+        self.rng = rng
+        # Variables that every model agrees on only flip the parity of a XOR,
+        # so they are left out of the hash
+        _, implied = self.solver.propagate(assumptions=[])
+        fixed = {abs(lit) for lit in implied or []}
+        self.projection = [v for v in projection if v not in fixed]
+        # The activation literal of each XOR of the hash, made as needed
+        self.xors: list[int] = []
+
+    def close(self) -> None:
+        self.solver.delete()
+
+    def _new_var(self) -> int:
+        self.top += 1
+        return self.top
+
+    def _add_xor(self) -> None:
+        """Adds a random XOR over the projection, active when its literal is"""
+        variables = [v for v in self.projection if self.rng.random() < self.density]
+        parity = self.rng.random() < 0.5
+        active = self._new_var()
+        if not variables:
+            if parity:
+                self.solver.add_clause([-active])
+        else:
+            # t_i is the XOR of the first i + 1 variables
+            t = variables[0]
+            for v in variables[1:]:
+                u = self._new_var()
+                self.solver.add_clause([-u, t, v])
+                self.solver.add_clause([-u, -t, -v])
+                self.solver.add_clause([u, -t, v])
+                self.solver.add_clause([u, t, -v])
+                t = u
+            self.solver.add_clause([-active, t if parity else -t])
+        self.xors.append(active)
+
+    def count_cell(self, m: int, limit: Optional[int] = None) -> int:
+        """Counts up to limit models, by default the threshold, in the cell
+        given by the first m XORs"""
+        if limit is None:
+            limit = self.limit
+        while len(self.xors) < m:
+            self._add_xor()
+        assumptions = self.xors[:m] + [-a for a in self.xors[m:]]
+        # Blocking clauses only apply to this count
+        selector = self._new_var()
+        count = 0
+        while count < limit and self.solver.solve(assumptions=assumptions + [selector]):
+            model = self.solver.get_model()
+            count += 1
+            self.solver.add_clause([-selector] + [-model[v - 1] for v in self.projection])
+        self.solver.add_clause([-selector])
+        return count
+
+    def estimate(self) -> Optional[int]:
+        """Returns the scaled count of the first cell with fewer models than the
+        threshold, or None if that cell is empty"""
+        counts = {0: self.limit}
+        # Find a number of XORs that is enough by doubling, then the smallest
+        # one by bisection, since each XOR can only shrink the cell
+        low, high = 0, 1
+        while True:
+            counts[high] = self.count_cell(high)
+            if counts[high] < self.limit:
+                break
+            if high >= len(self.projection):
+                return None
+            low, high = high, min(2 * high, len(self.projection))
+        while high - low > 1:
+            middle = (low + high) // 2
+            counts[middle] = self.count_cell(middle)
+            if counts[middle] < self.limit:
+                high = middle
+            else:
+                low = middle
+        if counts[high] == 0:
+            return None
+        return counts[high] * 2**high
+
+
+def _estimate(
+    clauses, num_vars, projection, limit, solver_name, density, seed
+) -> Optional[int]:
+    counter = _Counter(
+        clauses, num_vars, projection, limit, solver_name, density, random.Random(seed)
+    )
+    try:
+        return counter.estimate()
+    finally:
+        counter.close()
+
+
+# Worker processes get the clauses once rather than with every estimate
+_worker_args = None
+
+
+def _init_worker(*args) -> None:
+    global _worker_args
+    _worker_args = args
+
+
+def _worker_estimate(seed: int) -> Optional[int]:
+    return _estimate(*_worker_args, seed)
@@ -0,0 +1,164 @@
+"""Solves many boards on one incremental solver per board shape
+
+Boards with the same (rows, cols, colors) share the generic theory, so a
+Session is built once per shape and each board is loaded into it by swapping
+tile assumptions. The solver keeps the clauses it learnt on earlier boards.
+
+Usage: python -m src.batch [--new-rails] [--workers N] [--stats] FILE_OR_CORPUS ...
+
+With --stats, the solver's conflicts, decisions and time are printed for each
+board, followed by their totals and the boards that took the most conflicts.
+"""
+import os
+import sys
+import time
+from typing import Any, Iterable, Iterator, Optional
+
+from .file_reader import check_data
+from .lib204 import SAT, SolveResult, SolveStats, solve_with_stats, total_stats
+from .session import Session
+
+Shape = tuple[int, int, int]
+
+
+class BatchSolver:
+    """Keeps a session for each board shape it has seen"""
+
+    def __init__(
+        self,
+        allow_new_rails: bool = False,
+        time_limit: Optional[float] = None,
+        conflict_limit: Optional[int] = None,
+        workers: int = 1,
+    ) -> None:
+        """time_limit and conflict_limit are the budget for each board,
+        as in lib204.solve_within. workers is passed to each Session."""
+        self.allow_new_rails = allow_new_rails
+        self.time_limit = time_limit
+        self.conflict_limit = conflict_limit
+        self.workers = workers
+        self.sessions: dict[Shape, Session] = dict()
+        # The SolveStats of every board solved so far, added up
+        self.stats = SolveStats()
+
+    def close(self) -> None:
+        for session in self.sessions.values():
+            session.close()
+        self.sessions.clear()
+
+    def __enter__(self) -> "BatchSolver":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def session(self, data: dict[str, Any]) -> Session:
+        """Returns the session for the board's shape with the board loaded"""
+        shape = data["rows"], data["cols"], data["colors"]
+        if shape not in self.sessions:
+            self.sessions[shape] = Session(shape[:2], shape[2], self.workers)
+        session = self.sessions[shape]
+        session.load(data)
+        return session
+
+    def solve(self, data: dict[str, Any]) -> SolveResult:
+        """Solves a board in the format returned by import_xml. The result's
+        stats are for this board alone, and are added to self.stats."""
+        check_data(data)
+        session = self.session(data)
+        status, stats = solve_with_stats(
+            session.solver,
+            session.cnf,
+            session.assumptions(self.allow_new_rails),
+            self.time_limit,
+            self.conflict_limit,
+        )
+        self.stats = total_stats([self.stats, stats])
+        if status != SAT:
+            return SolveResult(status, stats=stats)
+        model = session.cnf.decode(session.solver.get_model())
+        return SolveResult(status, model, stats)
+
+
+def solve_all(
+    boards: Iterable[dict[str, Any]], allow_new_rails: bool = False, **limits
+) -> Iterator[SolveResult]:
+    """Yields the result for each board in order. limits are passed to BatchSolver."""
+    with BatchSolver(allow_new_rails, **limits) as solver:
+        for data in boards:
+            yield solver.solve(data)
+
+
+def _read_boards(
+    paths: Iterable[str],
+) -> Iterator[tuple[str, Optional[dict[str, Any]]]]:
+    """Yields (name, data) for every board in the given xml files and corpora.
+    data is None for files that can't be parsed."""
+    from xml.etree.ElementTree import ParseError
+
+    from .xml_parser import import_xml
+
+    for path in paths:
+        if os.path.isdir(path):
+            from .board import load_corpus
+
+            for i, board in enumerate(load_corpus(path)):
+                yield f"{path}[{i}]", board.to_data()
+        else:
+            with open(path, encoding="utf8") as f:
+                try:
+                    yield path, import_xml(f.read())
+                except ParseError:
+                    yield path, None
+
+
+def format_stats(stats: SolveStats) -> str:
+    return (
+        f"{stats.conflicts} conflicts, {stats.decisions} decisions, "
+        f"{stats.propagations} propagations, {stats.restarts} restarts, "
+        f"{stats.time:.3f}s"
+    )
+
+
+def main(argv: list[str], hardest: int = 5) -> None:
+    argv = list(argv)
+    workers = 1
+    if "--workers" in argv:
+        i = argv.index("--workers")
+        workers = int(argv[i + 1])
+        del argv[i : i + 2]
+    allow_new_rails = "--new-rails" in argv
+    show_stats = "--stats" in argv
+    paths = [arg for arg in argv if arg not in ("--new-rails", "--stats")]
+
+    start = time.perf_counter()
+    count = 0
+    board_stats = []
+    with BatchSolver(allow_new_rails, workers=workers) as solver:
+        for name, data in _read_boards(paths):
+            try:
+                if data is None:
+                    raise ValueError("not a board file")
+                result = solver.solve(data)
+            except (KeyError, ValueError) as e:
+                print(f"{name}: error: {e}")
+            else:
+                board_stats.append((name, result.stats))
+                if show_stats:
+                    print(f"{name}: {result.status} ({format_stats(result.stats)})")
+                else:
+                    print(f"{name}: {result.status}")
+            count += 1
+        total = solver.stats
+    elapsed = time.perf_counter() - start
+    print(f"{count} boards in {elapsed:.2f}s ({count / elapsed:.1f} boards/s)")
+    if show_stats and board_stats:
+        print(f"Solver total: {format_stats(total)}")
+        print("Most conflicts:")
+        board_stats.sort(key=lambda item: item[1].conflicts, reverse=True)
+        for name, stats in board_stats[:hardest]:
+            print(f"  {name}: {format_stats(stats)}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,228 @@
+"""Compact NumPy representation of boards and memory-mapped board corpora
+
+A board is stored as a single uint8 array of shape (4, cols, rows) so it can be
+sliced straight out of a memory-mapped corpus without copying. The four layers
+hold the tile kind, the tile color and the rail input/output directions, and are
+indexed by (x, y) coordinates like the rest of the model.
+"""
+import os
+from typing import Iterable, Iterator, Sequence
+
+import numpy as np
+
+from .xml_parser import export_xml, import_xml
+
+# Tile kinds
+EMPTY, ENTRANCE, EXIT, ALIEN, HOUSE, OBSTACLE, RAIL = range(7)
+KINDS = ["empty", "entrance", "exit", "alien", "house", "obstacle", "rail"]
+
+# Direction codes, 0 means no direction
+DIRECTIONS = "NESW"
+NO_DIRECTION = 0
+
+NO_COLOR = 255
+
+KIND_LAYER, COLOR_LAYER, RAIL_IN_LAYER, RAIL_OUT_LAYER = range(4)
+
+_BOARDS_FILE = "boards.npy"
+_SHAPES_FILE = "shapes.npy"
+
+
+def direction_code(direction: str) -> int:
+    """Returns the code stored in the rail layers for one of N,E,S,W"""
+    return DIRECTIONS.index(direction) + 1
+
+
+def code_direction(code: int) -> str:
+    """Inverse of direction_code"""
+    return DIRECTIONS[code - 1]
+
+
+class Board:
+    """A board backed by a (4, cols, rows) uint8 array"""
+
+    def __init__(self, grid: np.ndarray, num_colors: int) -> None:
+        if grid.ndim != 3 or grid.shape[0] != 4:
+            raise ValueError("grid must have shape (4, cols, rows)")
+        self.grid = grid
+        self.num_colors = num_colors
+
+    @classmethod
+    def empty(cls, size: tuple[int, int], num_colors: int = 1) -> "Board":
+        """Returns an empty board with the given (rows, cols) size"""
+        rows, cols = size
+        grid = np.zeros((4, cols, rows), dtype=np.uint8)
+        grid[COLOR_LAYER] = NO_COLOR
+        return cls(grid, num_colors)
+
+    @property
+    def size(self) -> tuple[int, int]:
+        """Returns the board's (rows, cols) size"""
+        return self.grid.shape[2], self.grid.shape[1]
+
+    @property
+    def kinds(self) -> np.ndarray:
+        return self.grid[KIND_LAYER]
+
+    @property
+    def colors(self) -> np.ndarray:
+        return self.grid[COLOR_LAYER]
+
+    @property
+    def rail_in(self) -> np.ndarray:
+        return self.grid[RAIL_IN_LAYER]
+
+    @property
+    def rail_out(self) -> np.ndarray:
+        return self.grid[RAIL_OUT_LAYER]
+
+    def coords(self, kind: int) -> list[tuple[int, int]]:
+        """Returns the coordinates of every tile of the given kind"""
+        return [(int(x), int(y)) for x, y in np.argwhere(self.kinds == kind)]
+
+    def set_tile(self, coord, kind: int, color=None, directions=None) -> None:
+        """Overwrites the tile at coord"""
+        self.grid[:, coord[0], coord[1]] = (
+            kind,
+            NO_COLOR if color is None else color,
+            NO_DIRECTION if directions is None else direction_code(directions[0]),
+            NO_DIRECTION if directions is None else direction_code(directions[1]),
+        )
+
+    def copy(self) -> "Board":
+        return Board(self.grid.copy(), self.num_colors)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Board):
+            return NotImplemented
+        return self.num_colors == other.num_colors and np.array_equal(
+            self.grid, other.grid
+        )
+
+    @classmethod
+    def from_data(cls, data: dict) -> "Board":
+        """Builds a board from the dictionary returned by xml_parser.import_xml
+
+        Each tile holds a single item, so if the data places several items on the
+        same coordinate the one listed last (in import_xml's order) wins.
+        """
+        board = cls.empty((data["rows"], data["cols"]), data["colors"])
+        for coord in data["entrances"]:
+            board.set_tile(coord, ENTRANCE)
+        for coord in data["exits"]:
+            board.set_tile(coord, EXIT)
+        for color, coord in data["aliens"]:
+            board.set_tile(coord, ALIEN, color=color)
+        for color, coord in data["houses"]:
+            board.set_tile(coord, HOUSE, color=color)
+        for coord in data["obstacles"]:
+            board.set_tile(coord, OBSTACLE)
+        for directions, coord in data["rails"]:
+            board.set_tile(coord, RAIL, directions=directions)
+        return board
+
+    def to_data(self) -> dict:
+        """Returns the same dictionary xml_parser.import_xml would"""
+        rows, cols = self.size
+        colors = self.colors
+        rail_in, rail_out = self.rail_in, self.rail_out
+        return {
+            "rows": rows,
+            "cols": cols,
+            "colors": self.num_colors,
+            "entrances": self.coords(ENTRANCE),
+            "exits": self.coords(EXIT),
+            "aliens": [(int(colors[c]), c) for c in self.coords(ALIEN)],
+            "houses": [(int(colors[c]), c) for c in self.coords(HOUSE)],
+            "obstacles": self.coords(OBSTACLE),
+            "rails": [
+                ((code_direction(rail_in[c]), code_direction(rail_out[c])), c)
+                for c in self.coords(RAIL)
+            ],
+        }
+
+    @classmethod
+    def from_xml(cls, xml: str) -> "Board":
+        return cls.from_data(import_xml(xml))
+
+    def to_xml(self) -> str:
+        return export_xml(**self.to_data())
+
+
+class Corpus(Sequence[Board]):
+    """A read-only sequence of boards backed by (optionally memory-mapped) arrays
+
+    Boards returned by indexing are views into the corpus arrays, so worker
+    processes that open the same corpus share its pages instead of copying them.
+    """
+
+    def __init__(self, boards: np.ndarray, shapes: np.ndarray) -> None:
+        self.boards = boards
+        self.shapes = shapes
+
+    def __len__(self) -> int:
+        return len(self.shapes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        rows, cols, colors = (int(v) for v in self.shapes[index])
+        return Board(self.boards[index, :, :cols, :rows], colors)
+
+    def __iter__(self) -> Iterator[Board]:
+        for i in range(len(self)):
+            yield self[i]
+
+
+def save_corpus(path: str, boards: Iterable[Board]) -> None:
+    """Writes the boards to a corpus directory
+
+    Boards of different sizes are padded to the largest size in the corpus.
+    """
+    boards = list(boards)
+    shapes = np.array(
+        [(*b.size, b.num_colors) for b in boards], dtype=np.int32
+    ).reshape(-1, 3)
+    max_rows = int(shapes[:, 0].max(initial=0))
+    max_cols = int(shapes[:, 1].max(initial=0))
+
+    os.makedirs(path, exist_ok=True)
+    data = np.lib.format.open_memmap(
+        os.path.join(path, _BOARDS_FILE),
+        mode="w+",
+        dtype=np.uint8,
+        shape=(len(boards), 4, max_cols, max_rows),
+    )
+    data[:, KIND_LAYER] = EMPTY
+    data[:, COLOR_LAYER] = NO_COLOR
+    data[:, RAIL_IN_LAYER:] = NO_DIRECTION
+    for i, board in enumerate(boards):
+        rows, cols = board.size
+        data[i, :, :cols, :rows] = board.grid
+    data.flush()
+    del data
+
+    np.save(os.path.join(path, _SHAPES_FILE), shapes)
+
+
+def load_corpus(path: str, mmap: bool = True) -> Corpus:
+    """Opens a corpus directory written by save_corpus"""
+    mode = "r" if mmap else None
+    boards = np.load(os.path.join(path, _BOARDS_FILE), mmap_mode=mode)
+    shapes = np.load(os.path.join(path, _SHAPES_FILE))
+    return Corpus(boards, shapes)
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 3:
+        print("usage: python -m src.board CORPUS_DIR FILE.xml [FILE.xml ...]")
+        sys.exit(1)
+
+    corpus_boards = []
+    for filename in sys.argv[2:]:
+        with open(filename, encoding="utf8") as f:
+            corpus_boards.append(Board.from_xml(f.read()))
+    save_corpus(sys.argv[1], corpus_boards)
+    print(f"Wrote {len(corpus_boards)} boards to {sys.argv[1]}")
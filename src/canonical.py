@@ -0,0 +1,185 @@
+"""Canonical forms of boards under grid symmetries and colour relabelling
+
+Rotating or mirroring a board, or swapping its colours around, doesn't change
+whether it can be solved or how many solutions it has. canonicalize picks one
+representative of all of these variants, so that they share a hash, and records
+how to map a solution of the representative back onto the original board.
+"""
+import hashlib
+import json
+import re
+from typing import Any, NamedTuple
+
+from .helpers import Coord
+
+Matrix = tuple[int, int, int, int]
+
+# The 8 symmetries of the square as (a, b, c, d), mapping (x, y) to
+# (a*x + b*y, c*x + d*y) before the result is shifted back onto the grid
+SYMMETRIES: list[Matrix] = [
+    (1, 0, 0, 1),
+    (0, -1, 1, 0),
+    (-1, 0, 0, -1),
+    (0, 1, -1, 0),
+    (-1, 0, 0, 1),
+    (1, 0, 0, -1),
+    (0, 1, 1, 0),
+    (0, -1, -1, 0),
+]
+
+_VECTORS = {"N": (0, 1), "E": (1, 0), "S": (0, -1), "W": (-1, 0)}
+_DIRECTIONS = {v: d for d, v in _VECTORS.items()}
+
+
+class Transform(NamedTuple):
+    """One grid symmetry applied to a board of a particular size"""
+
+    matrix: Matrix
+    size: tuple[int, int]
+
+    @property
+    def new_size(self) -> tuple[int, int]:
+        rows, cols = self.size
+        return (cols, rows) if self.matrix[0] == 0 else (rows, cols)
+
+    def _offset(self) -> tuple[int, int]:
+        a, b, c, d = self.matrix
+        rows, cols = self.size
+        corners = [(x, y) for x in (0, cols - 1) for y in (0, rows - 1)]
+        return (
+            -min(a * x + b * y for x, y in corners),
+            -min(c * x + d * y for x, y in corners),
+        )
+
+    def coord(self, coord: Coord) -> Coord:
+        a, b, c, d = self.matrix
+        x, y = coord
+        dx, dy = self._offset()
+        return a * x + b * y + dx, c * x + d * y + dy
+
+    def direction(self, direction: str) -> str:
+        a, b, c, d = self.matrix
+        x, y = _VECTORS[direction]
+        return _DIRECTIONS[a * x + b * y, c * x + d * y]
+
+    def inverse(self) -> "Transform":
+        a, b, c, d = self.matrix
+        # Every matrix here is orthogonal, so its inverse is its transpose
+        return Transform((a, c, b, d), self.new_size)
+
+
+class Canonical(NamedTuple):
+    """A board in canonical form, with the way back to the original board"""
+
+    key: str
+    data: dict[str, Any]
+    transform: Transform
+    # colors[original color] is the color used in data
+    colors: dict[int, int]
+
+
+def transform_data(data: dict[str, Any], transform: Transform) -> dict[str, Any]:
+    """Returns the board, in the format returned by import_xml, after a symmetry"""
+    rows, cols = transform.new_size
+    return {
+        "rows": rows,
+        "cols": cols,
+        "colors": data["colors"],
+        "entrances": [transform.coord(c) for c in data["entrances"]],
+        "exits": [transform.coord(c) for c in data["exits"]],
+        "aliens": [(color, transform.coord(c)) for color, c in data["aliens"]],
+        "houses": [(color, transform.coord(c)) for color, c in data["houses"]],
+        "obstacles": [transform.coord(c) for c in data["obstacles"]],
+        "rails": [
+            (tuple(transform.direction(d) for d in directions), transform.coord(c))
+            for directions, c in data["rails"]
+        ],
+    }
+
+
+def relabel_colors(data: dict[str, Any]) -> tuple[dict[str, Any], dict[int, int]]:
+    """Renumbers colours in order of first appearance, scanning aliens and then
+    houses by coordinate, followed by the unused colours. Returns the new board
+    and the map from old colours."""
+    colors = dict()
+    for _, _, color in sorted(
+        [(0, c, color) for color, c in data["aliens"]]
+        + [(1, c, color) for color, c in data["houses"]]
+    ):
+        colors.setdefault(color, len(colors))
+    # Unused colours still have propositions, so they need labels of their own
+    # for the map to be reversible
+    for color in range(data["colors"]):
+        colors.setdefault(color, len(colors))
+    relabelled = dict(data)
+    for kind in ("aliens", "houses"):
+        relabelled[kind] = [(colors[color], c) for color, c in data[kind]]
+    return relabelled, colors
+
+
+def _serialize(data: dict[str, Any]) -> str:
+    return json.dumps(
+        [
+            data["rows"],
+            data["cols"],
+            data["colors"],
+            sorted(data["entrances"]),
+            sorted(data["exits"]),
+            sorted(data["aliens"]),
+            sorted(data["houses"]),
+            sorted(data["obstacles"]),
+            sorted((c, list(d)) for d, c in data["rails"]),
+        ],
+        separators=(",", ":"),
+    )
+
+
+def canonicalize(data: dict[str, Any]) -> Canonical:
+    """Returns the canonical form of a board in the format returned by import_xml
+
+    Every rotation, reflection and colour relabelling of a board gets the same
+    key: the sha256 hash of the smallest serialisation among its variants.
+    """
+    size = data["rows"], data["cols"]
+    best = None
+    for matrix in SYMMETRIES:
+        transform = Transform(matrix, size)
+        variant, colors = relabel_colors(transform_data(data, transform))
+        text = _serialize(variant)
+        if best is None or text < best[0]:
+            best = text, variant, transform, colors
+    text, variant, transform, colors = best
+    key = hashlib.sha256(text.encode()).hexdigest()
+    return Canonical(key, variant, transform, colors)
+
+
+_NAME = re.compile(r"^(?P<prop>[^:]+):(?P<coords>.*)$")
+_COORD = re.compile(r"\((-?\d+),(-?\d+)\)")
+_DIRECTION_PROP = re.compile(r"^(rail_input|rail_output)_([NESW])$")
+_COLOR_PROP = re.compile(r"^(.*_color)_(\d+)$")
+
+
+def restore_model(model: dict[str, bool], canonical: Canonical) -> dict[str, bool]:
+    """Maps a model of the canonical board back onto the original board"""
+    inverse = canonical.transform.inverse()
+    colors = {new: old for old, new in canonical.colors.items()}
+    return {_restore_name(name, inverse, colors): value for name, value in model.items()}
+
+
+def _restore_name(name: str, inverse: Transform, colors: dict[int, int]) -> str:
+    match = _NAME.match(name)
+    if match is None:
+        return name
+    prop = match["prop"]
+    direction = _DIRECTION_PROP.match(prop)
+    color = _COLOR_PROP.match(prop)
+    if direction:
+        prop = f"{direction[1]}_{inverse.direction(direction[2])}"
+    elif color:
+        prop = f"{color[1]}_{colors.get(int(color[2]), int(color[2]))}"
+
+    def restore_coord(m):
+        x, y = inverse.coord((int(m[1]), int(m[2])))
+        return f"({x},{y})"
+
+    return f"{prop}:{_COORD.sub(restore_coord, match['coords'])}"
@@ -0,0 +1,215 @@
+"""Counterexample guided solving with lazily added path ordering constraints
+
+The eager theory expands every rail_comes_before call into a large formula over
+the rail directions. Here the theory is built with lazy_order=True, so those
+calls become free propositions and only the local constraints are encoded. Each
+candidate solution is traced along its rails, and clauses are added only for the
+ordering propositions that disagree with the traced path and for rail loops that
+are disconnected from it. This repeats on one incremental solver until a
+candidate needs no refinement or the theory becomes unsatisfiable.
+"""
+from typing import Any, Optional
+
+from .cnf import CNF
+from .file_reader import check_data, tile_facts
+from .helpers import Coord
+from .theory import CosmicExpressTheory
+from . import helpers
+
+Model = dict[str, bool]
+
+
+def solve_cegar(data: dict[str, Any], allow_new_rails: bool = False) -> Optional[Model]:
+    """Solves the board in the format returned by import_xml.
+    Returns a model like Encoding.solve, or None if the board is unsolvable."""
+    check_data(data)
+
+    theory_wrapper = CosmicExpressTheory(
+        (data["rows"], data["cols"]), data["colors"], lazy_order=True
+    )
+    for literals in tile_facts(theory_wrapper, data, allow_new_rails).values():
+        for literal in literals:
+            theory_wrapper.theory.add_constraint(literal)
+
+    cnf = theory_wrapper.theory.cnf()
+    with cnf.solver() as solver:
+        while solver.solve():
+            model = cnf.decode(solver.get_model())
+            refinements = refine(theory_wrapper, cnf, model)
+            if not refinements:
+                return model
+            for clause in refinements:
+                solver.add_clause(clause)
+    return None
+
+
+def trace_path(theory_wrapper: CosmicExpressTheory, model: Model) -> list[Coord]:
+    """Returns the rails on the train's path in order, starting next to the entrance"""
+    entrance = next(
+        coord
+        for coord in helpers.all_coords(theory_wrapper.size)
+        if _value(theory_wrapper, model, "entrance", coord)
+    )
+
+    path = []
+    coord = None
+    for offset_coord in helpers.get_adjacent(entrance):
+        if theory_wrapper.grid_contains(offset_coord) and _value(
+            theory_wrapper,
+            model,
+            "rail_input",
+            offset_coord,
+            helpers.direction_between(offset_coord, entrance),
+        ):
+            coord = offset_coord
+            break
+
+    visited = set()
+    while coord is not None and coord not in visited:
+        if not _value(theory_wrapper, model, "rail", coord):
+            break
+        path.append(coord)
+        visited.add(coord)
+        direction = _output_direction(theory_wrapper, model, coord)
+        if direction is None:
+            break
+        coord = helpers.step(coord, direction)
+        if not theory_wrapper.grid_contains(coord):
+            break
+    return path
+
+
+def refine(
+    theory_wrapper: CosmicExpressTheory, cnf: CNF, model: Model
+) -> list[list[int]]:
+    """Returns clauses ruling out the ways the model's ordering propositions and
+    rail loops disagree with its actual path. No clauses means the model is valid."""
+    path = trace_path(theory_wrapper, model)
+    index = {coord: i for i, coord in enumerate(path)}
+    clauses = []
+
+    for (p1, p2), prop in theory_wrapper.order_props.items():
+        actual = p1 in index and p2 in index and index[p1] < index[p2]
+        if model.get(prop.name, False) == actual:
+            continue
+        if p1 in index and p2 in index:
+            # The order is fixed by the path up to the later of the two rails
+            prefix = path[: max(index[p1], index[p2]) + 1]
+            condition = _path_literals(theory_wrapper, cnf, model, path, prefix)
+        else:
+            # Whether a rail is on the path at all depends on the whole path
+            condition = _path_literals(theory_wrapper, cnf, model, path, path, True)
+        literal = cnf.literal(prop if actual else prop.negate())
+        clauses.append([-lit for lit in condition] + [literal])
+
+    # The path has to end at the exit. It can only fail to when a rail outputs off
+    # the edge of the grid, which the theory doesn't forbid.
+    if path:
+        end = helpers.step(path[-1], _output_direction(theory_wrapper, model, path[-1]))
+        if not (
+            theory_wrapper.grid_contains(end)
+            and _value(theory_wrapper, model, "exit", end)
+        ):
+            condition = _path_literals(theory_wrapper, cnf, model, path, path, True)
+            clauses.append([-lit for lit in condition])
+
+    # Rails that are not on the path form loops, or chains fed from outside the
+    # grid. Forbid each one's layout, starting chains at their first rail.
+    rails = {
+        coord
+        for coord in helpers.all_coords(theory_wrapper.size)
+        if _value(theory_wrapper, model, "rail", coord)
+    }
+    remaining = rails - set(path)
+    heads = [
+        coord
+        for coord in sorted(remaining)
+        if not _feeds(theory_wrapper, model, remaining, coord)
+    ]
+    while remaining:
+        coord = heads.pop() if heads else min(remaining)
+        if coord not in remaining:
+            continue
+        literals = []
+        if not _feeds(theory_wrapper, model, remaining, coord):
+            literals.append(
+                cnf.literal(
+                    theory_wrapper.get_prop(
+                        name="rail_input",
+                        descriptor=_input_direction(theory_wrapper, model, coord),
+                        coord=coord,
+                    )
+                )
+            )
+        while coord in remaining:
+            remaining.discard(coord)
+            direction = _output_direction(theory_wrapper, model, coord)
+            literals.append(
+                cnf.literal(
+                    theory_wrapper.get_prop(
+                        name="rail_output", descriptor=direction, coord=coord
+                    )
+                )
+            )
+            coord = helpers.step(coord, direction)
+        clauses.append([-lit for lit in literals])
+
+    return clauses
+
+
+def _feeds(theory_wrapper, model, rails, coord) -> bool:
+    """True iff the rail at coord gets its input from one of the given rails"""
+    previous = helpers.step(coord, _input_direction(theory_wrapper, model, coord))
+    return previous in rails and helpers.step(
+        previous, _output_direction(theory_wrapper, model, previous)
+    ) == coord
+
+
+def _path_literals(theory_wrapper, cnf, model, path, prefix, complete=False):
+    """Returns literals which fix the path's first len(prefix) rails.
+    If complete is true they also fix where the last one leads."""
+    if not path:
+        # The entrance constraints always give the train a first rail
+        raise RuntimeError("model has no path from the entrance")
+    entrance = helpers.step(path[0], _input_direction(theory_wrapper, model, path[0]))
+    literals = [
+        cnf.literal(theory_wrapper.get_prop(name="entrance", coord=entrance)),
+        cnf.literal(
+            theory_wrapper.get_prop(
+                name="rail_input",
+                descriptor=_input_direction(theory_wrapper, model, path[0]),
+                coord=path[0],
+            )
+        ),
+    ]
+    outputs = prefix if complete else prefix[:-1]
+    for coord in outputs:
+        direction = _output_direction(theory_wrapper, model, coord)
+        if direction is not None:
+            literals.append(
+                cnf.literal(
+                    theory_wrapper.get_prop(
+                        name="rail_output", descriptor=direction, coord=coord
+                    )
+                )
+            )
+    return literals
+
+
+def _value(theory_wrapper, model, name, coord, descriptor=None) -> bool:
+    prop = theory_wrapper.get_prop(name=name, descriptor=descriptor, coord=coord)
+    return model.get(prop.name, False)
+
+
+def _output_direction(theory_wrapper, model, coord) -> Optional[str]:
+    for d in theory_wrapper.directions:
+        if _value(theory_wrapper, model, "rail_output", coord, d):
+            return d
+    return None
+
+
+def _input_direction(theory_wrapper, model, coord) -> Optional[str]:
+    for d in theory_wrapper.directions:
+        if _value(theory_wrapper, model, "rail_input", coord, d):
+            return d
+    return None
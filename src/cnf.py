@@ -0,0 +1,245 @@
+"""Conversion of NNF constraints into integer clauses
+
+The clauses use the same conventions as PySAT and DIMACS: variables are positive
+integers and a negative integer is the negation of that variable.
+"""
+from array import array
+from typing import TYPE_CHECKING, Hashable, Iterable, Optional, TextIO
+
+from nnf import NNF, And, Or, Var, config
+
+if TYPE_CHECKING:
+    from pysat.solvers import Solver
+
+Name = Hashable
+Clause = list[int]
+
+
+class CNF:
+    """Integer clauses built from NNF constraints with the Tseitin encoding
+
+    Named variables get ids in the order they are first seen. Auxiliary
+    variables introduced by the encoding have no name. A subformula object
+    shared between constraints, as logic.py builds them, is only encoded once.
+
+    If a PySAT solver is given, every clause is also added to it as soon as it
+    is made. With keep_clauses false they are only added to the solver, so the
+    clauses list stays empty. The subformulas encoded so far are still kept to
+    share them with later constraints, until forget_formulas is called.
+    """
+
+    def __init__(
+        self, solver: Optional["Solver"] = None, keep_clauses: bool = True
+    ) -> None:
+        self.clauses: list[Clause] = []
+        self.num_clauses = 0
+        self._solver = solver
+        self._keep_clauses = keep_clauses
+        self.ids: dict[Name, int] = dict()
+        self.names: list[Optional[Name]] = [None]
+        # Keyed by id() so that lookups don't compare formulas structurally. The
+        # node is kept alongside its literal so that its id can't be reused.
+        self._memo: dict[int, tuple[NNF, int]] = dict()
+        # What each auxiliary variable stands for, for phases: its id, then
+        # twice its number of children plus one for an And, then their
+        # literals, in the order the variables were allocated. Flat, so that it
+        # stays small next to the clauses of a streaming encoding.
+        self._definitions = array("i")
+
+    @property
+    def num_vars(self) -> int:
+        return len(self.names) - 1
+
+    def id(self, name: Name) -> int:
+        """Returns the id of the variable with the given name, allocating one if needed"""
+        if name not in self.ids:
+            self.ids[name] = len(self.names)
+            self.names.append(name)
+        return self.ids[name]
+
+    def aux(self) -> int:
+        """Allocates a new unnamed variable"""
+        self.names.append(None)
+        return len(self.names) - 1
+
+    def literal(self, var: Var) -> int:
+        """Returns the integer literal for a Var"""
+        return self.id(var.name) if var.true else -self.id(var.name)
+
+    def add(self, constraint: NNF) -> None:
+        """Adds clauses requiring the constraint to be true"""
+        # Iterative, and without simplify(), so deep formulas don't recurse
+        pending = [constraint]
+        while pending:
+            node = pending.pop()
+            if isinstance(node, Var):
+                self._emit([self.literal(node)])
+            elif isinstance(node, And):
+                pending.extend(node.children)
+            elif isinstance(node, Or):
+                # An empty Or is false and becomes the empty clause
+                self._emit(sorted({self.encode(c) for c in node.children}))
+            else:
+                raise TypeError(node)
+
+    def _emit(self, clause: Clause) -> None:
+        self.num_clauses += 1
+        if self._keep_clauses:
+            self.clauses.append(clause)
+        if self._solver is not None:
+            self._solver.add_clause(clause)
+
+    def extend(self, constraints: Iterable[NNF]) -> None:
+        for c in constraints:
+            self.add(c)
+
+    def forget_formulas(self) -> None:
+        """Drops the subformulas encoded so far, so that they can be freed.
+        Subformulas of constraints added later are encoded again, even where an
+        earlier constraint shared them."""
+        self._memo.clear()
+
+    def encode(self, node: NNF) -> int:
+        """Returns a literal equivalent to node, adding any clauses it needs"""
+        if isinstance(node, Var):
+            return self.literal(node)
+
+        # Iterative post-order traversal so deep formulas don't hit the recursion limit
+        memo = self._memo
+        stack = [node]
+        while stack:
+            current = stack[-1]
+            if id(current) in memo:
+                stack.pop()
+                continue
+            pending = [
+                c
+                for c in current.children
+                if not isinstance(c, Var) and id(c) not in memo
+            ]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            memo[id(current)] = (current, self._define(current))
+        return memo[id(node)][1]
+
+    def _define(self, node: NNF) -> int:
+        children = {
+            self.literal(c) if isinstance(c, Var) else self._memo[id(c)][1]
+            for c in node.children
+        }
+        if len(children) == 1:
+            [child] = children
+            return child
+
+        aux = self.aux()
+        kind = 2 * len(children) + isinstance(node, And)
+        self._definitions.extend((aux, kind, *children))
+        if isinstance(node, And):
+            # aux <-> (c1 & c2 & ...)
+            self._emit([aux] + [-c for c in children])
+            for c in children:
+                self._emit([-aux, c])
+        elif isinstance(node, Or):
+            # aux <-> (c1 | c2 | ...)
+            self._emit([-aux] + list(children))
+            for c in children:
+                self._emit([aux, -c])
+        else:
+            raise TypeError(node)
+        return aux
+
+    def phases(self, assignment: dict[Name, bool]) -> Clause:
+        """Returns literals giving each named variable in assignment its value,
+        and each auxiliary variable the value of the subformula it stands for.
+
+        This is a full model when the assignment is one, even if it no longer
+        satisfies the clauses, so it can seed a solver's phases after an edit.
+        Named variables missing from the assignment are taken as false for the
+        auxiliary ones. Auxiliary variables of clauses added with CNF.add are
+        covered, but not those of clauses copied from another CNF."""
+        values = [False] * len(self.names)
+        literals = []
+        for name, value in assignment.items():
+            if name in self.ids:
+                values[self.ids[name]] = bool(value)
+                literals.append(self.ids[name] if value else -self.ids[name])
+
+        def true(lit: int) -> bool:
+            return values[abs(lit)] == (lit > 0)
+
+        # Auxiliary variables are allocated after those of their children
+        definitions = self._definitions
+        i = 0
+        while i < len(definitions):
+            aux, kind = definitions[i], definitions[i + 1]
+            end = i + 2 + kind // 2
+            children = definitions[i + 2 : end]
+            values[aux] = (all if kind % 2 else any)(map(true, children))
+            literals.append(aux if values[aux] else -aux)
+            i = end
+        return literals
+
+    def solver(self, name: Optional[str] = None) -> "Solver":
+        """Returns a PySAT solver loaded with the clauses
+
+        The solver should be used as a context manager so that it gets deleted.
+        """
+        from pysat.solvers import Solver
+
+        if name is None:
+            name = config.pysat_solver
+        return Solver(name=name, bootstrap_with=self.clauses)
+
+    def decode(self, model: Iterable[int]) -> dict[Name, bool]:
+        """Converts a list of integer literals into a model over the named variables"""
+        names = self.names
+        return {
+            names[abs(lit)]: lit > 0
+            for lit in model
+            if abs(lit) < len(names) and names[abs(lit)] is not None
+        }
+
+    def var_map(self) -> dict[int, Name]:
+        """Returns a map from variable ids to names for every named variable"""
+        return {i: name for i, name in enumerate(self.names) if name is not None}
+
+    def write_dimacs(
+        self, fp: TextIO, comments: bool = True, units: Iterable[int] = ()
+    ) -> None:
+        """Writes the clauses in DIMACS CNF format
+
+        If comments is true each named variable is listed in a `c var` line.
+        Each literal in units is written as an extra unit clause.
+        """
+        units = list(units)
+        if comments:
+            self._write_var_comments(fp)
+        fp.write(f"p cnf {self.num_vars} {len(self.clauses) + len(units)}\n")
+        for clause in self.clauses:
+            fp.write(" ".join(map(str, clause)) + " 0\n")
+        for lit in units:
+            fp.write(f"{lit} 0\n")
+
+    def write_wcnf(
+        self, fp: TextIO, soft: Iterable[tuple[int, Clause]], comments: bool = True
+    ) -> None:
+        """Writes the clauses as hard clauses of a weighted (WCNF) MaxSAT instance
+
+        soft contains (weight, clause) pairs. The classic `p wcnf` header is used,
+        with hard clauses weighted one more than the total soft weight.
+        """
+        soft = list(soft)
+        top = sum(w for w, _ in soft) + 1
+        if comments:
+            self._write_var_comments(fp)
+        fp.write(f"p wcnf {self.num_vars} {len(self.clauses) + len(soft)} {top}\n")
+        for clause in self.clauses:
+            fp.write(f"{top} " + " ".join(map(str, clause)) + " 0\n")
+        for weight, clause in soft:
+            fp.write(f"{weight} " + " ".join(map(str, clause)) + " 0\n")
+
+    def _write_var_comments(self, fp: TextIO) -> None:
+        for i, name in self.var_map().items():
+            fp.write(f"c var {i} {name}\n")
@@ -0,0 +1,309 @@
+"""Compilation of integer clauses to d-DNNF with DSHARP"""
+import hashlib
+import json
+import math
+import os
+import subprocess
+import tempfile
+from typing import Hashable, Iterable, Optional, Sequence
+
+from nnf import NNF, And, Var, dsharp, false, true
+
+from .cnf import CNF
+
+DSHARP = "bin/dsharp"
+
+
+def compile_cnf(
+    cnf: CNF,
+    assumptions: Sequence[int] = (),
+    executable: str = DSHARP,
+    timeout: Optional[float] = None,
+    memory_limit: Optional[int] = None,
+) -> Optional[NNF]:
+    """Compiles the clauses, plus a unit clause for each assumption literal, to a
+    smooth d-DNNF over the cnf's variables
+
+    Named variables keep their names and auxiliary ones are labelled with their
+    id. DSHARP gets timeout seconds and, on POSIX, an address space of
+    memory_limit megabytes. Returns None if it runs out of either.
+    """
+    out = _run_dsharp(cnf, assumptions, executable, timeout, memory_limit)
+    if out is None:
+        return None
+    if out == _TRUE:
+        return true
+    if out == _FALSE:
+        return false
+
+    labels = {i: i if name is None else name for i, name in enumerate(cnf.names)}
+    result = dsharp.loads(out, var_labels=labels)
+    result.mark_deterministic()
+    NNF.decomposable.set(result, True)
+    return result
+
+
+def compile_circuit(
+    cnf: CNF,
+    assumptions: Sequence[int] = (),
+    executable: str = DSHARP,
+    timeout: Optional[float] = None,
+    memory_limit: Optional[int] = None,
+) -> Optional["Circuit"]:
+    """Like compile_cnf, but returns a Circuit"""
+    out = _run_dsharp(cnf, assumptions, executable, timeout, memory_limit)
+    if out is None:
+        return None
+    return Circuit(out, cnf.names)
+
+
+# DSHARP's format for the constants, as an And and an Or without children
+_TRUE = "nnf 1 0 0\nA 0\n"
+_FALSE = "nnf 1 0 0\nO 0 0\n"
+
+
+def _run_dsharp(
+    cnf: CNF,
+    assumptions: Sequence[int],
+    executable: str,
+    timeout: Optional[float],
+    memory_limit: Optional[int],
+) -> Optional[str]:
+    """Returns DSHARP's smooth d-DNNF for the clauses in its text format"""
+    if not cnf.clauses and not assumptions:
+        return _TRUE
+    if [] in cnf.clauses:
+        return _FALSE
+
+    args = [executable, "-smoothNNF"]
+    if timeout is not None and timeout >= 1:
+        # DSHARP only takes whole seconds, so it is also killed at the deadline
+        args.extend(["-t", str(math.floor(timeout))])
+
+    infd, infname = tempfile.mkstemp(suffix=".cnf", text=True)
+    outfd, outfname = tempfile.mkstemp(suffix=".nnf")
+    os.close(outfd)
+    try:
+        with open(infd, "w") as f:
+            cnf.write_dimacs(f, comments=False, units=assumptions)
+        try:
+            proc = subprocess.run(
+                args + ["-Fnnf", outfname, infname],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                universal_newlines=True,
+                timeout=timeout,
+                preexec_fn=_memory_limiter(memory_limit),
+            )
+        except subprocess.TimeoutExpired:
+            return None
+        with open(outfname) as f:
+            out = f.read()
+    finally:
+        os.remove(infname)
+        os.remove(outfname)
+
+    log = proc.stdout
+    if "TIMEOUT" in log:
+        return None
+    if proc.returncode != 0:
+        if memory_limit is not None:
+            # Allocation failures are the usual way DSHARP dies under a limit
+            return None
+        raise RuntimeError(f"DSHARP failed with code {proc.returncode}. Log:\n\n{log}")
+    if "Theory is unsat" in log:
+        return _FALSE
+    if "top node wasn't an AND node" in log:
+        # DSHARP writes a meaningless circuit when unit propagation alone finds
+        # a conflict, without saying that the theory is unsat
+        with cnf.solver() as solver:
+            if not solver.solve(assumptions=list(assumptions)):
+                return _FALSE
+        raise RuntimeError(f"Couldn't read DSHARP's output. Log:\n\n{log}")
+    if not out or out == "nnf 0 0 0\n":
+        raise RuntimeError(f"Couldn't read DSHARP's output. Log:\n\n{log}")
+    return out
+
+
+class Circuit:
+    """A smooth d-DNNF kept in DSHARP's node list, for repeated counting
+
+    Every query is a single pass over the nodes, so conditioning on literals and
+    counting doesn't need DSHARP again. Counts are over all of the cnf's
+    variables, including the auxiliary ones, which the clauses determine.
+
+    names are the names of the variables by id, as in CNF.names. The circuit
+    keeps them, so it doesn't depend on the numbering of any later CNF.
+    """
+
+    def __init__(self, text: str, names: Sequence[Optional[Hashable]]) -> None:
+        self.text = text
+        self.names = list(names)
+        self.num_vars = len(self.names) - 1
+        self.ids = {name: i for i, name in enumerate(self.names) if name is not None}
+        # (kind, args) in DSHARP's order, which lists children before parents.
+        # args is the literal of an L node, or the child indices of an A or O.
+        self.nodes: list[tuple[str, object]] = []
+        self.vars: set[int] = set()
+        lines = text.splitlines()[1:]
+        for line in lines:
+            kind, *args = line.split()
+            if kind == "L":
+                lit = int(args[0])
+                self.vars.add(abs(lit))
+                self.nodes.append((kind, lit))
+            elif kind == "A":
+                self.nodes.append((kind, [int(a) for a in args[1:]]))
+            elif kind == "O":
+                self.nodes.append((kind, [int(a) for a in args[2:]]))
+            else:
+                raise ValueError(f"can't parse d-DNNF line '{line}'")
+
+    def count(self, assignment: Optional[dict[Hashable, bool]] = None) -> int:
+        """Returns the number of models that agree with assignment, a map from
+        variable names to values"""
+        fixed = dict()
+        for name, value in (assignment or dict()).items():
+            if name not in self.ids:
+                raise ValueError(f"unknown variable {name!r}")
+            fixed[self.ids[name]] = bool(value)
+
+        # Variables that DSHARP dropped can take either value unless fixed
+        free = self.num_vars - len(self.vars)
+        free -= sum(1 for i in fixed if i not in self.vars)
+        return self._counts(fixed)[-1] * 2**free
+
+    def _counts(self, fixed: dict[int, bool]) -> list[int]:
+        """Returns the number of models of each node over its variables"""
+        counts = []
+        for kind, args in self.nodes:
+            if kind == "L":
+                value = fixed.get(abs(args))
+                counts.append(0 if value is not None and value != (args > 0) else 1)
+            elif kind == "A":
+                product = 1
+                for child in args:
+                    product *= counts[child]
+                counts.append(product)
+            else:
+                # Determinism makes the children's models disjoint
+                counts.append(sum(counts[child] for child in args))
+        return counts
+
+    def marginals(self) -> dict[Hashable, int]:
+        """Returns the number of models in which each named variable is true
+
+        This takes one pass up the circuit for the counts of its nodes and one
+        pass down for their derivatives. In a smooth d-DNNF the models in which
+        x is true are counted by the derivative with respect to x's leaves.
+        """
+        counts = self._counts(dict())
+        derivatives = [0] * len(self.nodes)
+        derivatives[-1] = 1
+        for i in reversed(range(len(self.nodes))):
+            kind, args = self.nodes[i]
+            derivative = derivatives[i]
+            if kind == "L" or not derivative:
+                continue
+            if kind == "O":
+                for child in args:
+                    derivatives[child] += derivative
+                continue
+            # Each child of an And is multiplied by the counts of its siblings
+            prefix = [1]
+            for child in args:
+                prefix.append(prefix[-1] * counts[child])
+            suffix = 1
+            for j in reversed(range(len(args))):
+                derivatives[args[j]] += derivative * prefix[j] * suffix
+                suffix *= counts[args[j]]
+
+        true_counts = dict()
+        for (kind, args), derivative in zip(self.nodes, derivatives):
+            if kind == "L" and args > 0:
+                true_counts[args] = true_counts.get(args, 0) + derivative
+
+        free = self.num_vars - len(self.vars)
+        marginals = dict()
+        for i, name in enumerate(self.names):
+            if name is None:
+                continue
+            if i in self.vars:
+                marginals[name] = true_counts.get(i, 0) * 2**free
+            else:
+                # A dropped variable is true in half of the models
+                marginals[name] = counts[-1] * 2 ** (free - 1)
+        return marginals
+
+    def save(self, path: str, key: str) -> None:
+        """Writes the circuit and its variable names to path, with a key such as
+        the fingerprint of the constraints it was compiled from"""
+        with open(path, "w", encoding="utf8") as f:
+            f.write(f"c {key}\n")
+            f.write(f"c {json.dumps(self.names)}\n")
+            f.write(self.text)
+
+    @classmethod
+    def load(cls, path: str, key: str) -> Optional["Circuit"]:
+        """Reads a circuit written by save, or returns None if it was saved with
+        another key"""
+        with open(path, encoding="utf8") as f:
+            if f.readline().split() != ["c", key]:
+                return None
+            names = json.loads(f.readline()[len("c ") :])
+            return cls(f.read(), names)
+
+
+def fingerprint(constraints: Iterable[NNF]) -> str:
+    """Returns a hash of the structure of the constraints, which is the same in
+    every run. hash() of a formula isn't, since Python randomises the hashes of
+    the strings naming its variables, and neither are the ids that CNF gives
+    variables, since they follow the iteration order of the formula's children.
+    """
+    # Structural hashes of subformulas by id(), with the node so its id can't
+    # be reused. Hashes of ints and of tuples of ints are the same in every run.
+    keys: dict[int, tuple[NNF, int]] = dict()
+    name_keys: dict[Hashable, int] = dict()
+
+    def key(node: NNF) -> int:
+        if type(node) is Var:
+            if node.name not in name_keys:
+                # 64 bits, so that thousands of names are unlikely to collide
+                digest = hashlib.blake2b(repr(node.name).encode(), digest_size=8)
+                name_keys[node.name] = int.from_bytes(digest.digest(), "big")
+            return 2 * name_keys[node.name] + node.true
+        return keys[id(node)][1]
+
+    digest = hashlib.sha256()
+    for constraint in constraints:
+        stack = [constraint]
+        while stack:
+            node = stack[-1]
+            if type(node) is Var or id(node) in keys:
+                stack.pop()
+                continue
+            pending = [
+                c for c in node.children if type(c) is not Var and id(c) not in keys
+            ]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            children = tuple(sorted(key(c) for c in node.children))
+            keys[id(node)] = (node, hash((type(node) is And, children)))
+        digest.update(f"{key(constraint)}\n".encode())
+    return digest.hexdigest()
+
+
+def _memory_limiter(memory_limit: Optional[int]):
+    """Returns a preexec_fn capping a child's address space, where supported"""
+    if memory_limit is None or os.name != "posix":
+        return None
+
+    def limit():
+        import resource
+
+        size = memory_limit * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (size, size))
+
+    return limit
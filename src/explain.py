@@ -0,0 +1,86 @@
+"""Explains why a board has no solution by finding the tiles responsible"""
+from typing import Any, Optional
+
+from .file_reader import check_data, data_tiles, tile_facts
+from .helpers import Coord
+from .theory import CosmicExpressTheory
+
+
+def explain(
+    data: dict[str, Any], allow_new_rails: bool = False
+) -> Optional[dict[Coord, str]]:
+    """Returns a minimal set of tiles whose contents make the board unsolvable
+
+    The tile facts that read_data would add as constraints are instead passed to
+    the solver as assumptions on top of the generic theory, so an unsatisfiable
+    core names tiles directly.
+
+    Returns a map from the coordinates of those tiles to their kind, or None if
+    the board is solvable.
+    """
+    check_data(data)
+
+    theory_wrapper = CosmicExpressTheory((data["rows"], data["cols"]), data["colors"])
+    cnf = theory_wrapper.theory.cnf()
+    assumptions = {
+        coord: [cnf.literal(literal) for literal in literals]
+        for coord, literals in tile_facts(
+            theory_wrapper, data, allow_new_rails
+        ).items()
+    }
+
+    with cnf.solver() as solver:
+        core = minimal_core(solver, assumptions)
+
+    if core is None:
+        return None
+    kinds = tile_kinds(data)
+    return {coord: kinds.get(coord, "empty") for coord in sorted(core)}
+
+
+def minimal_core(solver, assumptions: dict[Coord, list[int]]) -> Optional[set[Coord]]:
+    """Returns a minimal set of tiles whose assumption literals are unsatisfiable
+    together, or None if all of the assumptions are satisfiable.
+
+    The solver's unsatisfiable core is shrunk until dropping any one of its tiles
+    makes the rest satisfiable.
+    """
+    owners = {lit: coord for coord, lits in assumptions.items() for lit in lits}
+
+    def core_of(coords) -> Optional[set[Coord]]:
+        if solver.solve(assumptions=[l for c in coords for l in assumptions[c]]):
+            return None
+        return {owners[lit] for lit in solver.get_core() or []}
+
+    core = core_of(assumptions)
+    if core is None:
+        return None
+
+    # Deletion based minimisation. Any core found while checking a smaller set
+    # replaces the current one, which usually shrinks it by more than one tile.
+    for coord in sorted(core):
+        if coord not in core:
+            continue
+        smaller = core_of(core - {coord})
+        if smaller is not None:
+            core = smaller
+    return core
+
+
+def tile_kinds(data: dict[str, Any]) -> dict[Coord, str]:
+    """Returns a description of each non-empty tile, e.g. "alien 0" or "rail W-E" """
+    kinds = dict()
+    for coord, kind, color, directions in data_tiles(data):
+        if color is not None:
+            kind = f"{kind} {color}"
+        if directions is not None:
+            kind = f"{kind} {directions[0]}-{directions[1]}"
+        kinds[coord] = kind
+    return kinds
+
+
+def describe(explanation: dict[Coord, str]) -> str:
+    """Formats the result of explain for display"""
+    if not explanation:
+        return "the board is unsolvable regardless of its tiles"
+    return "\n".join(f"{kind} at {coord}" for coord, kind in explanation.items())
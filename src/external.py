@@ -0,0 +1,116 @@
+"""Runs external SAT/MaxSAT solver executables on an encoding"""
+import os
+import signal
+import subprocess
+import tempfile
+import threading
+from typing import Callable, Optional, Sequence
+
+from .lib204 import SAT, UNKNOWN, UNSAT, SolveResult
+
+_STATUS_LINES = {
+    "SATISFIABLE": SAT,
+    "OPTIMUM FOUND": SAT,
+    "UNSATISFIABLE": UNSAT,
+    "UNKNOWN": UNKNOWN,
+}
+
+
+def run_solver(
+    encoding,
+    executable: str,
+    timeout: Optional[float] = None,
+    args: Sequence[str] = (),
+    on_line: Optional[Callable[[str], None]] = None,
+    soft=None,
+):
+    """Runs a solver binary on the encoding and maps its model back to proposition names
+
+    The encoding is written to a temporary DIMACS file (or WCNF file if soft, a
+    list of (weight, NNF) pairs, is given) that is passed as the last argument.
+    The solver must use the SAT competition output format: an `s` status line
+    and `v` lines holding the model. Every line of output is passed to on_line
+    as it arrives. A solver still running after timeout seconds is killed.
+
+    Returns a SolveResult whose status is one of SAT, UNSAT or UNKNOWN and whose
+    model is None unless a model was printed.
+    """
+    cnf = encoding.cnf()
+    suffix = ".cnf" if soft is None else ".wcnf"
+    fd, path = tempfile.mkstemp(suffix=suffix, text=True)
+    try:
+        with open(fd, "w") as f:
+            if soft is None:
+                encoding.to_dimacs(f)
+            else:
+                encoding.to_wcnf(f, soft)
+
+        proc = subprocess.Popen(
+            [executable, *args, path],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+            # Own process group so a timeout also kills any helpers the solver spawns
+            start_new_session=os.name == "posix",
+        )
+        timed_out = threading.Event()
+
+        def kill():
+            timed_out.set()
+            try:
+                if os.name == "posix":
+                    os.killpg(proc.pid, signal.SIGKILL)
+                else:
+                    proc.kill()
+            except ProcessLookupError:
+                # The solver finished just as the timer fired
+                pass
+
+        timer = None
+        if timeout is not None:
+            timer = threading.Timer(timeout, kill)
+            timer.start()
+
+        status = UNKNOWN
+        literals = []
+        try:
+            for line in proc.stdout:
+                if on_line is not None:
+                    on_line(line.rstrip("\n"))
+                if line.startswith("s "):
+                    status = _STATUS_LINES.get(line[2:].strip(), UNKNOWN)
+                elif line.startswith("v "):
+                    literals.extend(
+                        _parse_values(line[2:], cnf.num_vars, soft is not None)
+                    )
+            proc.wait()
+        finally:
+            if timer is not None:
+                timer.cancel()
+    finally:
+        os.remove(path)
+
+    if timed_out.is_set() and status == UNKNOWN:
+        return SolveResult(UNKNOWN)
+    if status != SAT or not literals:
+        return SolveResult(status)
+    return SolveResult(status, cnf.decode(literals))
+
+
+def _parse_values(values: str, num_vars: int, maxsat: bool = False) -> list[int]:
+    """Parses the contents of a `v` line into integer literals
+
+    Both the usual list of literals and the MaxSAT evaluation's bit string
+    (one 0/1 character per variable) are understood. A lone token like 10 is a
+    literal unless the solver is a MaxSAT solver or the token has a character
+    for every variable.
+    """
+    tokens = values.split()
+    if (
+        len(tokens) == 1
+        and len(tokens[0]) > 1
+        and set(tokens[0]) <= {"0", "1"}
+        and (maxsat or len(tokens[0]) == num_vars)
+    ):
+        return [i if bit == "1" else -i for i, bit in enumerate(tokens[0], start=1)]
+    return [int(t) for t in tokens if t != "0"]
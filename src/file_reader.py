@@ -1,86 +1,144 @@
-from typing import Any, TextIO
+from typing import TYPE_CHECKING, Any, Iterator, Optional, TextIO
 
-from nnf import And
+from nnf import Var
 
-from src.xml_parser import import_xml
+from src.xml_parser import Color, Directions, import_xml
+from .helpers import Coord
 from .lib204 import Encoding
 from .theory import CosmicExpressTheory
-from . import logic
+from . import helpers
+
+if TYPE_CHECKING:
+    # Only needed for annotations; importing it would pull in NumPy
+    from .board import Board
 
 
 def read_file(file: TextIO, allow_new_rails: bool = False) -> Encoding:
     # Reverse the order of rows since row 0 refers to the bottom row
     xml = file.read()
 
-    data = import_xml(xml)
+    return read_data(import_xml(xml), allow_new_rails)
+
+
+def read_board(board: "Board", allow_new_rails: bool = False) -> Encoding:
+    """Builds the encoding for a board.Board"""
+    return read_data(board.to_data(), allow_new_rails)
+
+
+def read_data(
+    data: dict[str, Any],
+    allow_new_rails: bool = False,
+    color_encoding: str = "onehot",
+    streaming: bool = False,
+) -> Encoding:
+    """Builds the encoding for a board in the format returned by import_xml.
+    color_encoding is one of theory.COLOR_ENCODINGS. With streaming, the
+    encoding only keeps its constraints as clauses in a solver (see Encoding)."""
+    check_data(data)
+
+    theory_wrapper = CosmicExpressTheory(
+        (data["rows"], data["cols"]),
+        data["colors"],
+        color_encoding=color_encoding,
+        streaming=streaming,
+    )
+    theory = theory_wrapper.theory
+
+    for coord, literals in tile_facts(theory_wrapper, data, allow_new_rails).items():
+        with theory.tagged("board", coord):
+            for literal in literals:
+                theory.add_constraint(literal)
+
+    return theory
+
 
+def check_data(data: dict[str, Any]) -> None:
     if len(data["entrances"]) != 1:
         raise ValueError("there must be exactly one entrance")
     if len(data["exits"]) != 1:
         raise ValueError("there must be exactly one exit")
 
-    theory_wrapper = CosmicExpressTheory((data["rows"], data["cols"]), data["colors"])
-    theory = theory_wrapper.theory
-
-    non_empty_coords = []
 
+def data_tiles(
+    data: dict[str, Any]
+) -> Iterator[tuple[Coord, str, Optional[Color], Optional[Directions]]]:
+    """Yields (coord, kind, color, directions) for every non-empty tile of the board"""
     for coord in data["entrances"]:
-        theory.add_constraint(theory_wrapper.get_prop(name="entrance", coord=coord))
-        non_empty_coords.append(coord)
-
+        yield coord, "entrance", None, None
     for coord in data["exits"]:
-        theory.add_constraint(theory_wrapper.get_prop(name="exit", coord=coord))
-        non_empty_coords.append(coord)
-
+        yield coord, "exit", None, None
     for color, coord in data["aliens"]:
-        theory.add_constraint(
-            theory_wrapper.get_prop(name="alien_color", descriptor=color, coord=coord)
-        )
-        non_empty_coords.append(coord)
-
+        yield coord, "alien", color, None
     for color, coord in data["houses"]:
-        theory.add_constraint(
-            theory_wrapper.get_prop(name="house_color", descriptor=color, coord=coord)
+        yield coord, "house", color, None
+    for coord in data["obstacles"]:
+        yield coord, "obstacle", None, None
+    for directions, coord in data["rails"]:
+        yield coord, "rail", None, directions
+
+
+def tile_facts(
+    theory_wrapper: CosmicExpressTheory,
+    data: dict[str, Any],
+    allow_new_rails: bool = False,
+) -> dict[Coord, list[Var]]:
+    """Returns the literals fixing the contents of each tile of the board.
+
+    These are the unit constraints that turn the generic theory into the theory
+    of a specific board."""
+    facts = {coord: [] for coord in helpers.all_coords(theory_wrapper.size)}
+
+    for coord, kind, color, directions in data_tiles(data):
+        facts[coord].extend(
+            tile_literals(theory_wrapper, coord, kind, color, directions)
         )
-        non_empty_coords.append(coord)
 
-    for coord in data["obstacles"]:
-        theory.add_constraint(theory_wrapper.get_prop(name="obstacle", coord=coord))
-        non_empty_coords.append(coord)
+    for coord, literals in facts.items():
+        if not literals:
+            literals.extend(
+                tile_literals(
+                    theory_wrapper, coord, "empty", allow_new_rails=allow_new_rails
+                )
+            )
 
-    for directions, coord in data["rails"]:
-        theory.add_constraint(
+    return facts
+
+
+def tile_literals(
+    theory_wrapper: CosmicExpressTheory,
+    coord: Coord,
+    kind: str,
+    color: Optional[Color] = None,
+    directions: Optional[Directions] = None,
+    allow_new_rails: bool = False,
+) -> list[Var]:
+    """Returns the literals fixing the tile at coord to hold a single item.
+    kind is one of entrance, exit, alien, house, obstacle, rail or empty."""
+    if kind in ("entrance", "exit", "obstacle"):
+        return [theory_wrapper.get_prop(name=kind, coord=coord)]
+    if kind in ("alien", "house"):
+        return theory_wrapper.color_literals(
+            name=f"{kind}_color", color=color, coord=coord
+        )
+    if kind == "rail":
+        return [
             theory_wrapper.get_prop(
                 name="rail_input", descriptor=directions[0], coord=coord
-            )
-        )
-        theory.add_constraint(
+            ),
             theory_wrapper.get_prop(
                 name="rail_output", descriptor=directions[1], coord=coord
-            )
-        )
-        theory.add_constraint(theory_wrapper.get_prop(name="rail", coord=coord))
-        non_empty_coords.append(coord)
-
-    for c in range(data["cols"]):
-        for r in range(data["rows"]):
-            if (c, r) not in non_empty_coords:
-                coord = (c, r)
-                theory.add_constraint(
-                    logic.none_of(
-                        theory_wrapper.get_prop(name="alien", coord=coord),
-                        theory_wrapper.get_prop(name="house", coord=coord),
-                        theory_wrapper.get_prop(name="obstacle", coord=coord),
-                        theory_wrapper.get_prop(name="entrance", coord=coord),
-                        theory_wrapper.get_prop(name="exit", coord=coord),
-                    )
-                )
-                if not allow_new_rails:
-                    theory.add_constraint(
-                        theory_wrapper.get_prop(name="rail", coord=coord).negate()
-                    )
-
-    return theory
+            ),
+            theory_wrapper.get_prop(name="rail", coord=coord),
+        ]
+    if kind == "empty":
+        literals = [
+            theory_wrapper.get_prop(name=name, coord=coord).negate()
+            for name in ("alien", "house", "obstacle", "entrance", "exit")
+        ]
+        if not allow_new_rails:
+            literals.append(theory_wrapper.get_prop(name="rail", coord=coord).negate())
+        return literals
+    raise ValueError(f"unknown tile kind '{kind}'")
 
 
 if __name__ == "__main__":
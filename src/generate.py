@@ -0,0 +1,145 @@
+"""Generates puzzles with exactly one solution
+
+A board starts as a border of obstacles with the entrance on its left side and
+the exit on its right, and pairs of aliens and houses are placed on random
+tiles where the board stays solvable. Then, while two track layouts solve the
+board, a tile that only the second layout uses is blocked with an obstacle, or,
+if there is none, a rail of the first layout is placed on the board. Either way
+the first layout still solves the board and the second doesn't, so every step
+removes a solution and the board ends up with a unique one.
+
+Everything is solved on one session.Session, so each step only swaps the
+assumptions of the tile that changed.
+
+Usage: python -m src.generate [--colors N] [--pairs N] [--seed S] ROWS COLS [OUT]
+
+writes the puzzle's xml to OUT, or prints it.
+"""
+import random
+import sys
+from typing import Any, Optional
+
+from .helpers import Coord
+from .session import EMPTY_TILE, Session
+from .xml_parser import Directions, export_xml
+from . import helpers
+
+
+def generate(
+    size: tuple[int, int],
+    num_colors: int = 1,
+    pairs: int = 1,
+    seed: Optional[int] = None,
+) -> Optional[dict[str, Any]]:
+    """Returns a board of the given (rows, cols) size with pairs aliens and
+    houses of each color and a unique solution, in the format returned by
+    import_xml. Returns None if no tiles are left where another alien and
+    house keep the board solvable."""
+    rows, cols = size
+    if rows < 3 or cols < 3:
+        raise ValueError("boards need at least 3 rows and 3 columns")
+    rng = random.Random(seed)
+
+    with Session(size, num_colors) as session:
+        for x, y in helpers.all_coords(size):
+            if x in (0, cols - 1) or y in (0, rows - 1):
+                session.set_tile((x, y), "obstacle")
+        session.set_tile((0, rng.randrange(1, rows - 1)), "entrance")
+        session.set_tile((cols - 1, rng.randrange(1, rows - 1)), "exit")
+
+        interior = [(x, y) for x in range(1, cols - 1) for y in range(1, rows - 1)]
+        rng.shuffle(interior)
+        for color in range(num_colors):
+            for _ in range(pairs):
+                if not _place_pair(session, interior, color):
+                    return None
+
+        while True:
+            layouts = session.layouts(2, allow_new_rails=True)
+            if len(layouts) == 1:
+                return session.to_data()
+            first, second = (_rails(session, layout) for layout in layouts)
+            extra = [coord for coord in second if coord not in first]
+            if extra:
+                session.set_tile(rng.choice(extra), "obstacle")
+                continue
+            differ = [
+                coord
+                for coord, directions in first.items()
+                if second.get(coord) != directions
+                and session.tiles[coord] == EMPTY_TILE
+            ]
+            coord = rng.choice(differ)
+            session.set_tile(coord, "rail", directions=first[coord])
+
+
+def _place_pair(session: Session, tiles: list[Coord], color: int) -> bool:
+    """Puts an alien and a house of the color on two of tiles that keep the
+    board solvable, trying them from the end, and removes those two from
+    tiles. An alien is kept while other tiles are tried for its house, and
+    False is only returned once every pair of tiles has been tried."""
+    for i in reversed(range(len(tiles))):
+        alien = tiles[i]
+        session.set_tile(alien, "alien", color)
+        for j in reversed(range(len(tiles))):
+            if j == i:
+                continue
+            house = tiles[j]
+            session.set_tile(house, "house", color)
+            if session.layouts(1, allow_new_rails=True):
+                del tiles[max(i, j)], tiles[min(i, j)]
+                return True
+            session.set_tile(house, *EMPTY_TILE)
+        session.set_tile(alien, *EMPTY_TILE)
+    return False
+
+
+def _rails(session: Session, literals: set[int]) -> dict[Coord, Directions]:
+    """Returns the directions of the rail on each tile of a model"""
+    rails = dict()
+    for coord in helpers.all_coords(session.size):
+        directions = [
+            direction
+            for name in ("rail_input", "rail_output")
+            for direction in "NESW"
+            if session.cnf.literal(
+                session.theory_wrapper.get_prop(
+                    name=name, descriptor=direction, coord=coord
+                )
+            )
+            in literals
+        ]
+        if len(directions) == 2:
+            rails[coord] = (directions[0], directions[1])
+    return rails
+
+
+def main(argv: list[str]) -> None:
+    argv = list(argv)
+    options = dict(colors=1, pairs=1, seed=None)
+    for option in options:
+        if f"--{option}" in argv:
+            i = argv.index(f"--{option}")
+            options[option] = int(argv[i + 1])
+            del argv[i : i + 2]
+    rows, cols, *out = argv
+
+    data = generate(
+        (int(rows), int(cols)), options["colors"], options["pairs"], options["seed"]
+    )
+    if data is None:
+        print(
+            "Placing the aliens and houses failed: no tiles are left where "
+            "another pair keeps the board solvable"
+        )
+        sys.exit(1)
+    xml = export_xml(**data)
+    if out:
+        with open(out[0], "w", encoding="utf8") as f:
+            f.write(xml)
+    else:
+        print(xml)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,19 +1,45 @@
 import tkinter as tk
-from typing import Any
+from typing import Any, Optional
 
 from src.xml_parser import Color, Coord, Directions, export_xml
 
 from .tiles import Alien, Empty, Entrance, Exit, House, Obstacle, Rail, Tile
 
 
+def tile_contents(
+    tile: Tile,
+) -> tuple[str, Optional[Color], Optional[Directions]]:
+    """Returns the (kind, color, directions) of a tile as used by session.Session"""
+    if isinstance(tile, Alien):
+        return "alien", tile.color, None
+    if isinstance(tile, House):
+        return "house", tile.color, None
+    if isinstance(tile, Rail):
+        return "rail", None, (tile.in_direction, tile.out_direction)
+    if isinstance(tile, Entrance):
+        return "entrance", None, None
+    if isinstance(tile, Exit):
+        return "exit", None, None
+    if isinstance(tile, Obstacle):
+        return "obstacle", None, None
+    return "empty", None, None
+
+
 class GridDisplay(tk.Frame):
     grid_items: dict[tuple[int, int], Tile]
 
     def __init__(
-        self, parent, create_tile, size: tuple[int, int] = (5, 5), *args, **kwargs
+        self,
+        parent,
+        create_tile,
+        size: tuple[int, int] = (5, 5),
+        on_change=None,
+        *args,
+        **kwargs
     ):
         super().__init__(parent, *args, **kwargs)
         self.create_tile = create_tile
+        self.on_change = on_change
         self.grid_items = dict()
 
         self.set_grid_size(size)
@@ -55,6 +81,8 @@ class GridDisplay(tk.Frame):
             self.grid_items[coord] = tile_type
             self.add_grid_item(tile_type, coord)
             old_widget.destroy()
+            if self.on_change is not None:
+                self.on_change(coord, tile_type)
 
         return f
 
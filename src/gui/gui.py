@@ -1,11 +1,9 @@
-import io
 import tkinter as tk
 from tkinter.messagebox import showerror
 import tkinter.filedialog as filedialog
 from src import xml_parser
-from src.file_reader import read_file
 
-from src.gui.grid import GridDisplay
+from src.gui.grid import GridDisplay, tile_contents
 from src.gui.tile_settings import TileSettings
 from src.gui.tiles import COLORS, Rail
 
@@ -14,12 +12,18 @@ class Application(tk.Frame):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.parent = parent
+        self.session = None
+        # The last solution found, which the next solve starts from
+        self.last_solution = None
         self.pack()
         self.create_widgets()
 
     def create_widgets(self):
         self.grid_display = GridDisplay(
-            self, create_tile=self._create_tile, size=(5, 5)
+            self,
+            create_tile=self._create_tile,
+            on_change=self._handle_tile_change,
+            size=(5, 5),
         )
         self.grid_display.pack(side=tk.LEFT, padx=20, pady=20)
 
@@ -62,10 +66,27 @@ class Application(tk.Frame):
             text="Generate solution",
             command=self._handle_generate_solution,
         ).grid(row=1, column=0)
+        tk.Button(
+            theory_frame,
+            text="Show track likelihood",
+            command=self._handle_show_heatmap,
+        ).grid(row=2, column=0)
+
+        engine_frame = tk.Frame(right_panel)
+        engine_frame.pack(pady=10)
+        tk.Label(engine_frame, text="Engine").grid(row=0, column=0)
+        self.engine = tk.StringVar(value="sat")
+        for column, (text, value) in enumerate(
+            (("SAT", "sat"), ("Path search", "search")), start=1
+        ):
+            tk.Radiobutton(
+                engine_frame, text=text, variable=self.engine, value=value
+            ).grid(row=0, column=column)
 
     def _handle_set_size(self):
         size = int(self.rows_entry.get()), int(self.cols_entry.get())
         self.grid_display.set_grid_size(size)
+        self._sync_session()
 
     def _handle_import(self):
         try:
@@ -77,6 +98,7 @@ class Application(tk.Frame):
             xml = f.read()
             data = xml_parser.import_xml(xml)
             self.grid_display.import_(**data)
+            self._sync_session()
             f.close()
         except Exception as e:
             showerror("Error", str(e))
@@ -99,7 +121,111 @@ class Application(tk.Frame):
     def _create_tile(self, parent):
         return self.tile_settings.get_tile(parent)
 
+    def _get_session(self):
+        """Returns a session holding the current grid, building one if needed"""
+        self._sync_session()
+        if self.session is None:
+            # Imported on first use so the editor opens without loading the solver
+            from src.session import Session
+
+            contents = {
+                coord: tile_contents(tile)
+                for coord, tile in self.grid_display.grid_items.items()
+            }
+            colors = 1 + max(
+                (color for _, color, _ in contents.values() if color is not None),
+                default=0,
+            )
+            self.session = Session(self.grid_display.size, colors)
+            for coord, tile in contents.items():
+                self.session.set_tile(coord, *tile)
+        return self.session
+
+    def _sync_session(self):
+        """Copies every tile into the session, dropping it if it no longer fits"""
+        for coord, tile in self.grid_display.grid_items.items():
+            self._handle_tile_change(coord, tile)
+
+    def _handle_tile_change(self, coord, tile):
+        if self.session is None:
+            return
+        try:
+            if self.session.size != self.grid_display.size:
+                raise ValueError("grid size changed")
+            self.session.set_tile(coord, *tile_contents(tile))
+        except ValueError:
+            # The session can't represent the tile, so build a new one when needed
+            self.session.close()
+            self.session = None
+
+    def _show_unsolvable(self, session, allow_new_rails: bool):
+        """Highlights the tiles that make the board unsolvable and reports them"""
+        from src.explain import describe
+
+        explanation = session.explain(allow_new_rails)
+        for coord in explanation or {}:
+            self.grid_display.grid_items[coord].set_highlighted(True)
+        showerror(
+            "Error",
+            "board is not solvable\n\nConflicting tiles:\n" + describe(explanation),
+        )
+
+    def _clear_highlights(self):
+        for tile in self.grid_display.grid_items.values():
+            if tile.highlighted:
+                tile.set_highlighted(False)
+            if tile.heat is not None:
+                tile.set_heat(None)
+
+    def _handle_show_heatmap(self):
+        """Shades each tile by the fraction of solutions with a rail on it"""
+        from src.heatmap import session_marginals
+
+        self._clear_highlights()
+        session = self._get_session()
+        try:
+            marginals = session_marginals(session, allow_new_rails=True)
+        except ValueError as e:
+            showerror("Error", str(e))
+            return
+        if marginals is None:
+            self._show_unsolvable(session, True)
+            return
+        for coord, tile in self.grid_display.grid_items.items():
+            tile.set_heat(float(marginals.rail[coord]))
+
+    def _solve(self, allow_new_rails: bool):
+        """Solves the grid with the selected engine. Returns None after reporting
+        the problem if there is no solution."""
+        if self.engine.get() == "search":
+            from src.search import search
+
+            try:
+                data = xml_parser.import_xml(self.grid_display.export())
+                solution = search(data, allow_new_rails)
+            except ValueError as e:
+                showerror("Error", str(e))
+                return None
+            if solution is None:
+                showerror("Error", "board is not solvable")
+            return solution
+
+        session = self._get_session()
+        try:
+            solution = session.solve(
+                allow_new_rails=allow_new_rails, hint=self.last_solution
+            )
+        except ValueError as e:
+            showerror("Error", str(e))
+            return None
+        if solution is None:
+            self._show_unsolvable(session, allow_new_rails)
+        else:
+            self.last_solution = solution
+        return solution
+
     def _handle_check_solution(self):
+        self._clear_highlights()
         # Clear rail colors
         for tile in self.grid_display.grid_items.values():
             if isinstance(tile, Rail):
@@ -107,18 +233,10 @@ class Application(tk.Frame):
                 tile.out_color = None
                 tile.reload()
 
-        data = io.StringIO()
-        xml = self.grid_display.export()
-        data.write(xml)
-        data.seek(0)
-
-        T = read_file(data)
-        if not T.is_satisfiable():
-            showerror("Error", "board is not solvable")
+        solution = self._solve(False)
+        if solution is None:
             return
 
-        solution = T.solve()
-
         train_states = [k for k, v in solution.items() if v and k.startswith("train")]
 
         for k in train_states:
@@ -137,6 +255,7 @@ class Application(tk.Frame):
             tile.reload()
 
     def _handle_generate_solution(self):
+        self._clear_highlights()
         # Clear rail colors
         for tile in self.grid_display.grid_items.values():
             if isinstance(tile, Rail):
@@ -144,18 +263,10 @@ class Application(tk.Frame):
                 tile.out_color = None
                 tile.reload()
 
-        data = io.StringIO()
-        xml = self.grid_display.export()
-        data.write(xml)
-        data.seek(0)
-
-        T = read_file(data, True)
-        if not T.is_satisfiable():
-            showerror("Error", "board is not solvable")
+        solution = self._solve(True)
+        if solution is None:
             return
 
-        solution = T.solve()
-
         rail_ins = {
             k.split(":")[1]: k.split(":")[0]
             for k, v in solution.items()
@@ -203,5 +314,6 @@ class Application(tk.Frame):
                 self.grid_display, rail_in_dir, rail_out_dir, in_color, out_color
             )
             self.grid_display.grid_items[coord] = tile
+            self._handle_tile_change(coord, tile)
 
         self.grid_display.create_layout()
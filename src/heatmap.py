@@ -0,0 +1,89 @@
+"""How likely each tile is to hold track, over all solutions of a board
+
+The board is compiled to a d-DNNF once, and Circuit.marginals counts the
+solutions in which every proposition is true in a single pass, instead of
+counting once per proposition like Encoding.likelihood does.
+
+Usage: python -m src.heatmap FILE
+"""
+import sys
+from typing import Any, NamedTuple, Optional
+
+import numpy as np
+
+from .board import DIRECTIONS
+from .ddnnf import Circuit, compile_circuit
+from .file_reader import check_data, read_data
+from . import helpers
+
+
+class Marginals(NamedTuple):
+    """Fractions of the solutions in which each proposition is true
+
+    Arrays are indexed by (x, y) like board.Board. rail_input and rail_output
+    have an extra leading axis over the directions N, E, S, W.
+    """
+
+    count: int
+    rail: np.ndarray
+    rail_input: np.ndarray
+    rail_output: np.ndarray
+
+
+def circuit_marginals(circuit: Circuit, size: tuple[int, int]) -> Optional[Marginals]:
+    """Returns the marginals of a board's compiled theory, or None if the board
+    has no solutions"""
+    count = circuit.count()
+    if count == 0:
+        return None
+    true_counts = circuit.marginals()
+    rows, cols = size
+
+    def layer(key):
+        fractions = np.zeros((cols, rows))
+        for x, y in helpers.all_coords(size):
+            fractions[x, y] = true_counts.get(f"{key}:({x},{y})", 0) / count
+        return fractions
+
+    return Marginals(
+        count,
+        layer("rail"),
+        np.stack([layer(f"rail_input_{d}") for d in DIRECTIONS]),
+        np.stack([layer(f"rail_output_{d}") for d in DIRECTIONS]),
+    )
+
+
+def board_marginals(
+    data: dict[str, Any], allow_new_rails: bool = True
+) -> Optional[Marginals]:
+    """Returns the marginals of a board in the format returned by import_xml"""
+    encoding = read_data(data, allow_new_rails)
+    return circuit_marginals(encoding.compiled(), (data["rows"], data["cols"]))
+
+
+def session_marginals(session, allow_new_rails: bool = True) -> Optional[Marginals]:
+    """Like board_marginals for the board held by a session.Session, reusing its
+    clauses with the tiles as unit clauses"""
+    check_data(session.to_data())
+    circuit = compile_circuit(session.cnf, session.assumptions(allow_new_rails))
+    return circuit_marginals(circuit, session.size)
+
+
+def main(argv: list[str]) -> None:
+    from .xml_parser import import_xml
+
+    [file] = argv
+    with open(file, encoding="utf8") as f:
+        data = import_xml(f.read())
+    marginals = board_marginals(data)
+    if marginals is None:
+        print("The board has no solutions")
+        return
+    print(f"{marginals.count} solutions. Percentage with a rail on each tile:")
+    # Print the top row first, like the GUI
+    for y in reversed(range(data["rows"])):
+        print(" ".join(f"{100 * p:5.1f}" for p in marginals.rail[:, y]))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,7 +1,11 @@
+from functools import lru_cache
 from itertools import product
-from typing import Generator
+from typing import TYPE_CHECKING, Generator, NamedTuple
 from nnf import Var, false
 
+if TYPE_CHECKING:
+    import numpy as np
+
 Coord = tuple[int, int]
 
 
@@ -34,6 +38,12 @@ def get_adjacent(coord: Coord) -> Generator[Coord, None, None]:
         yield offset_coord
 
 
+def step(coord: Coord, direction: str) -> Coord:
+    """Returns the coordinate one tile away from coord in the given direction"""
+    offset = {"N": (0, 1), "E": (1, 0), "S": (0, -1), "W": (-1, 0)}[direction]
+    return coord[0] + offset[0], coord[1] + offset[1]
+
+
 def direction_between(p1: Coord, p2: Coord):
     """Returns a string representing the direction of a path from p1 to p2"""
     if p1 == p2:
@@ -55,10 +65,77 @@ def opposite_direction(direction):
     return {"N": "S", "E": "W", "S": "N", "W": "E"}[direction]
 
 
+DIRECTION_CODES = {"N": 0, "E": 1, "S": 2, "W": 3}
+
+
+class NeighbourTable(NamedTuple):
+    """The in-bounds neighbours of every tile of a grid of one size
+
+    Tiles are numbered by their position in all_coords. neighbours, directions
+    and opposites have a row per tile and a column per neighbour, in the order
+    of get_directions, holding the neighbour's id, the direction from the tile
+    to it and the direction back, each as a code from DIRECTION_CODES. Rows are
+    padded with -1 past the tile's last neighbour.
+
+    The same neighbours are also kept as tuples by coordinate, since theory
+    construction looks them up one tile at a time.
+    """
+
+    coords: list[Coord]
+    neighbours: "np.ndarray"
+    directions: "np.ndarray"
+    opposites: "np.ndarray"
+    # (direction, opposite direction, neighbour) for each tile, like get_directions
+    steps: dict[Coord, tuple[tuple[str, str, Coord], ...]]
+    # The neighbours alone, like get_adjacent
+    adjacent: dict[Coord, tuple[Coord, ...]]
+
+
+@lru_cache(maxsize=None)
+def neighbour_table(size: tuple[int, int]) -> NeighbourTable:
+    """Returns the NeighbourTable of a grid, built once for each size"""
+    import numpy as np
+
+    rows, cols = size
+    x, y = np.meshgrid(np.arange(cols), np.arange(rows), indexing="ij")
+    x, y = x.ravel(), y.ravel()
+    offsets = np.array([(0, 1), (1, 0), (0, -1), (-1, 0)])
+    nx = x[:, None] + offsets[:, 0]
+    ny = y[:, None] + offsets[:, 1]
+    inside = (0 <= nx) & (nx < cols) & (0 <= ny) & (ny < rows)
+
+    # Move each tile's in-bounds neighbours to the front of its row, in order
+    order = np.argsort(~inside, axis=1, kind="stable")
+    inside = np.take_along_axis(inside, order, axis=1)
+    ids = np.take_along_axis(nx * rows + ny, order, axis=1)
+    codes = np.broadcast_to(np.arange(4), order.shape)
+    directions = np.take_along_axis(codes, order, axis=1)
+    neighbours = np.where(inside, ids, -1)
+    opposites = np.where(inside, (directions + 2) % 4, -1)
+    directions = np.where(inside, directions, -1)
+
+    coords = list(all_coords(size))
+    names = "NESW"
+    steps = {
+        coord: tuple(
+            (names[d], names[o], coords[n])
+            for n, d, o in zip(row_n, row_d, row_o)
+            if n >= 0
+        )
+        for coord, row_n, row_d, row_o in zip(
+            coords, neighbours.tolist(), directions.tolist(), opposites.tolist()
+        )
+    }
+    adjacent = {coord: tuple(step[2] for step in steps[coord]) for coord in coords}
+    return NeighbourTable(coords, neighbours, directions, opposites, steps, adjacent)
+
+
 def simple_cache(f):
-    cache = dict()
+    """Caches a method's results per instance, keyed on its positional arguments"""
+    attribute = f"_{f.__name__}_cache"
 
     def wrapper(self, *args):
+        cache = self.__dict__.setdefault(attribute, dict())
         if args in cache:
             return cache[args]
 
@@ -1,41 +1,350 @@
-from nnf import And, dsharp, NNF, config
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterable, NamedTuple, Optional
+
+from nnf import And, dsharp, NNF, Var, config
+
+from .cnf import CNF
+
+SAT = "SAT"
+UNSAT = "UNSAT"
+UNKNOWN = "UNKNOWN"
+
+
+class SolveStats(NamedTuple):
+    """How much work a solver call took, and the size of the CNF it solved
+
+    conflicts, decisions, propagations and restarts are the call's share of
+    PySAT's accum_stats, which are 0 for solvers that don't count them. time is
+    in seconds.
+    """
+
+    conflicts: int = 0
+    decisions: int = 0
+    propagations: int = 0
+    restarts: int = 0
+    time: float = 0.0
+    vars: int = 0
+    clauses: int = 0
+
+
+class SolveResult(NamedTuple):
+    """The outcome of a solver call that may have run out of budget.
+    model is only set when status is SAT. stats is set by calls that measure
+    them."""
+
+    status: str
+    model: Optional[dict] = None
+    stats: Optional[SolveStats] = None
+
+
+class ConstraintStats(NamedTuple):
+    """The size of a group of constraints
+
+    vars counts distinct variables. clauses counts the CNF clauses added for the
+    constraints, where clauses defining a subformula shared with an earlier
+    constraint were already charged to that constraint.
+    """
+
+    constraints: int = 0
+    vars: int = 0
+    clauses: int = 0
+    nodes: int = 0
+
+
+class CountResult(NamedTuple):
+    """A model count. If exact is false the count is only a lower bound."""
+
+    count: int
+    exact: bool
+
+
+def solve_within(solver, assumptions=(), time_limit=None, conflict_limit=None):
+    """Runs a PySAT solver with optional wall-clock and conflict budgets.
+    Returns SAT, UNSAT, or UNKNOWN if a budget ran out first."""
+    if time_limit is None and conflict_limit is None:
+        return SAT if solver.solve(assumptions=assumptions) else UNSAT
+
+    if conflict_limit is not None:
+        solver.conf_budget(conflict_limit)
+    timer = None
+    if time_limit is not None:
+        timer = threading.Timer(max(time_limit, 0), solver.interrupt)
+        timer.start()
+    try:
+        result = solver.solve_limited(
+            assumptions=assumptions, expect_interrupt=time_limit is not None
+        )
+    finally:
+        if timer is not None:
+            timer.cancel()
+            solver.clear_interrupt()
+        if conflict_limit is not None:
+            # A non-positive budget removes the limit for later calls
+            solver.conf_budget(-1)
+    if result is None:
+        return UNKNOWN
+    return SAT if result else UNSAT
+
+
+_COUNTERS = ("conflicts", "decisions", "propagations", "restarts")
+
+
+def solve_with_stats(
+    solver, cnf, assumptions=(), time_limit=None, conflict_limit=None
+) -> tuple[str, SolveStats]:
+    """Like solve_within, and also returns the SolveStats of the call, where the
+    solver holds the clauses of cnf. The solver's counters are totals over all
+    of its calls, so the call's share is the difference."""
+    before = solver.accum_stats() or dict()
+    start = time.perf_counter()
+    status = solve_within(solver, assumptions, time_limit, conflict_limit)
+    elapsed = time.perf_counter() - start
+    after = solver.accum_stats() or dict()
+    counters = [after.get(key, 0) - before.get(key, 0) for key in _COUNTERS]
+    return status, SolveStats(*counters, elapsed, cnf.num_vars, cnf.num_clauses)
+
+
+def total_stats(stats: Iterable[SolveStats]) -> SolveStats:
+    """Adds up the stats of several calls, e.g. over a batch of boards. The sizes
+    add up too, so divide by the number of calls for the mean size."""
+    return SolveStats(*(sum(values) for values in zip(SolveStats(), *stats)))
+
+
+def distinct_models(solver, cnf, assumptions, ids, limit=2) -> list[list[int]]:
+    """Returns up to limit models of the solver, as lists of literals, which
+    all differ on the variables ids. Each model found is blocked before the next
+    solve, on the same incremental solver.
+
+    The blocking clauses only hold while a new variable is assumed, and that
+    variable is set false at the end, so the solver can be reused. It is
+    numbered past the variables of cnf rather than added to it, since a
+    variable without clauses would double the counts of a compiled cnf."""
+    selector = max(solver.nof_vars(), cnf.num_vars) + 1
+    models = []
+    while len(models) < limit and solver.solve(
+        assumptions=list(assumptions) + [selector]
+    ):
+        model = solver.get_model()
+        models.append(model)
+        solver.add_clause([-selector] + [-model[i - 1] for i in ids])
+    solver.add_clause([-selector])
+    return models
+
+
+def layout_ids(cnf) -> list[int]:
+    """The ids of the rail direction variables, which together are a track
+    layout"""
+    return [
+        i
+        for i, name in enumerate(cnf.names)
+        if isinstance(name, str) and name.startswith(("rail_input_", "rail_output_"))
+    ]
 
 
 class Encoding(object):
-    def __init__(self):
+    def __init__(self, streaming=False):
+        """If streaming is true, each constraint is converted to clauses and
+        added to a PySAT solver as soon as it is added, and isn't kept. Once
+        forget_formulas is called, memory is bounded by the solver's clause
+        database and an integer definition per auxiliary variable, but only
+        is_satisfiable, solve and solve_limited work, since nothing else has the
+        constraints or their clauses."""
         self.constraints = []
+        # (family, coord) for each constraint, see tagged
+        self.tags = []
+        self._tag = (None, None)
+        self._cnf = None
+        self._vars = None
+        # Clauses added to the CNF for each constraint
+        self._clause_counts = []
+        # vars and nodes for each constraint, filled in by stats
+        self._constraint_sizes = []
+        self._circuit = None
+        self.streaming = streaming
+        self._solver = None
+        if streaming:
+            from pysat.solvers import Solver
+
+            self._solver = Solver(name=config.pysat_solver)
+            self._cnf = CNF(self._solver, keep_clauses=False)
+
+    def close(self):
+        """Deletes the solver of a streaming encoding"""
+        if self._solver is not None:
+            self._solver.delete()
+            self._solver = None
+
+    def forget_formulas(self):
+        """Lets a streaming encoding free the formulas of the constraints added
+        so far. Its CNF otherwise keeps every subformula it encoded, to share it
+        with later constraints, which costs more memory than the clauses."""
+        if self.streaming:
+            self._cnf.forget_formulas()
+
+    def _check_kept(self):
+        if self.streaming:
+            raise RuntimeError("a streaming encoding doesn't keep its constraints")
+
+    @contextmanager
+    def tagged(self, family: Optional[str], coord=None):
+        """Tags constraints added inside the context with a family and a tile.
+        Untagged constraints have the family and tile None."""
+        previous = self._tag
+        self._tag = (family, coord)
+        try:
+            yield
+        finally:
+            self._tag = previous
 
     def vars(self):
-        ret = set()
-        for c in self.constraints:
-            ret |= c.vars()
-        return ret
+        if self.streaming:
+            return set(self._cnf.ids)
+        if self._vars is None:
+            self._vars = set()
+            for c in self.constraints:
+                self._vars |= c.vars()
+        return set(self._vars)
 
     def size(self):
+        self._check_kept()
         ret = 0
         for c in self.constraints:
             ret += c.size()
         return ret
 
     def valid(self):
+        self._check_kept()
         return And(self.constraints).valid()
 
     def negate(self):
+        self._check_kept()
         return And(self.constraints).negate()
 
     def add_constraint(self, c):
         assert isinstance(c, NNF), "Constraints need to be of type NNF"
+        self.tags.append(self._tag)
+        if self.streaming:
+            self._add_clauses(c)
+            return
         self.constraints.append(c)
+        self._circuit = None
+        if self._vars is not None:
+            self._vars |= c.vars()
+        if self._cnf is not None:
+            self._add_clauses(c)
+
+    def cnf(self):
+        """Returns the theory as integer clauses, kept in sync as constraints are added"""
+        self._check_kept()
+        if self._cnf is None:
+            self._cnf = CNF()
+            for c in self.constraints:
+                self._add_clauses(c)
+        return self._cnf
+
+    def _add_clauses(self, c):
+        before = self._cnf.num_clauses
+        self._cnf.add(c)
+        self._clause_counts.append(self._cnf.num_clauses - before)
+
+    def stats(self, by: str = "family") -> dict[Any, ConstraintStats]:
+        """Returns the size of the constraints grouped by their tags (see tagged).
+
+        by is "family", "tile" or "both", giving ConstraintStats keyed by family,
+        by tile coordinate or by (family, coord). The sizes of each constraint
+        are worked out once and kept, so later calls only group them."""
+        if by not in ("family", "tile", "both"):
+            raise ValueError(f"unknown grouping '{by}'")
+        self.cnf()
+        for c in self.constraints[len(self._constraint_sizes) :]:
+            self._constraint_sizes.append((c.vars(), sum(1 for _ in c.walk())))
+
+        groups = dict()
+        for (family, coord), (names, nodes), clauses in zip(
+            self.tags, self._constraint_sizes, self._clause_counts
+        ):
+            key = {"family": family, "tile": coord, "both": (family, coord)}[by]
+            if key not in groups:
+                groups[key] = [0, set(), 0, 0]
+            group = groups[key]
+            group[0] += 1
+            group[1] |= names
+            group[2] += clauses
+            group[3] += nodes
+        return {
+            key: ConstraintStats(count, len(names), clauses, nodes)
+            for key, (count, names, clauses, nodes) in groups.items()
+        }
+
+    def to_dimacs(self, fp):
+        """Writes the theory to fp in DIMACS CNF format.
+        Returns the map from variable ids to names, which is also written as comments."""
+        cnf = self.cnf()
+        cnf.write_dimacs(fp)
+        return cnf.var_map()
+
+    def to_wcnf(self, fp, soft):
+        """Writes the theory to fp as the hard part of a WCNF MaxSAT instance.
+        soft is an iterable of (weight, NNF) pairs, each of which becomes a soft clause.
+        Returns the map from variable ids to names."""
+        cnf = self.cnf()
+        cnf.write_wcnf(fp, [(weight, [cnf.encode(f)]) for weight, f in soft])
+        return cnf.var_map()
 
     @config(sat_backend="pysat")
     def is_satisfiable(self):
+        if self.streaming:
+            return self._solver.solve()
         return And(self.constraints).simplify().satisfiable()
 
     @config(sat_backend="pysat")
-    def solve(self):
+    def solve(self, hint=None):
+        """Returns a model of the theory, or None if it is unsatisfiable.
+
+        hint is a model to start from, such as the solution of the board before
+        an edit. The solver tries the hint's value of each variable first, so a
+        model close to it is usually found with far fewer conflicts. Solving with
+        a hint goes through PySAT on cnf()."""
+        if self.streaming or hint is not None:
+            return self.solve_limited(hint=hint).model
         return And(self.constraints).simplify().solve()
 
+    def compiled(self, path=None):
+        """Returns the theory compiled to a ddnnf.Circuit, running DSHARP only the
+        first time. If path is given, the circuit is saved there and later loaded
+        from there instead of compiling, as long as the constraints are the
+        same."""
+        from .ddnnf import Circuit, compile_circuit, fingerprint
+
+        key = None if path is None else fingerprint(self.constraints)
+        if self._circuit is None:
+            if path is not None and os.path.exists(path):
+                self._circuit = Circuit.load(path, key)
+            if self._circuit is None:
+                self._circuit = compile_circuit(self.cnf())
+                if path is not None:
+                    self._circuit.save(path, key)
+        elif path is not None and not os.path.exists(path):
+            self._circuit.save(path, key)
+        return self._circuit
+
     def count_solutions(self, lits=[]):
+        """Returns the number of models in which all of lits are true.
+
+        When lits are literals the count comes from the compiled circuit, so
+        repeated counts only run DSHARP once. Models assign every variable of
+        cnf(), which includes auxiliary variables that the others determine."""
+        self._check_kept()
+        if all(isinstance(lit, Var) for lit in lits):
+            assignment = dict()
+            for lit in lits:
+                if assignment.setdefault(lit.name, lit.true) != lit.true:
+                    return 0
+            return self.compiled().count(assignment)
+
         if lits:
             T = And(self.constraints + lits)
         else:
@@ -48,7 +357,112 @@ class Encoding(object):
             T.to_CNF(), executable="bin/dsharp", smooth=True
         ).model_count()
 
+    def approx_count(self, epsilon=0.8, delta=0.2, projection=None, **kwargs):
+        """Estimates count_solutions with approxmc.approx_count, for theories too
+        large to compile. Returns an approxmc.Estimate.
+
+        By default the count is over all named variables, which determine the
+        auxiliary ones, so it estimates the same number as count_solutions.
+        projection can name a subset of variables to count their assignments
+        instead, e.g. only the rails to count track layouts. kwargs are passed to
+        approx_count."""
+        from .approxmc import approx_count
+
+        cnf = self.cnf()
+        if projection is None:
+            ids = [i for i, name in enumerate(cnf.names) if name is not None]
+        else:
+            ids = sorted(cnf.id(name) for name in projection)
+        return approx_count(cnf, ids, epsilon, delta, **kwargs)
+
+    def has_unique_solution(self):
+        """Returns whether exactly one track layout solves the theory, or None
+        if none does. Models with the same rails are the same solution, even if
+        the train's state differs, e.g. when it passes two aliens at once and
+        can pick up either. count_solutions counts those separately.
+
+        This solves at most twice, so it is much cheaper than count_solutions."""
+        cnf = self.cnf()
+        with cnf.solver() as solver:
+            models = distinct_models(solver, cnf, (), layout_ids(cnf))
+        if not models:
+            return None
+        return len(models) == 1
+
+    def solve_limited(self, time_limit=None, conflict_limit=None, hint=None):
+        """Like solve, but solves the CNF with PySAT, and gives up after
+        time_limit seconds or conflict_limit conflicts. Returns a SolveResult
+        with the SolveStats of the call."""
+        if self.streaming:
+            return self._solve_measured(self._solver, time_limit, conflict_limit, hint)
+        with self.cnf().solver() as solver:
+            return self._solve_measured(solver, time_limit, conflict_limit, hint)
+
+    def _solve_measured(self, solver, time_limit, conflict_limit, hint):
+        if hint is not None:
+            solver.set_phases(self._cnf.phases(hint))
+        status, stats = solve_with_stats(
+            solver, self._cnf, (), time_limit, conflict_limit
+        )
+        if status != SAT:
+            return SolveResult(status, stats=stats)
+        return SolveResult(status, self._cnf.decode(solver.get_model()), stats)
+
+    def count_limited(
+        self, lits=[], time_limit=None, conflict_limit=None, memory_limit=None
+    ):
+        """Like count_solutions, but within a budget. Returns a CountResult.
+
+        DSHARP gets most of the time and memory_limit megabytes. If it runs out,
+        the rest of the time is spent enumerating models with PySAT, and the
+        number found is returned as a lower bound.
+        """
+        from .ddnnf import compile_cnf
+
+        deadline = None if time_limit is None else time.monotonic() + time_limit
+
+        def remaining():
+            return None if deadline is None else deadline - time.monotonic()
+
+        cnf = self.cnf()
+        assumptions = [cnf.encode(lit) for lit in lits]
+        with cnf.solver() as solver:
+            status = solve_within(solver, assumptions, remaining(), conflict_limit)
+            if status == UNSAT:
+                return CountResult(0, True)
+            if status == UNKNOWN:
+                return CountResult(0, False)
+
+            compiled = None
+            if deadline is None or remaining() > 0:
+                compiled = compile_cnf(
+                    cnf,
+                    assumptions,
+                    timeout=None if deadline is None else remaining() * 0.75,
+                    memory_limit=memory_limit,
+                )
+            if compiled is not None:
+                free = cnf.num_vars - len(compiled.vars())
+                return CountResult(compiled.model_count() * 2 ** free, True)
+
+            # Anytime fallback: count distinct models until the budget runs out
+            count = 0
+            while True:
+                left = remaining()
+                if left is not None and left <= 0:
+                    return CountResult(count, False)
+                status = solve_within(solver, assumptions, left, conflict_limit)
+                if status == UNSAT:
+                    return CountResult(count, True)
+                if status == UNKNOWN:
+                    return CountResult(count, False)
+                count += 1
+                solver.add_clause(
+                    [-lit for lit in solver.get_model() if cnf.names[abs(lit)] is not None]
+                )
+
     def models(self):
+        self._check_kept()
         T = And(self.constraints)
         return dsharp.compile(T.to_CNF(), executable="bin/dsharp", smooth=True).models()
 
@@ -1,8 +1,7 @@
 """This module implements useful logic operations"""
-import operator
-from functools import reduce
-from typing import Any
-from nnf import Var, true, false
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+from nnf import NNF, And, Or, Var, false, true
 
 
 def _is_iterable(arg: Any) -> bool:
@@ -28,27 +27,130 @@ def _expand_iterable(func):
     return wrapper
 
 
+class Interner:
+    """Hash-conses formulas, so that equal formulas are the same object
+
+    Building a node that was built before returns the earlier one. Since the
+    children of every node are shared too, comparing nodes only has to compare
+    their children by identity, and equal subformulas are only stored once.
+    """
+
+    def __init__(self) -> None:
+        self._nodes: dict[NNF, NNF] = dict()
+        self._negations: dict[NNF, NNF] = dict()
+        self.built = 0
+        self.shared = 0
+
+    def __call__(self, node: NNF) -> NNF:
+        self.built += 1
+        existing = self._nodes.setdefault(node, node)
+        if existing is not node:
+            self.shared += 1
+        return existing
+
+    def negate(self, node: NNF) -> NNF:
+        if node not in self._negations:
+            if isinstance(node, Var):
+                negation = self(node.negate())
+            elif isinstance(node, And):
+                negation = self(Or(self.negate(c) for c in node.children))
+            else:
+                negation = self(And(self.negate(c) for c in node.children))
+            self._negations[node] = negation
+        return self._negations[node]
+
+    def stats(self) -> dict[str, int]:
+        """Returns how many nodes were requested, how many of those were already
+        built and so shared, and how many distinct nodes there are."""
+        return {"built": self.built, "shared": self.shared, "unique": len(self._nodes)}
+
+
+_interner: Optional[Interner] = None
+
+
+@contextmanager
+def interning(interner: Optional[Interner] = None) -> Iterator[Interner]:
+    """Shares equal formulas built by this module while the context is active.
+    The interner is dropped afterwards, so its table doesn't outlive the theory."""
+    global _interner
+    previous = _interner
+    _interner = Interner() if interner is None else interner
+    try:
+        yield _interner
+    finally:
+        _interner = previous
+
+
+def _node(node: NNF) -> NNF:
+    return node if _interner is None else _interner(node)
+
+
+def negate(node: NNF) -> NNF:
+    """Returns the negation of node"""
+    if _interner is None:
+        return node.negate()
+    return _interner.negate(node)
+
+
+def _flatten(kind, args) -> list[NNF]:
+    """Returns the children of a kind node over args, merging the children of
+    any args that are themselves kind nodes. This keeps formulas shallow, and
+    drops true from an And and false from an Or since they have no children."""
+    children = []
+    for arg in args:
+        if isinstance(arg, kind):
+            children.extend(arg.children)
+        else:
+            children.append(arg)
+    return children
+
+
+def _combine(kind, args) -> NNF:
+    children = _flatten(kind, args)
+    # false absorbs an And, and true absorbs an Or
+    absorbing = false if kind is And else true
+    if absorbing in children:
+        return absorbing
+    if len(children) == 1:
+        return children[0]
+    return _node(kind(children))
+
+
+def conjoin(left: NNF, right: NNF) -> NNF:
+    """Returns (left and right)"""
+    return _combine(And, (left, right))
+
+
+def disjoin(left: NNF, right: NNF) -> NNF:
+    """Returns (left or right)"""
+    return _combine(Or, (left, right))
+
+
 def implication(left: Var, right: Var) -> Var:
     """Returns a Var equal to (left implies right)"""
-    return left.negate() | right
+    return disjoin(negate(left), right)
 
 
 def equal(left: Var, right: Var) -> Var:
-    return implication(left, right) & implication(right, left)
+    return conjoin(implication(left, right), implication(right, left))
 
 
 def if_else(condition: Var, on_pass: Var, on_fail: Var) -> Var:
-    return implication(condition, on_pass) & implication(condition.negate(), on_fail)
+    return conjoin(
+        implication(condition, on_pass), implication(negate(condition), on_fail)
+    )
 
 
 @_expand_iterable
 def multi_or(*args: Var) -> Var:
-    return reduce(operator.__or__, args, false)
+    """Returns a single flat Or over args. With no args this is false."""
+    return _combine(Or, args)
 
 
 @_expand_iterable
 def multi_and(*args: Var) -> Var:
-    return reduce(operator.__and__, args, true)
+    """Returns a single flat And over args. With no args this is true."""
+    return _combine(And, args)
 
 
 @_expand_iterable
@@ -56,16 +158,16 @@ def one_of(*args: Var) -> Var:
     parts = []
     for idx in range(len(args)):
         parts.append(
-            multi_and(a if i == idx else a.negate() for i, a in enumerate(args))
+            multi_and(a if i == idx else negate(a) for i, a in enumerate(args))
         )
     return multi_or(parts)
 
 
 @_expand_iterable
 def none_of(*args: Var) -> Var:
-    return multi_and(a.negate() for a in args)
+    return multi_and(negate(a) for a in args)
 
 
 @_expand_iterable
 def one_of_or_none(*args: Var) -> Var:
-    return one_of(args) | multi_and(a.negate() for a in args)
+    return disjoin(one_of(args), multi_and(negate(a) for a in args))
@@ -0,0 +1,132 @@
+"""Builds the clauses of the generic theory in worker processes
+
+Each tile's constraints only depend on the tile and its neighbours, apart from
+the rail_comes_before formulas that tiles share. Those are built first, in the
+order a serial build would build them (see CosmicExpressTheory.prime_order),
+and forked workers inherit them. The grid is split into bands of rows, and each
+worker adds the constraints of one band and converts them to integer clauses.
+The workers send back flat arrays of literals, which are much cheaper to pickle
+than NNF, and the clauses are merged into one CNF by renumbering their
+variables.
+
+Subformulas used by more than one band are encoded once in each band, so the
+merged CNF has some more auxiliary variables than a serial build. They are
+defined by their clauses either way, so the models are the same.
+"""
+import multiprocessing
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate
+from typing import Optional
+
+import numpy as np
+
+from .cnf import CNF
+from .helpers import Coord
+from .theory import CosmicExpressTheory
+from . import helpers
+from . import logic
+
+
+def row_bands(size: tuple[int, int], bands: int) -> list[list[Coord]]:
+    """Splits the coordinates of a grid into at most bands runs of whole rows"""
+    rows, _ = size
+    bands = max(1, min(bands, rows))
+    bounds = [rows * i // bands for i in range(bands + 1)]
+    return [
+        [coord for coord in helpers.all_coords(size) if low <= coord[1] < high]
+        for low, high in zip(bounds, bounds[1:])
+    ]
+
+
+def build_cnf(
+    size: tuple[int, int],
+    num_colors: int = 2,
+    color_encoding: str = "onehot",
+    workers: Optional[int] = None,
+    bands: Optional[int] = None,
+) -> CNF:
+    """Returns the clauses of CosmicExpressTheory(size, num_colors), built over
+    bands of rows in workers processes, by default one per CPU.
+
+    bands defaults to the number of workers. Workers are forked, so where fork
+    isn't available, or with a single worker, the bands are built in this
+    process. With neither workers nor bands the theory is built serially,
+    exactly like CosmicExpressTheory(...).theory.cnf().
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if "fork" not in multiprocessing.get_all_start_methods():
+        workers = 1
+    if workers <= 1 and bands is None:
+        return CosmicExpressTheory(
+            size, num_colors, color_encoding=color_encoding
+        ).theory.cnf()
+
+    global _shared
+    theory_wrapper = CosmicExpressTheory(
+        size, num_colors, color_encoding=color_encoding, coords=()
+    )
+    interner = logic.Interner()
+    with logic.interning(interner):
+        theory_wrapper.prime_order()
+    _shared = theory_wrapper, interner
+
+    cnf = CNF()
+    try:
+        parts = row_bands(size, bands or workers)
+        if workers <= 1:
+            for part in map(_band_clauses, parts):
+                merge(cnf, *part)
+            return cnf
+        with ProcessPoolExecutor(
+            min(workers, len(parts)), mp_context=multiprocessing.get_context("fork")
+        ) as executor:
+            # Merge in band order, while the later bands are still being built
+            for part in executor.map(_band_clauses, parts):
+                merge(cnf, *part)
+        return cnf
+    finally:
+        _shared = None
+
+
+# The primed theory and its interner, set while build_cnf runs so that forked
+# workers start from them
+_shared: Optional[tuple[CosmicExpressTheory, logic.Interner]] = None
+
+
+def _band_clauses(coords: list[Coord]) -> tuple[list, array, array]:
+    """Builds one band's clauses. Returns the names of their variables, the
+    length of each clause and all of their literals in order."""
+    theory_wrapper, interner = _shared
+    encoding = theory_wrapper.theory
+    # Bands built in this process mustn't see each other's constraints
+    before = len(encoding.constraints)
+    with logic.interning(interner):
+        theory_wrapper.add_constraints(coords)
+    cnf = CNF()
+    cnf.extend(encoding.constraints[before:])
+    del encoding.constraints[before:], encoding.tags[before:]
+
+    lengths = array("i", map(len, cnf.clauses))
+    literals = array("i")
+    for clause in cnf.clauses:
+        literals.extend(clause)
+    return cnf.names, lengths, literals
+
+
+def merge(cnf: CNF, names: list, lengths: array, literals: array) -> None:
+    """Adds clauses numbered by another CNF's names to cnf. Named variables are
+    matched by name, and each auxiliary variable gets a new id."""
+    ids = np.zeros(len(names), dtype=np.int64)
+    for i in range(1, len(names)):
+        name = names[i]
+        ids[i] = cnf.aux() if name is None else cnf.id(name)
+
+    literals = np.frombuffer(literals, dtype=np.int32)
+    mapped = (np.sign(literals) * ids[np.abs(literals)]).tolist()
+    ends = list(accumulate(lengths))
+    starts = [0] + ends[:-1]
+    cnf.clauses.extend(mapped[start:end] for start, end in zip(starts, ends))
+    cnf.num_clauses += len(ends)
@@ -0,0 +1,346 @@
+"""Renders boards and their solutions to images without Tk
+
+Tiles are drawn from the icons in data/icons the same way the GUI's tiles draw
+them, and pasted into one image per board. Each icon is loaded, resized,
+recoloured and rotated once per process and then reused, so rendering a board
+mostly costs one paste per layer of each tile.
+
+Usage: python -m src.render [--solve] [--new-rails] [--workers N] [--tile PX]
+           OUT_DIR FILE_OR_CORPUS ...
+
+writes a PNG of every board in the given xml files and corpora (see
+src.board) to OUT_DIR. With --solve, each board is solved first and drawn with
+its solution's rails, coloured by the aliens the train carries over them.
+"""
+import os
+import re
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Any, Iterable, Optional, Union
+
+import numpy as np
+from PIL import Image
+
+from .xml_parser import Color, Coord, Directions
+
+COLORS = [
+    "#c71111",
+    "#132fd2",
+    "#10802d",
+    "#ee55ba",
+    "#f17d0e",
+    "#f6f757",
+    "#3f484e",
+    "#d6e1f0",
+    "#6b30bc",
+    "#72491c",
+]
+
+ICONS = "data/icons"
+TILE_SIZE = 64
+# Tk's default canvas color, which shows through the GUI's empty tiles
+BACKGROUND = "#d9d9d9"
+
+RGB = Union[str, tuple[int, int, int]]
+
+
+def hex2rgb(hexcode):
+    hexcode = hexcode[1:]
+    r = int(hexcode[:2], 16)
+    g = int(hexcode[2:4], 16)
+    b = int(hexcode[4:6], 16)
+    return r, g, b
+
+
+def recolor_image(im: Image.Image, to_change: RGB, result: RGB, tolerance=0):
+    """Returns a copy of im with every pixel within tolerance of to_change in
+    each of red, green and blue set to result. Alpha is left alone."""
+    if isinstance(to_change, str):
+        to_change = hex2rgb(to_change)
+    if isinstance(result, str):
+        result = hex2rgb(result)
+
+    data = np.array(im.convert("RGBA"))
+    # Widen the channels so that the differences can't wrap around
+    distance = np.abs(data[..., :3].astype(np.int16) - np.array(to_change))
+    data[(distance <= tolerance).all(axis=-1), :3] = result
+    return Image.fromarray(data)
+
+
+@lru_cache(maxsize=None)
+def icon(
+    name: str,
+    size: int = TILE_SIZE,
+    recolor: Optional[tuple[RGB, RGB, int]] = None,
+    rotation: int = 0,
+) -> Image.Image:
+    """Returns data/icons/{name}.png as a size by size RGBA image, recoloured
+    by recolor_image(im, *recolor) and then rotated counterclockwise by rotation
+    degrees. The images are shared between callers, who mustn't modify them."""
+    im = Image.open(os.path.join(ICONS, f"{name}.png")).convert("RGBA")
+    im = im.resize((size, size))
+    if recolor is not None:
+        im = recolor_image(im, *recolor)
+    if rotation:
+        im = im.rotate(rotation)
+    return im
+
+
+def rail_rotation(direction: str) -> int:
+    """The rotation of a rail half pointing in direction, as drawn pointing N"""
+    return {"N": 0, "E": 270, "S": 180, "W": 90}[direction]
+
+
+# A tile's kind, color, rail directions, and the colors of the aliens the train
+# carries into and out of it
+TileImage = tuple[
+    str, Optional[Color], Optional[Directions], Optional[Color], Optional[Color]
+]
+
+_RAIL = re.compile(r"^rail_(input|output)_([NESW]):\((\d+),(\d+)\)$")
+_TRAIN = re.compile(r"^train_alien_(before|after)_color_(\d+):\((\d+),(\d+)\)$")
+
+
+def solution_rails(
+    model: dict[Any, bool]
+) -> dict[Coord, tuple[Directions, Optional[Color], Optional[Color]]]:
+    """Returns the directions of the rail on each tile of a solution, and the
+    colors of the aliens the train carries into and out of it, from a model of
+    a theory with the onehot color encoding"""
+    inputs, outputs, before, after = dict(), dict(), dict(), dict()
+    for name, value in model.items():
+        if not value or not isinstance(name, str):
+            continue
+        match = _RAIL.match(name)
+        if match:
+            coord = int(match[3]), int(match[4])
+            (inputs if match[1] == "input" else outputs)[coord] = match[2]
+            continue
+        match = _TRAIN.match(name)
+        if match:
+            coord = int(match[3]), int(match[4])
+            (before if match[1] == "before" else after)[coord] = int(match[2])
+    return {
+        coord: ((inputs[coord], outputs[coord]), before.get(coord), after.get(coord))
+        for coord in inputs
+        if coord in outputs
+    }
+
+
+def board_tiles(
+    data: dict[str, Any], model: Optional[dict[Any, bool]] = None
+) -> dict[Coord, TileImage]:
+    """Returns what to draw on each non-empty tile of a board in the format
+    returned by import_xml, with the rails of model if it is given"""
+    # Imported here so that the GUI's tiles can use the icons without loading
+    # the solver
+    from .file_reader import data_tiles
+
+    tiles = {
+        coord: (kind, color, directions, None, None)
+        for coord, kind, color, directions in data_tiles(data)
+    }
+    if model is not None:
+        for coord, (directions, before, after) in solution_rails(model).items():
+            tiles[coord] = ("rail", None, directions, before, after)
+    return tiles
+
+
+def tile_layers(tile: TileImage, size: int = TILE_SIZE) -> list[Image.Image]:
+    """Returns the icons to paste on a tile in order, like the GUI's Tile
+    classes draw them. A house's background is drawn by render_board."""
+    kind, color, directions, before, after = tile
+    if kind == "alien":
+        layers = [icon("alien_green", size, ((0, 255, 0), COLORS[color], 130))]
+    elif kind == "rail":
+        layers = [
+            icon(
+                half,
+                size,
+                None if carried is None else ((0, 0, 0), COLORS[carried], 0),
+                rail_rotation(direction),
+            )
+            for half, direction, carried in zip(
+                ("rail_half_in", "rail_half_out"), directions, (before, after)
+            )
+        ]
+    elif kind in ("house", "obstacle", "entrance", "exit"):
+        layers = [icon(kind, size)]
+    else:
+        layers = []
+    return layers + [icon("border", size)]
+
+
+def render_board(
+    data: dict[str, Any],
+    model: Optional[dict[Any, bool]] = None,
+    tile_size: int = TILE_SIZE,
+) -> Image.Image:
+    """Draws a board in the format returned by import_xml, and the rails of a
+    solution if model is given, with the top row first like the GUI"""
+    rows, cols = data["rows"], data["cols"]
+    image = Image.new("RGBA", (cols * tile_size, rows * tile_size), BACKGROUND)
+    tiles = board_tiles(data, model)
+    for x in range(cols):
+        for y in range(rows):
+            tile = tiles.get((x, y), ("empty", None, None, None, None))
+            box = (x * tile_size, (rows - y - 1) * tile_size)
+            if tile[0] == "house":
+                corner = box[0] + tile_size, box[1] + tile_size
+                image.paste(COLORS[tile[1]], box + corner)
+            for layer in tile_layers(tile, tile_size):
+                image.alpha_composite(layer, box)
+    return image
+
+
+def render_file(
+    out_path: str,
+    data: dict[str, Any],
+    model: Optional[dict[Any, bool]] = None,
+    tile_size: int = TILE_SIZE,
+) -> None:
+    """Writes render_board's image to out_path as a PNG"""
+    render_board(data, model, tile_size).save(out_path, format="PNG")
+
+
+def render_all(
+    jobs: Iterable[tuple[str, dict[str, Any]]],
+    out_dir: str,
+    solve: bool = False,
+    allow_new_rails: bool = False,
+    workers: Optional[int] = None,
+    tile_size: int = TILE_SIZE,
+) -> list[tuple[str, str]]:
+    """Renders (name, data) boards to PNGs in out_dir in workers processes,
+    by default one per CPU. Each file is named after the board's file (see
+    _png_names). With solve, each board is drawn with a solution found by
+    batch.BatchSolver.
+
+    Returns (name, status) for each board in order, where status is the solve
+    status, "rendered" without solve, or a message if the board couldn't be
+    read or solved."""
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = list(jobs)
+    paths = [
+        os.path.join(out_dir, f"{png}.png")
+        for png in _png_names([name for name, _ in jobs])
+    ]
+    jobs = [(name, data, path) for (name, data), path in zip(jobs, paths)]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    args = (solve, allow_new_rails, tile_size)
+    if workers <= 1:
+        _init_worker(*args)
+        try:
+            return [_render_job(job) for job in jobs]
+        finally:
+            _close_worker()
+    with ProcessPoolExecutor(
+        workers, initializer=_init_worker, initargs=args
+    ) as executor:
+        # Boards of the same shape reuse a worker's session, so send them in
+        # chunks rather than one by one
+        return list(executor.map(_render_job, jobs, chunksize=8))
+
+
+# Settings for rendering, and the solver if boards are solved, in each worker
+_tile_size = None
+_solver = None
+
+
+def _init_worker(solve, allow_new_rails, tile_size) -> None:
+    global _tile_size, _solver
+    _tile_size = tile_size
+    if solve:
+        from .batch import BatchSolver
+
+        _solver = BatchSolver(allow_new_rails)
+
+
+def _close_worker() -> None:
+    global _solver
+    if _solver is not None:
+        _solver.close()
+        _solver = None
+
+
+def _render_job(
+    job: tuple[str, Optional[dict[str, Any]], str]
+) -> tuple[str, str]:
+    name, data, path = job
+    if data is None:
+        return name, "error: not a board file"
+    model = None
+    status = "rendered"
+    try:
+        if _solver is not None:
+            result = _solver.solve(data)
+            status, model = result.status, result.model
+        render_file(path, data, model, _tile_size)
+    except (KeyError, ValueError, IndexError) as e:
+        return name, f"error: {e}"
+    return name, status
+
+
+def _png_names(names: list[str]) -> list[str]:
+    """Returns a distinct file name, without .png, for each board named by
+    batch._read_boards, e.g. data/xml/small.xml or corpus[3]. Boards are named
+    by their file, like small or corpus_3, unless another board has the same
+    file name in another directory, in which case the directories are kept,
+    like data_xml_small. Any boards still sharing a name are numbered."""
+    paths = [
+        os.path.splitext(os.path.normpath(name.rstrip("]").replace("[", "_")))[0]
+        for name in names
+    ]
+    stems = [os.path.basename(path) for path in paths]
+    counts = Counter(stems)
+    pngs = [
+        stem
+        if counts[stem] == 1
+        else re.sub(r"[^\w.-]+", "_", path).strip("_")
+        for stem, path in zip(stems, paths)
+    ]
+    # The same file given twice, or paths that only differ in punctuation
+    seen = Counter()
+    counts = Counter(pngs)
+    for i, png in enumerate(pngs):
+        if counts[png] > 1:
+            seen[png] += 1
+            pngs[i] = f"{png}_{seen[png]}"
+    return pngs
+
+
+def main(argv: list[str]) -> None:
+    from .batch import _read_boards
+
+    argv = list(argv)
+    options = dict(workers=None, tile=TILE_SIZE)
+    for option in options:
+        if f"--{option}" in argv:
+            i = argv.index(f"--{option}")
+            options[option] = int(argv[i + 1])
+            del argv[i : i + 2]
+    flags = {"--solve", "--new-rails"}
+    out_dir, *paths = [arg for arg in argv if arg not in flags]
+
+    start = time.perf_counter()
+    results = render_all(
+        _read_boards(paths),
+        out_dir,
+        solve="--solve" in argv,
+        allow_new_rails="--new-rails" in argv,
+        workers=options["workers"],
+        tile_size=options["tile"],
+    )
+    for name, status in results:
+        print(f"{name}: {status}")
+    elapsed = time.perf_counter() - start
+    count = len(results)
+    print(f"{count} boards in {elapsed:.2f}s ({count / elapsed:.1f} boards/s)")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
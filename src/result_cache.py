@@ -0,0 +1,101 @@
+"""An on-disk cache of solver results, shared by symmetric boards
+
+Results are stored under the board's canonical key, so a rotated, mirrored or
+recoloured copy of a board that was solved before is answered without building
+its theory. Solutions are stored for the canonical board and mapped back onto
+the board that was asked about. The least recently used entries are dropped
+once the cache holds max_entries results.
+"""
+import json
+import sqlite3
+import time
+from typing import Any, NamedTuple, Optional
+
+from .canonical import canonicalize, restore_model
+
+
+class CachedResult(NamedTuple):
+    satisfiable: bool
+    # None if the solutions weren't counted
+    count: Optional[int] = None
+    model: Optional[dict[str, bool]] = None
+
+
+class ResultCache:
+    """An LRU cache of results in an sqlite database"""
+
+    def __init__(self, path: str, max_entries: int = 10000) -> None:
+        self.max_entries = max_entries
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS results "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, used REAL NOT NULL)"
+        )
+        self.connection.commit()
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self) -> "ResultCache":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def get(self, key: str) -> Optional[CachedResult]:
+        row = self.connection.execute(
+            "SELECT value FROM results WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        with self.connection:
+            self.connection.execute(
+                "UPDATE results SET used = ? WHERE key = ?", (time.time(), key)
+            )
+        return CachedResult(*json.loads(row[0]))
+
+    def put(self, key: str, result: CachedResult) -> None:
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+                (key, json.dumps(list(result)), time.time()),
+            )
+            self.connection.execute(
+                "DELETE FROM results WHERE key NOT IN "
+                "(SELECT key FROM results ORDER BY used DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+
+
+def solve_cached(
+    data: dict[str, Any],
+    cache: ResultCache,
+    allow_new_rails: bool = False,
+    count: bool = True,
+) -> CachedResult:
+    """Solves a board in the format returned by import_xml, and counts its
+    solutions if count is True, using cache for any symmetric board seen before"""
+    from .file_reader import read_data
+
+    canonical = canonicalize(data)
+    key = f"{canonical.key}:{int(allow_new_rails)}"
+    result = cache.get(key)
+    if result is None or (count and result.count is None):
+        encoding = read_data(canonical.data, allow_new_rails)
+        model = encoding.solve()
+        if not model:
+            result = CachedResult(False, 0)
+        else:
+            result = CachedResult(
+                True,
+                encoding.count_solutions() if count else None,
+                {k: v for k, v in model.items() if isinstance(k, str)},
+            )
+        cache.put(key, result)
+
+    if result.model is None:
+        return result
+    return result._replace(model=restore_model(result.model, canonical))
@@ -0,0 +1,308 @@
+"""Solves boards by searching for the train's path directly
+
+Instead of building the theory, this runs a depth first search from the entrance
+that lays one rail at a time and carries the train's state along with it. A
+branch is abandoned as soon as it breaks a rule of the theory, or when the tiles
+it can still reach can no longer serve every remaining alien, house and the
+exit. States whose subtree has already failed are remembered and skipped.
+
+The rules are the ones the theory encodes, with two differences on unusual
+boards. The search only builds a single path, so it never uses rail loops that
+are disconnected from it. It also empties the carriage after a drop-off, where
+the theory leaves the carriage's colour unconstrained.
+"""
+from typing import Any, NamedTuple, Optional
+
+from .file_reader import check_data, data_tiles
+from .helpers import Coord
+from .theory import GRID_PROPS
+from .xml_parser import Color
+from . import helpers
+
+Model = dict[str, bool]
+
+
+class State(NamedTuple):
+    """The train's position and everything that decides how it can continue"""
+
+    head: Coord
+    carriage: Optional[Color]
+    # Bit masks over tiles and over the aliens and houses still to be visited
+    visited: int
+    aliens: int
+    houses: int
+
+
+class PathSearch:
+    """Searches for a path through a board in the format returned by import_xml"""
+
+    def __init__(self, data: dict[str, Any], allow_new_rails: bool = False) -> None:
+        check_data(data)
+        self.size = data["rows"], data["cols"]
+        self.num_colors = data["colors"]
+        self.allow_new_rails = allow_new_rails
+
+        self.tiles = dict()
+        # Two things on one tile contradict each other, like they do in the theory
+        self.contradictory = False
+        for coord, kind, color, directions in data_tiles(data):
+            if coord in self.tiles:
+                self.contradictory = True
+            self.tiles[coord] = (kind, color, directions)
+
+        [self.entrance] = data["entrances"]
+        [self.exit] = data["exits"]
+        self.rails = {coord: tuple(directions) for directions, coord in data["rails"]}
+
+        self.bits = {
+            coord: 1 << i for i, coord in enumerate(helpers.all_coords(self.size))
+        }
+        self.all_rails = 0
+        for coord in self.rails:
+            self.all_rails |= self.bits[coord]
+
+        self.aliens = [(coord, color) for color, coord in data["aliens"]]
+        self.houses = [(coord, color) for color, coord in data["houses"]]
+        # (bit, color) pairs for the aliens and houses next to each tile
+        self.adjacent_aliens = self._adjacency(self.aliens)
+        self.adjacent_houses = self._adjacency(self.houses)
+
+        self.near_entrance = set(helpers.get_adjacent(self.entrance))
+        self.near_exit = set(helpers.get_adjacent(self.exit))
+
+        self.failed: set[State] = set()
+        self.nodes = 0
+
+    def _adjacency(self, things) -> dict[Coord, list[tuple[int, Color]]]:
+        adjacent = {coord: [] for coord in helpers.all_coords(self.size)}
+        for i, (coord, color) in enumerate(things):
+            for offset_coord in helpers.get_adjacent(coord):
+                if offset_coord in adjacent:
+                    adjacent[offset_coord].append((1 << i, color))
+        return adjacent
+
+    def grid_contains(self, coord) -> bool:
+        return 0 <= coord[0] < self.size[1] and 0 <= coord[1] < self.size[0]
+
+    def solve(self) -> Optional[Model]:
+        """Returns a model like Encoding.solve, or None if there is no path"""
+        path = self.find_path()
+        if path is None:
+            return None
+        return self.model(path)
+
+    def find_path(self) -> Optional[list[tuple[Coord, Optional[Color], Optional[Color]]]]:
+        """Returns the rails of a valid path in order as (coord, before, after)
+        tuples, where before and after are the carriage's colour on that rail."""
+        if self.contradictory:
+            return None
+
+        start = State(
+            self.entrance, None, 0, (1 << len(self.aliens)) - 1, (1 << len(self.houses)) - 1
+        )
+        if not self._feasible(start):
+            return None
+
+        # Iterative so that long paths don't hit the recursion limit
+        path = []
+        states = [start]
+        moves = [self._moves(start)]
+        while moves:
+            move = next(moves[-1], None)
+            if move is None:
+                self.failed.add(states.pop())
+                moves.pop()
+                if path:
+                    path.pop()
+                continue
+            if move is _FINISHED:
+                return path
+            child, before = move
+            self.nodes += 1
+            path.append((child.head, before, child.carriage))
+            states.append(child)
+            moves.append(self._moves(child))
+        return None
+
+    def _moves(self, state: State):
+        """Yields the (state, carriage before) pairs reachable by laying the next
+        rail, or _FINISHED if the train can go on to the exit"""
+        head = state.head
+        if head in self.rails:
+            directions = [self.rails[head][1]]
+        else:
+            directions = sorted(
+                "NESW", key=lambda d: self._distance(helpers.step(head, d), state)
+            )
+
+        for d in directions:
+            coord = helpers.step(head, d)
+            if not self.grid_contains(coord):
+                continue
+            if coord == self.exit:
+                if (
+                    head != self.entrance
+                    and not state.aliens
+                    and not state.houses
+                    and state.visited & self.all_rails == self.all_rails
+                ):
+                    yield _FINISHED
+                continue
+
+            bit = self.bits[coord]
+            if state.visited & bit:
+                continue
+            if coord in self.rails:
+                if self.rails[coord][0] != helpers.opposite_direction(d):
+                    continue
+            elif coord in self.tiles or not self.allow_new_rails:
+                continue
+
+            child = self._enter(state, coord)
+            if child is None or child in self.failed:
+                continue
+            if not self._feasible(child):
+                self.failed.add(child)
+                continue
+            yield child, state.carriage
+
+    def _enter(self, state: State, coord: Coord) -> Optional[State]:
+        """Returns the state after the train moves onto a new rail at coord,
+        or None if that breaks a rule"""
+        before = state.carriage
+        if before is not None and coord in self.near_entrance:
+            return None
+
+        after = before
+        aliens, houses = state.aliens, state.houses
+        if before is None:
+            # Every waiting alien next to an empty carriage gets on
+            colors = set()
+            for bit, color in self.adjacent_aliens[coord]:
+                if aliens & bit:
+                    aliens &= ~bit
+                    colors.add(color)
+            if len(colors) > 1:
+                return None
+            if colors:
+                [after] = colors
+        else:
+            # and the alien gets off at the first house of its colour
+            for bit, color in self.adjacent_houses[coord]:
+                if houses & bit and color == before:
+                    houses &= ~bit
+                    after = None
+
+        if after is not None and coord in self.near_exit:
+            return None
+        return State(coord, after, state.visited | self.bits[coord], aliens, houses)
+
+    def _feasible(self, state: State) -> bool:
+        """False if the state certainly can't be completed"""
+        waiting = {color for i, (_, color) in enumerate(self.aliens) if state.aliens >> i & 1}
+        unserved = {color for i, (_, color) in enumerate(self.houses) if state.houses >> i & 1}
+        if state.carriage is not None and state.carriage not in unserved:
+            return False
+        if not unserved <= waiting | {state.carriage}:
+            return False
+
+        # Flood fill the tiles that future rails could use
+        reachable = set()
+        frontier = [state.head]
+        while frontier:
+            coord = frontier.pop()
+            for offset_coord in helpers.get_adjacent(coord):
+                if offset_coord not in reachable and self._free(state, offset_coord):
+                    reachable.add(offset_coord)
+                    frontier.append(offset_coord)
+
+        if not (
+            self.exit in helpers.get_adjacent(state.head) and state.head != self.entrance
+        ) and not reachable & self.near_exit:
+            return False
+        for coord in self.rails:
+            if not state.visited & self.bits[coord] and coord not in reachable:
+                return False
+        for things, mask in ((self.aliens, state.aliens), (self.houses, state.houses)):
+            for i, (coord, _) in enumerate(things):
+                if mask >> i & 1 and not any(
+                    c in reachable for c in helpers.get_adjacent(coord)
+                ):
+                    return False
+        return True
+
+    def _free(self, state: State, coord: Coord) -> bool:
+        """True iff a future rail could be laid on or use the tile at coord"""
+        if not self.grid_contains(coord) or state.visited & self.bits[coord]:
+            return False
+        if coord in self.rails:
+            return True
+        return self.allow_new_rails and coord not in self.tiles
+
+    def _distance(self, coord: Coord, state: State) -> int:
+        """Distance to the nearest tile the train should head for next, used to
+        try the most promising directions first"""
+        if state.carriage is not None:
+            targets = [
+                c
+                for i, (c, color) in enumerate(self.houses)
+                if state.houses >> i & 1 and color == state.carriage
+            ]
+        else:
+            targets = [c for i, (c, _) in enumerate(self.aliens) if state.aliens >> i & 1]
+        if not targets:
+            targets = [self.exit]
+        return min(abs(coord[0] - t[0]) + abs(coord[1] - t[1]) for t in targets)
+
+    def model(self, path) -> Model:
+        """Returns the value of every proposition of the theory for a path"""
+        model = dict()
+        for coord in helpers.all_coords(self.size):
+            for name, prop_type in GRID_PROPS:
+                if prop_type is None:
+                    keys = [name]
+                elif prop_type == "color":
+                    keys = [f"{name}_{c}" for c in range(self.num_colors)]
+                else:
+                    keys = [f"{name}_{d}" for d in "NESW"]
+                for key in keys:
+                    model[_prop_name(key, coord)] = False
+
+        def set_true(key, coord):
+            model[_prop_name(key, coord)] = True
+
+        for coord, (kind, color, _) in self.tiles.items():
+            if kind == "rail":
+                continue
+            set_true(kind, coord)
+            if color is not None:
+                set_true(f"{kind}_color_{color}", coord)
+                set_true(f"{kind}_satisfied", coord)
+
+        coords = [self.entrance] + [coord for coord, _, _ in path] + [self.exit]
+        for i, (coord, before, after) in enumerate(path, start=1):
+            set_true("rail", coord)
+            set_true(
+                f"rail_input_{helpers.direction_between(coord, coords[i - 1])}", coord
+            )
+            set_true(
+                f"rail_output_{helpers.direction_between(coord, coords[i + 1])}", coord
+            )
+            if before is not None:
+                set_true(f"train_alien_before_color_{before}", coord)
+            if after is not None:
+                set_true(f"train_alien_after_color_{after}", coord)
+        return model
+
+
+_FINISHED = object()
+
+
+def _prop_name(key: str, coord: Coord) -> str:
+    return f"{key}:({coord[0]},{coord[1]})"
+
+
+def search(data: dict[str, Any], allow_new_rails: bool = False) -> Optional[Model]:
+    """Solves the board in the format returned by import_xml.
+    Returns a model like Encoding.solve, or None if the board is unsolvable."""
+    return PathSearch(data, allow_new_rails).solve()
@@ -0,0 +1,196 @@
+"""Incremental solving of a board that is edited one tile at a time
+
+A session builds the generic theory for a board size once and keeps it loaded in
+a PySAT solver. The contents of each tile are passed to the solver as assumption
+literals, so editing a tile only swaps that tile's assumptions and the solver
+keeps everything it has learnt about the board.
+"""
+from typing import Optional, Sequence
+
+from .explain import minimal_core, tile_kinds
+from .file_reader import check_data, data_tiles, tile_literals
+from .helpers import Coord
+from .lib204 import distinct_models, layout_ids
+from .parallel_build import build_cnf
+from .theory import CosmicExpressTheory
+from .xml_parser import Color, Directions
+from . import helpers
+
+Tile = tuple[str, Optional[Color], Optional[Directions]]
+EMPTY_TILE: Tile = ("empty", None, None)
+
+
+class Session:
+    """Keeps a board's theory and solver alive between edits"""
+
+    def __init__(
+        self, size: tuple[int, int], num_colors: int = 1, workers: int = 1
+    ) -> None:
+        """With more than one worker, the theory's clauses are built in that many
+        processes by parallel_build.build_cnf"""
+        self.size = size
+        self.num_colors = num_colors
+        if workers > 1:
+            self.theory_wrapper = CosmicExpressTheory(size, num_colors, coords=())
+            self.cnf = build_cnf(size, num_colors, workers=workers)
+        else:
+            self.theory_wrapper = CosmicExpressTheory(size, num_colors)
+            self.cnf = self.theory_wrapper.theory.cnf()
+        self.solver = self.cnf.solver()
+        self.layout_ids = layout_ids(self.cnf)
+
+        self.tiles: dict[Coord, Tile] = {
+            coord: EMPTY_TILE for coord in helpers.all_coords(size)
+        }
+        # Items loaded onto a tile after the one in tiles. Their literals are
+        # assumed too, so that like in the theory the board is unsolvable.
+        self.stacked: dict[Coord, list[Tile]] = dict()
+        # Assumption literals for each tile, keyed by allow_new_rails
+        self._assumptions: dict[bool, dict[Coord, list[int]]] = {
+            False: dict(),
+            True: dict(),
+        }
+        for coord in self.tiles:
+            self._update_assumptions(coord)
+
+    def close(self) -> None:
+        self.solver.delete()
+
+    def __enter__(self) -> "Session":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def set_tile(
+        self,
+        coord: Coord,
+        kind: str,
+        color: Optional[Color] = None,
+        directions: Optional[Directions] = None,
+        stacked: Sequence[Tile] = (),
+    ) -> None:
+        """Changes the contents of a single tile.
+        kind is one of entrance, exit, alien, house, obstacle, rail or empty.
+        stacked are more items on the same tile, as load gives them."""
+        for tile_color in [color] + [item[1] for item in stacked]:
+            if tile_color is not None and tile_color >= self.num_colors:
+                raise ValueError(
+                    f"color {tile_color} is out of range for a session with "
+                    f"{self.num_colors} colors"
+                )
+        self.tiles[coord] = (kind, color, directions)
+        if stacked:
+            self.stacked[coord] = list(stacked)
+        else:
+            self.stacked.pop(coord, None)
+        self._update_assumptions(coord)
+
+    def load(self, data: dict) -> None:
+        """Replaces the whole board with one in the format returned by
+        xml_parser.import_xml. Only the tiles that differ are updated."""
+        if (data["rows"], data["cols"]) != self.size:
+            raise ValueError("board size doesn't match the session")
+        tiles: dict[Coord, list[Tile]] = {coord: [] for coord in self.tiles}
+        for coord, kind, color, directions in data_tiles(data):
+            tiles[coord].append((kind, color, directions))
+        for coord, items in tiles.items():
+            tile, *stacked = items or [EMPTY_TILE]
+            if tile != self.tiles[coord] or stacked != self.stacked.get(coord, []):
+                self.set_tile(coord, *tile, stacked=stacked)
+
+    def _update_assumptions(self, coord: Coord) -> None:
+        items = [self.tiles[coord]] + self.stacked.get(coord, [])
+        for allow_new_rails, assumptions in self._assumptions.items():
+            assumptions[coord] = [
+                self.cnf.literal(literal)
+                for kind, color, directions in items
+                for literal in tile_literals(
+                    self.theory_wrapper,
+                    coord,
+                    kind,
+                    color,
+                    directions,
+                    allow_new_rails,
+                )
+            ]
+
+    def assumptions(self, allow_new_rails: bool = False) -> list[int]:
+        return [
+            lit
+            for literals in self._assumptions[allow_new_rails].values()
+            for lit in literals
+        ]
+
+    def solve(
+        self, allow_new_rails: bool = False, hint: Optional[dict[str, bool]] = None
+    ) -> Optional[dict[str, bool]]:
+        """Returns a model of the current board like Encoding.solve,
+        or None if the board is unsolvable.
+
+        hint is a model to start from, as in Encoding.solve, e.g. the solution
+        found before the last edits. The solver keeps preferring its values in
+        later solves until another hint replaces them."""
+        check_data(self.to_data())
+        if hint is not None:
+            self.solver.set_phases(self.cnf.phases(hint))
+        if not self.solver.solve(assumptions=self.assumptions(allow_new_rails)):
+            return None
+        return self.cnf.decode(self.solver.get_model())
+
+    def layouts(
+        self, limit: int = 2, allow_new_rails: bool = False
+    ) -> list[set[int]]:
+        """Returns the true literals of up to limit models of the current board
+        with different track layouts"""
+        models = distinct_models(
+            self.solver,
+            self.cnf,
+            self.assumptions(allow_new_rails),
+            self.layout_ids,
+            limit,
+        )
+        return [{lit for lit in model if lit > 0} for model in models]
+
+    def has_unique_solution(self, allow_new_rails: bool = False) -> Optional[bool]:
+        """Like Encoding.has_unique_solution, for the current board"""
+        check_data(self.to_data())
+        layouts = self.layouts(2, allow_new_rails)
+        if not layouts:
+            return None
+        return len(layouts) == 1
+
+    def explain(self, allow_new_rails: bool = False) -> Optional[dict[Coord, str]]:
+        """Like explain.explain, but for the current board"""
+        data = self.to_data()
+        check_data(data)
+        core = minimal_core(self.solver, self._assumptions[allow_new_rails])
+        if core is None:
+            return None
+        kinds = tile_kinds(data)
+        return {coord: kinds.get(coord, "empty") for coord in sorted(core)}
+
+    def to_data(self) -> dict:
+        """Returns the board in the format returned by xml_parser.import_xml"""
+        data = {
+            "rows": self.size[0],
+            "cols": self.size[1],
+            "colors": self.num_colors,
+            "entrances": [],
+            "exits": [],
+            "aliens": [],
+            "houses": [],
+            "obstacles": [],
+            "rails": [],
+        }
+        items = [(coord, tile) for coord, tile in self.tiles.items()] + [
+            (coord, tile) for coord, tiles in self.stacked.items() for tile in tiles
+        ]
+        for coord, (kind, color, directions) in items:
+            if kind in ("entrance", "exit", "obstacle"):
+                data[f"{kind}s"].append(coord)
+            elif kind in ("alien", "house"):
+                data[f"{kind}s"].append((color, coord))
+            elif kind == "rail":
+                data["rails"].append((directions, coord))
+        return data
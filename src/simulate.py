@@ -0,0 +1,234 @@
+"""Checks many candidate track layouts for one board at once with NumPy
+
+A layout is a pair of (cols, rows) grids holding each tile's rail input and
+output direction, coded like the rail layers of board.Board. A stack of N
+layouts is simulated in lockstep: every step moves the train of each layout
+that is still running one rail further along its output directions, and applies
+the rules of search.PathSearch to all of them with array operations. So the
+number of steps is bounded by the board's size, not by N, and checking
+thousands of layouts costs about as much Python as checking one.
+
+The rules are the ones search.PathSearch follows. The train enters each rail
+from the direction of its input, may not visit a tile twice, and must leave the
+last rail into the exit. Every rail of a layout has to be on that path, so
+layouts with rail loops disconnected from it are invalid, where the theory
+accepts them. The board's own rails must be part of each layout with their
+directions, and other rails may only be laid on empty tiles with
+allow_new_rails.
+"""
+from typing import Any, Mapping, NamedTuple, Sequence
+
+import numpy as np
+
+from .board import EMPTY, NO_COLOR, NO_DIRECTION, RAIL, Board, direction_code
+from .file_reader import check_data, data_tiles
+from .helpers import Coord, neighbour_table
+from .xml_parser import Directions
+
+# The direction code pointing back along each direction code
+_OPPOSITE = np.array([NO_DIRECTION, 3, 4, 1, 2], dtype=np.uint8)
+
+
+class Simulation(NamedTuple):
+    """What happened to the train of each of N layouts
+
+    The grids have shape (N, cols, rows) and only hold values for the tiles the
+    train passed, up to where its layout broke a rule.
+    """
+
+    # Whether each layout solves the board
+    valid: np.ndarray
+    # How many rails the train passed
+    length: np.ndarray
+    visited: np.ndarray
+    # The color of the alien the train carries into and out of each rail, or
+    # NO_COLOR when the carriage is empty
+    before: np.ndarray
+    after: np.ndarray
+    # Which aliens were picked up and which houses were served, in the order
+    # of the board's "aliens" and "houses"
+    aliens: np.ndarray
+    houses: np.ndarray
+
+
+def stack_layouts(
+    layouts: Sequence[Mapping[Coord, Directions]], size: tuple[int, int]
+) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the rail_in and rail_out stacks for layouts given as the
+    directions of the rail on each tile, on a board of the given (rows, cols)
+    size"""
+    rows, cols = size
+    rail_in = np.full((len(layouts), cols, rows), NO_DIRECTION, dtype=np.uint8)
+    rail_out = rail_in.copy()
+    for i, layout in enumerate(layouts):
+        for (x, y), (d_in, d_out) in layout.items():
+            rail_in[i, x, y] = direction_code(d_in)
+            rail_out[i, x, y] = direction_code(d_out)
+    return rail_in, rail_out
+
+
+def _bits(table, things, cells: int) -> tuple[np.ndarray, np.ndarray]:
+    """Returns bit masks over (color, coord) things, of the ones next to each
+    tile and of the ones of each color, indexed by tile and by color"""
+    if len(things) > 64:
+        raise ValueError("simulate supports at most 64 aliens and 64 houses")
+    coords = {coord: i for i, coord in enumerate(table.coords)}
+    adjacent = np.zeros(cells, dtype=np.uint64)
+    # Indexed by a carriage's color, so NO_COLOR matches nothing
+    colors = np.zeros(NO_COLOR + 1, dtype=np.uint64)
+    for j, (color, coord) in enumerate(things):
+        bit = np.uint64(1 << j)
+        for neighbour in table.adjacent.get(coord, ()):
+            adjacent[coords[neighbour]] |= bit
+        colors[color] |= bit
+    return adjacent, colors
+
+
+def simulate(
+    data: dict[str, Any],
+    rail_in: np.ndarray,
+    rail_out: np.ndarray,
+    allow_new_rails: bool = False,
+) -> Simulation:
+    """Runs the train over a stack of layouts for a board in the format
+    returned by import_xml. rail_in and rail_out have shape (N, cols, rows)
+    and hold direction codes, with NO_DIRECTION where there is no rail."""
+    check_data(data)
+    board = Board.from_data(data)
+    rows, cols = board.size
+    rail_in = np.asarray(rail_in, dtype=np.uint8)
+    rail_out = np.asarray(rail_out, dtype=np.uint8)
+    if rail_in.ndim != 3 or rail_in.shape[1:] != (cols, rows):
+        raise ValueError("layouts must have shape (N, cols, rows)")
+    if rail_out.shape != rail_in.shape:
+        raise ValueError("rail_in and rail_out must have the same shape")
+
+    n = len(rail_in)
+    cells = rows * cols
+    # Tiles are numbered like neighbour_table's, which matches flattening the
+    # (cols, rows) grids
+    ins = rail_in.reshape(n, cells)
+    outs = rail_out.reshape(n, cells)
+    kinds = board.kinds.ravel()
+
+    table = neighbour_table((rows, cols))
+    # The tile one step away from each tile in each direction code, or -1
+    steps = np.full((cells, 5), -1, dtype=np.intp)
+    tiles = np.repeat(np.arange(cells), table.neighbours.shape[1])
+    inside = table.neighbours.ravel() >= 0
+    steps[tiles[inside], table.directions.ravel()[inside] + 1] = (
+        table.neighbours.ravel()[inside]
+    )
+
+    [(ex, ey)] = data["entrances"]
+    [(xx, xy)] = data["exits"]
+    entrance, exit_tile = ex * rows + ey, xx * rows + xy
+    near_entrance = np.zeros(cells, dtype=bool)
+    near_entrance[steps[entrance][steps[entrance] >= 0]] = True
+    near_exit = np.zeros(cells, dtype=bool)
+    near_exit[steps[exit_tile][steps[exit_tile] >= 0]] = True
+    # Aliens still waiting and houses still to be served are tracked as a bit
+    # mask per layout
+    alien_adjacent, alien_colors = _bits(table, data["aliens"], cells)
+    house_adjacent, house_colors = _bits(table, data["houses"], cells)
+    alien_palette = sorted({color for color, _ in data["aliens"]})
+
+    # Layouts must keep the board's rails and only add rails where allowed
+    has_rail = (ins != NO_DIRECTION) | (outs != NO_DIRECTION)
+    board_rails = kinds == RAIL
+    ok = ~(has_rail & ~(board_rails | (allow_new_rails & (kinds == EMPTY)))).any(1)
+    ok &= (ins[:, board_rails] == board.rail_in.ravel()[board_rails]).all(1)
+    ok &= (outs[:, board_rails] == board.rail_out.ravel()[board_rails]).all(1)
+    # Two things on one tile contradict each other, like they do in the theory
+    coords = [coord for coord, _, _, _ in data_tiles(data)]
+    if len(set(coords)) < len(coords):
+        ok[:] = False
+
+    # The first rail is a neighbour of the entrance whose input faces it. If
+    # there are several, the others are left off the path and fail below.
+    first = steps[entrance, 1:]
+    faces = np.zeros((n, 4), dtype=bool)
+    for d, neighbour in enumerate(first, start=1):
+        if neighbour >= 0:
+            faces[:, d - 1] = ins[:, neighbour] == _OPPOSITE[d]
+    head = first[faces.argmax(1)]
+    running = ok & faces.any(1)
+
+    carriage = np.full(n, NO_COLOR, dtype=np.uint8)
+    length = np.zeros(n, dtype=np.intp)
+    visited = np.zeros((n, cells), dtype=bool)
+    before = np.full((n, cells), NO_COLOR, dtype=np.uint8)
+    after = before.copy()
+    aliens = np.full(n, (1 << len(data["aliens"])) - 1, dtype=np.uint64)
+    houses = np.full(n, (1 << len(data["houses"])) - 1, dtype=np.uint64)
+    finished = np.zeros(n, dtype=bool)
+
+    # Tiles of the layouts that are still running are picked out of the
+    # flattened grids, with layout * cells + tile as the index
+    flat_visited, flat_before, flat_after = (
+        grid.reshape(-1) for grid in (visited, before, after)
+    )
+    flat_ins, flat_outs = ins.reshape(-1), outs.reshape(-1)
+
+    # Each step visits a new tile, so no train runs for more steps than there
+    # are tiles
+    for _ in range(cells + 1):
+        idx = np.flatnonzero(running)
+        if not idx.size:
+            break
+        h = head[idx]
+        carried = carriage[idx]
+        empty = carried == NO_COLOR
+        keep = ~flat_visited[idx * cells + h] & (empty | ~near_entrance[h])
+
+        # Every waiting alien next to an empty carriage gets on
+        pick = np.where(empty, aliens[idx] & alien_adjacent[h], 0)
+        carrying = carried.copy()
+        for color in alien_palette:
+            boarding = pick & alien_colors[color] != 0
+            keep &= ~boarding | (carrying == carried)
+            carrying[boarding] = color
+        # and the alien gets off at the houses of its colour
+        drop = houses[idx] & house_adjacent[h] & house_colors[carried]
+        carrying[drop != 0] = NO_COLOR
+        keep &= (carrying == NO_COLOR) | ~near_exit[h]
+
+        running[idx] = False
+        idx, h = idx[keep], h[keep]
+        tile = idx * cells + h
+        aliens[idx] &= ~pick[keep]
+        houses[idx] &= ~drop[keep]
+        flat_visited[tile] = True
+        flat_before[tile] = carried[keep]
+        flat_after[tile] = carrying[keep]
+        carriage[idx] = carrying[keep]
+        length[idx] += 1
+
+        # Follow the rail's output onto the next tile, whose input must face
+        # back, or into the exit. Off the grid, nxt is -1 and the input looked
+        # up is some other tile's, which doesn't matter.
+        d = flat_outs[tile]
+        nxt = steps[h, d]
+        at_exit = nxt == exit_tile
+        finished[idx[at_exit]] = True
+        enters = (nxt >= 0) & ~at_exit
+        enters &= flat_ins[idx * cells + nxt] == _OPPOSITE[d]
+        running[idx[enters]] = True
+        head[idx[enters]] = nxt[enters]
+
+    valid = finished & (aliens == 0) & (houses == 0) & (visited == has_rail).all(1)
+    shape = (n, cols, rows)
+    return Simulation(
+        valid,
+        length,
+        visited.reshape(shape),
+        before.reshape(shape),
+        after.reshape(shape),
+        _unset(aliens, len(data["aliens"])),
+        _unset(houses, len(data["houses"])),
+    )
+
+
+def _unset(masks: np.ndarray, count: int) -> np.ndarray:
+    """Returns which of the lowest count bits of each mask are 0"""
+    return masks[:, None] >> np.arange(count, dtype=np.uint64) & np.uint64(1) == 0
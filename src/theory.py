@@ -1,25 +1,101 @@
-from nnf import Var, false
+import re
+from typing import Iterable, Optional
+
+from nnf import NNF, Var, false
 from .lib204 import Encoding
 
 from . import helpers
+from .helpers import Coord
 from . import logic
 
+# Props are represented by a tuple (name, prop_type)
+# - name is used as a key for the prop in the props dict
+# - prop_type is one of (None, "color", "direction") and determines if the prop
+#   gets an extra descriptor
+GRID_PROPS = [
+    ("alien", None),
+    ("house", None),
+    ("obstacle", None),
+    ("rail", None),
+    ("entrance", None),
+    ("exit", None),
+    ("alien_satisfied", None),
+    ("house_satisfied", None),
+    ("alien_color", "color"),
+    ("house_color", "color"),
+    ("rail_input", "direction"),
+    ("rail_output", "direction"),
+    ("train_alien_before_color", "color"),
+    ("train_alien_after_color", "color"),
+]
+
+# How color props are represented:
+# - "onehot" has a prop for each color, of which at most one is true
+# - "log" stores the color as a binary number in ceil(log2(colors + 1)) props,
+#   where 0 means no color and c + 1 means color c
+COLOR_ENCODINGS = ("onehot", "log")
+
 
 class CosmicExpressTheory:
     """Class for the Cosmic Epy xpress model"""
 
     props: dict[str, dict[tuple[int, int], Var]]
 
-    def __init__(self, size: tuple[int, int] = (5, 5), num_colors: int = 2) -> None:
+    def __init__(
+        self,
+        size: tuple[int, int] = (5, 5),
+        num_colors: int = 2,
+        lazy_order: bool = False,
+        color_encoding: str = "onehot",
+        coords: Optional[Iterable[Coord]] = None,
+        streaming: bool = False,
+    ) -> None:
+        """If lazy_order is true, rail_comes_before returns free "rail_comes_before"
+        propositions instead of formulas. Nothing ties those propositions to the
+        train's path, so they have to be constrained separately (see src/cegar.py).
+
+        color_encoding is one of COLOR_ENCODINGS. With "log", the props of a color
+        prop name are named like "alien_color_bit0" instead of "alien_color_0";
+        decode_colors turns a model back into the onehot names.
+
+        If coords is given, only the constraints of those tiles are added, so a
+        theory can be built in parts (see parallel_build.py). coords=() builds
+        just the propositions.
+
+        streaming is passed to the Encoding, which then turns each constraint
+        into clauses for its solver as it is added, instead of keeping it, and
+        forgets their formulas once they are all added.
+
+        formula_stats holds the number of formula nodes built while adding the
+        constraints, and how many of them were shared with an equal earlier node.
+        """
         self.num_rows, self.num_cols = size
+        self.lazy_order = lazy_order
+        self.order_props: dict[tuple[Coord, Coord], Var] = dict()
 
+        if color_encoding not in COLOR_ENCODINGS:
+            raise ValueError(f"unknown color encoding '{color_encoding}'")
+        self.color_encoding = color_encoding
         self.num_colors = num_colors
         self.colors = range(num_colors)
+        if color_encoding == "onehot":
+            self.color_descriptors = list(self.colors)
+        else:
+            self.color_descriptors = [
+                f"bit{i}" for i in range(num_colors.bit_length())
+            ]
         self.directions = list("NESW")
+        # Shared by every theory of the same size
+        self.neighbours = helpers.neighbour_table(size)
 
-        self.theory = Encoding()
+        self.theory = Encoding(streaming)
         self.build_propositions()
-        self.add_constraints()
+        # Share equal subformulas between constraints while building them
+        with logic.interning() as interner:
+            self.add_constraints(coords)
+        self.formula_stats = interner.stats()
+        # Nothing is shared with constraints added from here on
+        self.theory.forget_formulas()
 
     @property
     def size(self) -> tuple[int, int]:
@@ -45,33 +121,11 @@ class CosmicExpressTheory:
         """
         self._named_props = dict()
 
-        # Props are represented by a tuple (prefix, name, prop_type)
-        # - prefix is the shorthand symbol used as a key for the prop in the props dict
-        # - name is the full name of the prop (currently unused)
-        # - prop_type is one of (None, "color", "direction") and determines if the prop
-        #   gets an extra descriptor
-        grid_props = [
-            ("alien", None),
-            ("house", None),
-            ("obstacle", None),
-            ("rail", None),
-            ("entrance", None),
-            ("exit", None),
-            ("alien_satisfied", None),
-            ("house_satisfied", None),
-            ("alien_color", "color"),
-            ("house_color", "color"),
-            ("rail_input", "direction"),
-            ("rail_output", "direction"),
-            ("train_alien_before_color", "color"),
-            ("train_alien_after_color", "color"),
-        ]
-
-        for name, prop_type in grid_props:
+        for name, prop_type in GRID_PROPS:
             if prop_type is None:
                 self._add_grid_prop_dict(name)
             elif prop_type == "color":
-                for c in self.colors:
+                for c in self.color_descriptors:
                     self._add_grid_prop_dict(name, c)
             elif prop_type == "direction":
                 for d in self.directions:
@@ -79,18 +133,32 @@ class CosmicExpressTheory:
             else:
                 raise RuntimeError(f"unknown prop type '{prop_type}'")
 
-    def add_constraints(self) -> None:
-        """Adds all of the required contraints to the theory"""
-
-        for coord in helpers.all_coords(self.size):
+    def add_constraints(self, coords: Optional[Iterable[Coord]] = None) -> None:
+        """Adds all of the required contraints to the theory, or only those of
+        the tiles in coords"""
+        if coords is None:
+            coords = helpers.all_coords(self.size)
+        for coord in coords:
+            self.add_tile_constraints(coord)
+
+    def add_tile_constraints(self, coord) -> None:
+        """Adds the contraints of a single tile"""
+        # Constraints are tagged with their family and tile (see Encoding.stats)
+        tagged = self.theory.tagged
+        with tagged("alien", coord):
             self.add_alien_constraints(coord)
+        with tagged("house", coord):
             self.add_house_constraints(coord)
+        with tagged("rail_connection", coord):
             self.add_rail_connection_constraints(coord)
+        with tagged("rail_state", coord):
             self.add_rail_state_constraints(coord)
+        with tagged("satisfaction", coord):
             self.add_satisfaction_constraints(coord)
 
-            # Each tile can only be an alien, house, obstacle, regular rail,
-            # special rail, or nothing.
+        # Each tile can only be an alien, house, obstacle, regular rail,
+        # special rail, or nothing.
+        with tagged("exclusivity", coord):
             self.theory.add_constraint(
                 logic.one_of_or_none(
                     self.get_prop(name="alien", coord=coord),
@@ -107,30 +175,26 @@ class CosmicExpressTheory:
         # If an alien of any color is present, then an alien is present
         self.theory.add_constraint(
             logic.equal(
-                logic.one_of(self.get_props(name="alien_color", coord=coord)),
+                self._some_color(coord, "alien_color"),
                 self.get_prop(name="alien", coord=coord),
             )
         )
 
         # Each alien must only have one color
-        self.theory.add_constraint(
-            logic.one_of_or_none(self.get_props(name="alien_color", coord=coord))
-        )
+        self.theory.add_constraint(self._at_most_one_color(coord, "alien_color"))
 
     def add_house_constraints(self, coord) -> None:
         """Adds contraints related to houses aliens"""
         # If a house of any color is present, then a house is present
         self.theory.add_constraint(
             logic.equal(
-                logic.one_of(self.get_props(name="house_color", coord=coord)),
+                self._some_color(coord, "house_color"),
                 self.get_prop(name="house", coord=coord),
             )
         )
 
         # Each house must only have one color
-        self.theory.add_constraint(
-            logic.one_of_or_none(self.get_props(name="house_color", coord=coord))
-        )
+        self.theory.add_constraint(self._at_most_one_color(coord, "house_color"))
 
     def add_rail_connection_constraints(self, coord) -> None:
         """Ensures that the rails form a single, connected path from the entrance to exit"""
@@ -170,41 +234,40 @@ class CosmicExpressTheory:
         )
 
         # Each rail connects to two of: another rail, entrance, or exit
-        for direction, opposite_direction, offset_coord in helpers.get_directions(
+        for direction, opposite_direction, offset_coord in self.neighbours.steps[
             coord
-        ):
-            if self.grid_contains(offset_coord):
-                self.theory.add_constraint(
-                    logic.implication(
+        ]:
+            self.theory.add_constraint(
+                logic.implication(
+                    self.get_prop(
+                        name="rail_output", descriptor=direction, coord=coord
+                    ),
+                    logic.one_of(
                         self.get_prop(
-                            name="rail_output", descriptor=direction, coord=coord
+                            name="rail_input",
+                            descriptor=opposite_direction,
+                            coord=offset_coord,
                         ),
-                        logic.one_of(
-                            self.get_prop(
-                                name="rail_input",
-                                descriptor=opposite_direction,
-                                coord=offset_coord,
-                            ),
-                            self.get_prop(name="exit", coord=offset_coord),
-                        ),
-                    )
+                        self.get_prop(name="exit", coord=offset_coord),
+                    ),
                 )
+            )
 
-                self.theory.add_constraint(
-                    logic.implication(
+            self.theory.add_constraint(
+                logic.implication(
+                    self.get_prop(
+                        name="rail_input", descriptor=direction, coord=coord
+                    ),
+                    logic.one_of(
                         self.get_prop(
-                            name="rail_input", descriptor=direction, coord=coord
+                            name="rail_output",
+                            descriptor=opposite_direction,
+                            coord=offset_coord,
                         ),
-                        logic.one_of(
-                            self.get_prop(
-                                name="rail_output",
-                                descriptor=opposite_direction,
-                                coord=offset_coord,
-                            ),
-                            self.get_prop(name="entrance", coord=offset_coord),
-                        ),
-                    )
+                        self.get_prop(name="entrance", coord=offset_coord),
+                    ),
                 )
+            )
 
         # Entrances need a single rail taking input from them
         self.theory.add_constraint(
@@ -213,11 +276,12 @@ class CosmicExpressTheory:
                 logic.one_of(
                     self.get_prop(
                         name="rail_input",
-                        descriptor=helpers.direction_between(offset_coord, coord),
+                        descriptor=opposite_direction,
                         coord=offset_coord,
                     )
-                    for offset_coord in helpers.get_adjacent(coord)
-                    if self.grid_contains(offset_coord)
+                    for _, opposite_direction, offset_coord in self.neighbours.steps[
+                        coord
+                    ]
                 ),
             )
         )
@@ -229,11 +293,12 @@ class CosmicExpressTheory:
                 logic.one_of(
                     self.get_prop(
                         name="rail_output",
-                        descriptor=helpers.direction_between(offset_coord, coord),
+                        descriptor=opposite_direction,
                         coord=offset_coord,
                     )
-                    for offset_coord in helpers.get_adjacent(coord)
-                    if self.grid_contains(offset_coord)
+                    for _, opposite_direction, offset_coord in self.neighbours.steps[
+                        coord
+                    ]
                 ),
             )
         )
@@ -253,67 +318,62 @@ class CosmicExpressTheory:
 
         # Only one color can be true
         self.theory.add_constraint(
-            logic.one_of_or_none(
-                self.get_props(name="train_alien_before_color", coord=coord)
-            )
+            self._at_most_one_color(coord, "train_alien_before_color")
         )
         self.theory.add_constraint(
-            logic.one_of_or_none(
-                self.get_props(name="train_alien_after_color", coord=coord)
-            )
+            self._at_most_one_color(coord, "train_alien_after_color")
         )
 
-        # After state of one rail becomes before state of the next
-        for c in self.colors:
-            for direction, _, offset_coord in helpers.get_directions(coord):
-                if self.grid_contains(offset_coord):
-                    self.theory.add_constraint(
-                        logic.implication(
-                            self.get_prop(
-                                name="rail_output",
-                                descriptor=direction,
-                                coord=coord,
-                            ),
-                            logic.equal(
-                                self.get_prop(
-                                    name="train_alien_after_color",
-                                    descriptor=c,
-                                    coord=coord,
-                                ),
-                                self.get_prop(
-                                    name="train_alien_before_color",
-                                    descriptor=c,
-                                    coord=offset_coord,
-                                ),
-                            ),
-                        )
-                    )
-
-        for offset_coord in helpers.get_adjacent(coord):
-            if self.grid_contains(offset_coord):
+        # After state of one rail becomes before state of the next. The colors
+        # are equal iff their props are, whichever way colors are encoded.
+        for c in self.color_descriptors:
+            for direction, _, offset_coord in self.neighbours.steps[coord]:
                 self.theory.add_constraint(
                     logic.implication(
-                        self.get_prop(name="entrance", coord=offset_coord),
-                        logic.none_of(
-                            self.get_props(
-                                name="train_alien_before_color",
-                                coord=coord,
-                            )
+                        self.get_prop(
+                            name="rail_output",
+                            descriptor=direction,
+                            coord=coord,
                         ),
-                    )
-                )
-                self.theory.add_constraint(
-                    logic.implication(
-                        self.get_prop(name="exit", coord=offset_coord),
-                        logic.none_of(
-                            self.get_props(
+                        logic.equal(
+                            self.get_prop(
                                 name="train_alien_after_color",
+                                descriptor=c,
                                 coord=coord,
-                            )
+                            ),
+                            self.get_prop(
+                                name="train_alien_before_color",
+                                descriptor=c,
+                                coord=offset_coord,
+                            ),
                         ),
                     )
                 )
 
+        for offset_coord in self.neighbours.adjacent[coord]:
+            self.theory.add_constraint(
+                logic.implication(
+                    self.get_prop(name="entrance", coord=offset_coord),
+                    logic.none_of(
+                        self.get_props(
+                            name="train_alien_before_color",
+                            coord=coord,
+                        )
+                    ),
+                )
+            )
+            self.theory.add_constraint(
+                logic.implication(
+                    self.get_prop(name="exit", coord=offset_coord),
+                    logic.none_of(
+                        self.get_props(
+                            name="train_alien_after_color",
+                            coord=coord,
+                        )
+                    ),
+                )
+            )
+
         # Rail satisfies alien -> alien gets on train
         self.theory.add_constraint(
             logic.multi_and(
@@ -321,29 +381,27 @@ class CosmicExpressTheory:
                     logic.implication(
                         self._rail_satisfies_alien_color(coord, adjacent1, c),
                         # then the alien gets on the train
-                        self.get_prop(
-                            name="train_alien_after_color",
-                            descriptor=c,
-                            coord=coord,
+                        self.color_prop(
+                            name="train_alien_after_color", color=c, coord=coord
                         ),
                     )
                     for c in self.colors
                 )
-                for adjacent1 in helpers.get_adjacent(coord)
-                if self.grid_contains(adjacent1)
+                for adjacent1 in self.neighbours.adjacent[coord]
             )
         )
 
         # No alien satisfies rail -> no alien gets on train
         self.theory.add_constraint(
             logic.implication(
-                self.get_prop(name="rail", coord=coord)
-                # If no aliens satisfy the rail
-                & logic.none_of(
-                    self._rail_satisfies_alien_color(coord, adjacent1, c)
-                    for c in self.colors
-                    for adjacent1 in helpers.get_adjacent(coord)
-                    if self.grid_contains(adjacent1)
+                logic.conjoin(
+                    self.get_prop(name="rail", coord=coord),
+                    # If no aliens satisfy the rail
+                    logic.none_of(
+                        self._rail_satisfies_alien_color(coord, adjacent1, c)
+                        for c in self.colors
+                        for adjacent1 in self.neighbours.adjacent[coord]
+                    ),
                 ),
                 # then no alien gets on the train
                 logic.implication(
@@ -370,42 +428,38 @@ class CosmicExpressTheory:
                     logic.implication(
                         self._rail_satisfies_house_color(coord, adjacent1, c),
                         # then the alien gets off the train
-                        self.get_prop(
-                            name="train_alien_after_color",
-                            descriptor=c,
-                            coord=coord,
-                        ).negate(),
+                        logic.negate(
+                            self.color_prop(
+                                name="train_alien_after_color", color=c, coord=coord
+                            )
+                        ),
                     )
                     for c in self.colors
                 )
-                for adjacent1 in helpers.get_adjacent(coord)
-                if self.grid_contains(adjacent1)
+                for adjacent1 in self.neighbours.adjacent[coord]
             )
         )
 
         # No house satisfies rail -> no alien gets off train
         self.theory.add_constraint(
             logic.implication(
-                self.get_prop(name="rail", coord=coord)
-                # If no houses satisfy the rail
-                & logic.none_of(
-                    self._rail_satisfies_house_color(coord, adjacent1, c)
-                    for c in self.colors
-                    for adjacent1 in helpers.get_adjacent(coord)
-                    if self.grid_contains(adjacent1)
+                logic.conjoin(
+                    self.get_prop(name="rail", coord=coord),
+                    # If no houses satisfy the rail
+                    logic.none_of(
+                        self._rail_satisfies_house_color(coord, adjacent1, c)
+                        for c in self.colors
+                        for adjacent1 in self.neighbours.adjacent[coord]
+                    ),
                 ),
                 # then no alien gets off the train
                 logic.multi_and(
                     logic.implication(
-                        self.get_prop(
-                            name="train_alien_before_color",
-                            descriptor=c,
-                            coord=coord,
+                        self.color_prop(
+                            name="train_alien_before_color", color=c, coord=coord
                         ),
-                        self.get_prop(
-                            name="train_alien_after_color",
-                            descriptor=c,
-                            coord=coord,
+                        self.color_prop(
+                            name="train_alien_after_color", color=c, coord=coord
                         ),
                     )
                     for c in self.colors
@@ -416,13 +470,14 @@ class CosmicExpressTheory:
         # No rail satisfies alien -> alien is not satisfied
         self.theory.add_constraint(
             logic.implication(
-                self.get_prop(name="alien", coord=coord)
-                # If no rails satisfy the alien
-                & logic.none_of(
-                    self._rail_satisfies_alien_color(adjacent1, coord, c)
-                    for c in self.colors
-                    for adjacent1 in helpers.get_adjacent(coord)
-                    if self.grid_contains(adjacent1)
+                logic.conjoin(
+                    self.get_prop(name="alien", coord=coord),
+                    # If no rails satisfy the alien
+                    logic.none_of(
+                        self._rail_satisfies_alien_color(adjacent1, coord, c)
+                        for c in self.colors
+                        for adjacent1 in self.neighbours.adjacent[coord]
+                    ),
                 ),
                 # then alien is not satisfied
                 self.get_prop(name="alien_satisfied", coord=coord).negate(),
@@ -432,13 +487,14 @@ class CosmicExpressTheory:
         # No rail satisfies house -> house is not satisfied
         self.theory.add_constraint(
             logic.implication(
-                self.get_prop(name="house", coord=coord)
-                # If no rails satisfy the house
-                & logic.none_of(
-                    self._rail_satisfies_house_color(adjacent1, coord, c)
-                    for c in self.colors
-                    for adjacent1 in helpers.get_adjacent(coord)
-                    if self.grid_contains(adjacent1)
+                logic.conjoin(
+                    self.get_prop(name="house", coord=coord),
+                    # If no rails satisfy the house
+                    logic.none_of(
+                        self._rail_satisfies_house_color(adjacent1, coord, c)
+                        for c in self.colors
+                        for adjacent1 in self.neighbours.adjacent[coord]
+                    ),
                 ),
                 # then house is not satisfied
                 self.get_prop(name="house_satisfied", coord=coord).negate(),
@@ -465,63 +521,89 @@ class CosmicExpressTheory:
             )
         )
 
+    @helpers.simple_cache
     def _rail_satisfies_alien_color(self, rail_coord, alien_coord, color) -> Var:
-        return (
+        return logic.multi_and(
             # If coord is a rail,
-            self.get_prop(name="rail", coord=rail_coord)
+            self.get_prop(name="rail", coord=rail_coord),
             # and the train is empty
-            & logic.none_of(
+            logic.none_of(
                 self.get_props(
                     name="train_alien_before_color",
                     coord=rail_coord,
                 )
-            )
+            ),
             # and adjacent tile is an alien of given color
-            & self.get_prop(name="alien_color", descriptor=color, coord=alien_coord)
+            self.color_prop(name="alien_color", color=color, coord=alien_coord),
             # and the rail comes before any other rails adjacent to alien
             # TODO: only check empty adjacent rails
-            & logic.multi_and(
+            logic.multi_and(
                 logic.implication(
-                    self.get_prop(name="rail", coord=other_rail)
-                    & logic.none_of(
-                        self.get_props(
-                            name="train_alien_before_color", coord=other_rail
-                        )
+                    logic.conjoin(
+                        self.get_prop(name="rail", coord=other_rail),
+                        logic.none_of(
+                            self.get_props(
+                                name="train_alien_before_color", coord=other_rail
+                            )
+                        ),
                     ),
                     self.rail_comes_before(rail_coord, other_rail),
                 )
-                for other_rail in helpers.get_adjacent(alien_coord)
-                if rail_coord != other_rail and self.grid_contains(other_rail)
-            )
+                for other_rail in self.neighbours.adjacent[alien_coord]
+                if rail_coord != other_rail
+            ),
         )
 
+    @helpers.simple_cache
     def _rail_satisfies_house_color(self, rail_coord, house_coord, color) -> Var:
-        return (
+        return logic.multi_and(
             # If coord is a rail,
-            self.get_prop(name="rail", coord=rail_coord)
+            self.get_prop(name="rail", coord=rail_coord),
             # and the train has an alien of given color
-            & self.get_prop(
-                name="train_alien_before_color", descriptor=color, coord=rail_coord
-            )
+            self.color_prop(
+                name="train_alien_before_color", color=color, coord=rail_coord
+            ),
             # and adjacent tile is an house of given color
-            & self.get_prop(name="house_color", descriptor=color, coord=house_coord)
+            self.color_prop(name="house_color", color=color, coord=house_coord),
             # and the rail comes before any other rails adjacent to house
             # TODO: only check adjacent rails with color
-            & logic.multi_and(
+            logic.multi_and(
                 logic.implication(
-                    self.get_prop(name="rail", coord=other_rail)
-                    & self.get_prop(
-                        name="train_alien_before_color",
-                        descriptor=color,
-                        coord=other_rail,
+                    logic.conjoin(
+                        self.get_prop(name="rail", coord=other_rail),
+                        self.color_prop(
+                            name="train_alien_before_color",
+                            color=color,
+                            coord=other_rail,
+                        ),
                     ),
                     self.rail_comes_before(rail_coord, other_rail),
                 )
-                for other_rail in helpers.get_adjacent(house_coord)
-                if rail_coord != other_rail and self.grid_contains(other_rail)
-            )
+                for other_rail in self.neighbours.adjacent[house_coord]
+                if rail_coord != other_rail
+            ),
         )
 
+    def prime_order(self) -> None:
+        """Builds the rail_comes_before formulas that add_constraints uses, in the
+        order it first asks for them. rail_comes_before treats a pair it is
+        still working out as false, so its formulas depend on the order of the
+        calls, and a theory built in parts has to start from the same ones."""
+        if not self.num_colors:
+            return
+        for coord in helpers.all_coords(self.size):
+            adjacent = self.neighbours.adjacent[coord]
+            # As in _rail_satisfies_alien_color(coord, adjacent1, color)
+            for adjacent1 in adjacent:
+                for other_rail in self.neighbours.adjacent[adjacent1]:
+                    if other_rail != coord:
+                        self.rail_comes_before(coord, other_rail)
+            # As in _rail_satisfies_alien_color(adjacent1, coord, color)
+            for adjacent1 in adjacent:
+                for other_rail in adjacent:
+                    if other_rail != adjacent1:
+                        self.rail_comes_before(adjacent1, other_rail)
+
     @helpers.simple_cache
     def rail_comes_before(self, p1, p2) -> Var:
         """Returns a Var which is true iff the rail at p1
@@ -531,6 +613,8 @@ class CosmicExpressTheory:
             return false
         if not (self.grid_contains(p1) and self.grid_contains(p2)):
             return false
+        if self.lazy_order:
+            return self._order_prop(p1, p2)
 
         # adjacency check using taxicab distance
         if abs(p1[0] - p2[0]) + abs(p1[1] - p2[1]) == 1:
@@ -539,14 +623,22 @@ class CosmicExpressTheory:
             return self.get_prop(name="rail_output", descriptor=direction, coord=p1)
 
         parts = []
-        for p3 in helpers.get_adjacent(p2):
-            if self.grid_contains(p3):
-                parts.append(
-                    self.rail_comes_before(p1, p3) & self.rail_comes_before(p3, p2)
+        for p3 in self.neighbours.adjacent[p2]:
+            parts.append(
+                logic.conjoin(
+                    self.rail_comes_before(p1, p3), self.rail_comes_before(p3, p2)
                 )
-        a = logic.multi_or(parts)
-        b = a.simplify()
-        return b
+            )
+        # multi_or and conjoin already flatten and drop constants, which is all
+        # that simplify() would do here, and keep the result shared
+        return logic.multi_or(parts)
+
+    def _order_prop(self, p1, p2) -> Var:
+        if (p1, p2) not in self.order_props:
+            self.order_props[p1, p2] = Var(
+                f"rail_comes_before:({p1[0]},{p1[1]})({p2[0]},{p2[1]})"
+            )
+        return self.order_props[p1, p2]
 
     def _add_grid_prop_dict(self, name, descriptor=None):
         key = name
@@ -576,3 +668,60 @@ class CosmicExpressTheory:
             if not descriptor_dicts:
                 raise RuntimeError("no props found")
             return [d[coord] for d in descriptor_dicts]
+
+    def color_literals(self, *, coord, name, color) -> list[Var]:
+        """Returns the literals which together say that the color prop with the
+        given name is color at coord"""
+        if self.color_encoding == "onehot":
+            return [self.get_prop(name=name, descriptor=color, coord=coord)]
+        return _value_literals(self.get_props(name=name, coord=coord), color + 1)
+
+    def color_prop(self, *, coord, name, color) -> NNF:
+        """Like get_prop for a color prop, but works with either color encoding.
+        With the onehot encoding this is the prop itself."""
+        return logic.multi_and(self.color_literals(coord=coord, name=name, color=color))
+
+    def _some_color(self, coord, name) -> NNF:
+        props = self.get_props(name=name, coord=coord)
+        if self.color_encoding == "onehot":
+            return logic.one_of(props)
+        return logic.multi_or(props)
+
+    def _at_most_one_color(self, coord, name) -> NNF:
+        props = self.get_props(name=name, coord=coord)
+        if self.color_encoding == "onehot":
+            return logic.one_of_or_none(props)
+        # A binary number can only hold one value, but values past the last
+        # color don't stand for anything
+        return logic.multi_and(
+            logic.negate(logic.multi_and(_value_literals(props, value)))
+            for value in range(self.num_colors + 1, 2 ** len(props))
+        )
+
+
+def _value_literals(bits: list[Var], value: int) -> list[Var]:
+    """Returns the literals setting bits to the binary digits of value"""
+    return [
+        bit if value >> i & 1 else logic.negate(bit) for i, bit in enumerate(bits)
+    ]
+
+
+_BIT_NAME = re.compile(r"^(.*)_bit(\d+):(.*)$")
+
+
+def decode_colors(model: dict, num_colors: int) -> dict:
+    """Returns a model of a theory built with the "log" color encoding with its
+    color bits replaced by the props the "onehot" encoding would have"""
+    decoded = dict()
+    values = dict()
+    for name, value in model.items():
+        match = _BIT_NAME.match(name) if isinstance(name, str) else None
+        if match is None:
+            decoded[name] = value
+            continue
+        key = match[1], match[3]
+        values[key] = values.get(key, 0) | (bool(value) << int(match[2]))
+    for (name, coord), value in values.items():
+        for c in range(num_colors):
+            decoded[f"{name}_{c}:{coord}"] = value == c + 1
+    return decoded
@@ -1,5 +1,3 @@
-import xml.etree.ElementTree as ET
-
 Coord = tuple[int, int]
 Color = int
 Directions = tuple[str, str]
@@ -17,6 +15,8 @@ def export_xml(
     rails: list[tuple[Directions, Coord]],
 ) -> str:
     """Returns an xml representation of the grid"""
+    # Imported here so that importing this module for its types stays cheap
+    import xml.etree.ElementTree as ET
 
     if len(entrances) != 1:
         raise ValueError("there must be exactly one entrance")
@@ -54,6 +54,8 @@ def export_xml(
 
 
 def import_xml(xml: str):
+    import xml.etree.ElementTree as ET
+
     board = ET.fromstring(xml)
     rows = board.get("rows")
     cols = board.get("cols")
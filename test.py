@@ -1,11 +1,12 @@
 
-import os, sys
+import os, subprocess, sys
 
 from run import example_theory
 
 USAGE = '\n\tpython3 test.py [draft|final]\n'
 EXPECTED_VAR_MIN = 10
 EXPECTED_CONS_MIN = 50
+HEAVY_MODULES = ['nnf', 'pysat', 'numpy', 'PIL', 'xml.etree.ElementTree']
 
 def test_theory():
     T = example_theory()
@@ -15,6 +16,276 @@ def test_theory():
     assert not T.valid(), "Theory is valid (every assignment is a solution). Something is likely wrong with the constraints."
     assert not T.negate().valid(), "Theory is inconsistent (no solutions exist). Something is likely wrong with the constraints."
 
+def import_times(*args):
+    """Returns the time in microseconds spent importing each module while running python with args"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', *args], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_time, _, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(self_time)
+    return times
+
+def test_cli_import_time():
+    times = import_times('run.py', '--help')
+
+    heavy = [m for m in HEAVY_MODULES if m in times]
+    assert not heavy, "run.py --help imports %s, which should only be loaded when solving." % ', '.join(heavy)
+    # Measured against importing nnf on the same machine, so slow runners don't fail it
+    startup = sum(import_times('-c', 'pass').values())
+    cli = sum(times.values()) - startup
+    nnf = sum(import_times('-c', 'import nnf').values()) - startup
+    assert cli < nnf, "run.py --help spends %.1fms importing modules, more than the %.1fms of importing nnf alone." % (cli / 1000, nnf / 1000)
+
+def variants(data):
+    """Yields every rotation and reflection of a board, with its colors swapped in every other one"""
+    from src.canonical import SYMMETRIES, Transform, transform_data
+
+    for i, matrix in enumerate(SYMMETRIES):
+        variant = transform_data(data, Transform(matrix, (data['rows'], data['cols'])))
+        if i % 2:
+            swap = lambda things: [(data['colors'] - 1 - color, coord) for color, coord in things]
+            variant = dict(variant, aliens=swap(variant['aliens']), houses=swap(variant['houses']))
+        yield variant
+
+def test_canonical_round_trip():
+    from nnf import And
+    from src.canonical import canonicalize, restore_model
+    from src.file_reader import read_data
+    from src.xml_parser import import_xml
+
+    # A square board with two colors and a rectangular one
+    for path in ['data/xml/test5.xml', 'data/xml/example_long.xml']:
+        with open(path) as f:
+            data = import_xml(f.read())
+        canonical = canonicalize(data)
+        model = read_data(canonical.data).solve()
+        model = {name: value for name, value in model.items() if isinstance(name, str)}
+        for variant in variants(data):
+            variant_canonical = canonicalize(variant)
+            assert variant_canonical.key == canonical.key, "%s has a symmetric variant with another canonical key." % path
+            encoding = read_data(variant)
+            assert encoding.is_satisfiable() and encoding.count_solutions() == 1, "A symmetric variant of %s has other solutions." % path
+            restored = restore_model(model, variant_canonical)
+            assert And(encoding.constraints).condition(restored).satisfiable(), "A solution of %s doesn't map back onto its symmetric variant." % path
+
+def test_result_cache_symmetric_hit(tmp_path, monkeypatch):
+    import src.file_reader
+    from nnf import And
+    from src.result_cache import ResultCache, solve_cached
+    from src.xml_parser import import_xml
+
+    with open('data/xml/example_long.xml') as f:
+        data = import_xml(f.read())
+    rotated = list(variants(data))[1]
+    with ResultCache(str(tmp_path / 'cache.db')) as cache:
+        assert solve_cached(data, cache)[:2] == (True, 1)
+        encoding = src.file_reader.read_data(rotated)
+
+        def no_solving(*args, **kwargs):
+            raise AssertionError("A rotated board wasn't answered from the cache.")
+
+        monkeypatch.setattr(src.file_reader, 'read_data', no_solving)
+        result = solve_cached(rotated, cache)
+    assert result[:2] == (True, 1)
+    assert And(encoding.constraints).condition(result.model).satisfiable(), "The cached solution doesn't solve the rotated board."
+
+def board_layouts(cnf, assumptions, limit):
+    """Returns up to limit track layouts solving a board, each as the names of its rail variables that are true"""
+    from src.lib204 import distinct_models, layout_ids
+
+    ids = layout_ids(cnf)
+    with cnf.solver() as solver:
+        models = distinct_models(solver, cnf, assumptions, ids, limit)
+    return {frozenset(cnf.names[i] for i in ids if model[i - 1] > 0) for model in models}
+
+def has_layout(cnf, assumptions, layout):
+    from src.lib204 import layout_ids
+
+    rails = [i if cnf.names[i] in layout else -i for i in layout_ids(cnf)]
+    with cnf.solver() as solver:
+        return solver.solve(assumptions=assumptions + rails)
+
+def test_banded_build_matches_serial():
+    from src.file_reader import tile_facts
+    from src.parallel_build import build_cnf
+    from src.theory import CosmicExpressTheory
+    from src.xml_parser import import_xml
+
+    limit = 20
+    theory_wrapper = CosmicExpressTheory((5, 5), 2, coords=())
+    serial = build_cnf((5, 5), 2, workers=1)
+    for bands in [2, 3]:
+        banded = build_cnf((5, 5), 2, workers=1, bands=bands)
+        for path in ['data/xml/test.xml', 'data/xml/test5.xml']:
+            with open(path) as f:
+                data = import_xml(f.read())
+            for allow_new_rails in [False, True]:
+                facts = [lit for lits in tile_facts(theory_wrapper, data, allow_new_rails).values() for lit in lits]
+                assumptions = {cnf: [cnf.literal(lit) for lit in facts] for cnf in (serial, banded)}
+                layouts = {cnf: board_layouts(cnf, assumptions[cnf], limit) for cnf in (serial, banded)}
+                assert len(layouts[serial]) == len(layouts[banded]), "%d bands find another number of layouts for %s." % (bands, path)
+                if len(layouts[serial]) < limit:
+                    assert layouts[serial] == layouts[banded], "%d bands find other layouts for %s." % (bands, path)
+                else:
+                    # Too many to list, so each build must accept the other's layouts
+                    for cnf, other in [(serial, banded), (banded, serial)]:
+                        for layout in layouts[other]:
+                            assert has_layout(cnf, assumptions[cnf], layout), "%d bands disagree with the serial build on a layout for %s." % (bands, path)
+
+def test_streaming_matches_kept():
+    import pytest
+    from nnf import And
+    from src.file_reader import read_data
+    from src.xml_parser import import_xml
+
+    # test5.xml is solvable and test.xml isn't without new rails
+    for path, satisfiable in [('data/xml/test5.xml', True), ('data/xml/test.xml', False)]:
+        with open(path) as f:
+            data = import_xml(f.read())
+        kept = read_data(data)
+        streaming = read_data(data, streaming=True)
+        try:
+            assert kept.is_satisfiable() == satisfiable, "The kept encoding of %s is wrong about its satisfiability." % path
+            assert streaming.is_satisfiable() == satisfiable, "The streaming encoding of %s is wrong about its satisfiability." % path
+            model = streaming.solve()
+            if satisfiable:
+                model = {name: value for name, value in model.items() if isinstance(name, str)}
+                assert And(kept.constraints).condition(model).satisfiable(), "The streaming solution of %s doesn't solve the kept encoding." % path
+                assert kept.solve_limited().model is not None, "cnf() of %s has no solution." % path
+            else:
+                assert model is None, "The streaming encoding of %s has a solution." % path
+                assert kept.solve_limited().model is None, "cnf() of %s has a solution." % path
+            with pytest.raises(RuntimeError):
+                streaming.count_solutions()
+            with pytest.raises(RuntimeError):
+                streaming.cnf()
+        finally:
+            streaming.close()
+
+def test_streaming_forgets_formulas():
+    import gc
+    from nnf import And, Or
+    from src.file_reader import read_data
+    from src.xml_parser import import_xml
+
+    def formulas():
+        gc.collect()
+        return sum(isinstance(o, (And, Or)) for o in gc.get_objects())
+
+    with open('data/xml/test5.xml') as f:
+        data = import_xml(f.read())
+    before = formulas()
+    streaming = read_data(data, True, streaming=True)
+    try:
+        cnf = streaming._cnf
+        assert not cnf.clauses and not cnf._memo, "A streaming encoding kept %d clauses and %d formulas." % (len(cnf.clauses), len(cnf._memo))
+        assert formulas() - before < 100, "A streaming encoding keeps %d formula nodes alive." % (formulas() - before)
+        # Warm starts still work from the definitions kept in place of the formulas
+        model = streaming.solve()
+        assert len(cnf.phases(model)) == cnf.num_vars, "The phases of a streaming encoding don't cover every variable."
+        assert streaming.solve(hint=model) is not None, "A streaming encoding can't be solved from a hint."
+    finally:
+        streaming.close()
+
+def test_approx_count_retries_empty_cells(monkeypatch):
+    import pytest
+    from src import approxmc
+    from src.cnf import CNF
+
+    # Ten free variables, so 1024 models
+    cnf = CNF()
+    for i in range(10):
+        cnf.id('x%d' % i)
+    projection = list(range(1, 11))
+    rounds = approxmc.iterations(0.2)
+    estimate = approxmc._Counter.estimate
+    calls = []
+
+    def every_other_empty(counter):
+        calls.append(len(calls) % 2 == 0)
+        return estimate(counter) if calls[-1] else None
+
+    monkeypatch.setattr(approxmc._Counter, 'estimate', every_other_empty)
+    result = approxmc.approx_count(cnf, projection, 0.8, 0.2, workers=1, seed=1)
+    assert sum(calls) == rounds, "The median was taken over %d estimates instead of %d." % (sum(calls), rounds)
+    assert 1024 / 1.8 <= result.count <= 1024 * 1.8, "The estimate %d is too far from 1024." % result.count
+
+    monkeypatch.setattr(approxmc._Counter, 'estimate', lambda counter: None)
+    with pytest.raises(RuntimeError):
+        approxmc.approx_count(cnf, projection, 0.8, 0.2, workers=1, seed=1)
+
+STUB_SOLVER ='''#!%s
+import sys
+from pysat.formula import CNF
+from pysat.solvers import Solver
+
+with Solver(bootstrap_with=CNF(from_file=sys.argv[-1]).clauses) as solver:
+    if solver.solve():
+        print('s SATISFIABLE')
+        print('v', *solver.get_model(), 0)
+    else:
+        print('s UNSATISFIABLE')
+'''
+
+def test_external_solver(tmp_path):
+    from nnf import And
+    from src.external import run_solver
+    from src.file_reader import read_data
+    from src.lib204 import SAT, UNSAT
+    from src.xml_parser import import_xml
+
+    # A stand in for a solver binary that prints SAT competition output
+    stub = tmp_path / 'solver'
+    stub.write_text(STUB_SOLVER % sys.executable)
+    stub.chmod(0o755)
+
+    for path, status in [('data/xml/test5.xml', SAT), ('data/xml/test.xml', UNSAT)]:
+        with open(path) as f:
+            encoding = read_data(import_xml(f.read()))
+        result = run_solver(encoding, str(stub))
+        assert result.status == status, "The solver's status for %s was read as %s." % (path, result.status)
+        if status == SAT:
+            model = {name: value for name, value in result.model.items() if isinstance(name, str)}
+            assert And(encoding.constraints).condition(model).satisfiable(), "The solver's model for %s doesn't solve it." % path
+        else:
+            assert result.model is None, "An unsatisfiable board got a model from %s." % path
+
+    output = subprocess.run([sys.executable, 'run.py', 'data/xml/small.xml', '--solver', str(stub)], capture_output=True,
+                            text=True, cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout
+    assert 'Status: SAT' in output, "run.py --solver didn't print the solver's status."
+    assert "'rail_input_W:(1,1)': True" in output, "run.py --solver didn't print the solver's solution."
+
+def test_simulate_layouts():
+    from src.board import NO_COLOR
+    from src.file_reader import read_data
+    from src.simulate import simulate, stack_layouts
+
+    # A red alien above the second tile of the middle row and its house above the fourth
+    board = {'rows': 4, 'cols': 5, 'colors': 2, 'entrances': [(0, 1)], 'exits': [(4, 1)],
+             'aliens': [(0, (1, 0))], 'houses': [(0, (3, 0))], 'obstacles': [], 'rails': []}
+    straight = {(x, 1): ('W', 'E') for x in range(1, 4)}
+    broken = {**straight, (2, 1): ('N', 'E')}
+    loop = {**straight, (1, 2): ('S', 'E'), (2, 2): ('W', 'S'), (2, 3): ('N', 'W'), (1, 3): ('E', 'N')}
+
+    result = simulate(board, *stack_layouts([straight, broken, loop], (4, 5)), True)
+    assert result.valid.tolist() == [True, False, False], "simulate got the wrong layouts valid: %s." % result.valid.tolist()
+    assert result.length.tolist() == [3, 1, 3], "The trains passed the wrong number of rails: %s." % result.length.tolist()
+    assert result.after[0, :, 1].tolist() == [NO_COLOR, 0, 0, NO_COLOR, NO_COLOR], "The train carried the alien over the wrong rails."
+    assert result.aliens[0].all() and result.houses[0].all(), "The straight layout didn't deliver the alien."
+    assert not result.houses[1].any(), "The train went past a broken rail."
+    assert result.aliens[2].all() and result.houses[2].all() and not result.visited[2, 1, 2], "The train of the loop layout didn't just follow the straight path."
+    for layout, satisfiable in [(straight, True), (broken, False)]:
+        rails = [(directions, coord) for coord, directions in layout.items()]
+        assert read_data(dict(board, rails=rails)).is_satisfiable() == satisfiable, "The theory disagrees with simulate on a layout."
+
+    # A blue alien below the same rail as the red one can't board the same carriage
+    two_colors = dict(board, aliens=[(0, (1, 0)), (1, (1, 2))], houses=[(0, (3, 0)), (1, (3, 2))])
+    result = simulate(two_colors, *stack_layouts([straight], (4, 5)), True)
+    assert not result.valid[0] and not result.aliens.any(), "Two aliens of different colors boarded one carriage."
+
 def file_checks(stage):
     proofs_jp = os.path.isfile(os.path.join('.','documents',stage,'proofs.jp'))
     modelling_report_docx = os.path.isfile(os.path.join('.','documents',stage,'modelling_report.docx'))